@@ -0,0 +1,224 @@
+# coding: utf-8
+"""
+Benchmarks of add field backfill and index build against local postgres.
+
+Generates table with given number of rows, adds field with default to it
+with zero downtime schema editor and builds index on it, then prints one
+json object per table size: rows per second, batch latency percentiles,
+WAL bytes written, table size and dead tuples after update, index build time.
+
+    PGHOST=localhost PGUSER=postgres python benchmarks/backfill.py --rows 1000000 --rows 10000000 \\
+        --setting BACKFILL_MODE=pk_range --output results.jsonl
+
+Connection is taken from usual PG* environment variables. Every line of
+output carries commit and settings, so runs can be compared across commits
+(schema editor may print its own messages too, so use --output for clean results).
+Batch latency is the whole batch transaction including commit, batches
+of parallel workers (BACKFILL_WORKERS) are counted too.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+settings.configure(
+    DATABASES={
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.environ.get('PGDATABASE', 'postgres'),
+            'USER': os.environ.get('PGUSER', 'postgres'),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', 'localhost'),
+            'PORT': os.environ.get('PGPORT', '5432'),
+        },
+    },
+    INSTALLED_APPS=[],
+)
+django.setup()
+
+from django.db import connection, models  # noqa: E402
+
+from zero_downtime_migrations.backend.batching import monotonic  # noqa: E402
+from zero_downtime_migrations.backend.conf import SETTINGS_PREFIX  # noqa: E402
+from zero_downtime_migrations.backend.metrics import BatchEvent, MetricsSink  # noqa: E402
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor  # noqa: E402
+
+SQL_CREATE_TABLE = ("CREATE TABLE %(table)s ("
+                    "id bigserial PRIMARY KEY, "
+                    "name varchar(250) NOT NULL, "
+                    "amount numeric(12, 2) NOT NULL, "
+                    "created timestamp with time zone NOT NULL, "
+                    "payload text NOT NULL)")
+# about `row_width` bytes per row, payload is not compressible enough to be toasted
+SQL_FILL_TABLE = ("INSERT INTO %(table)s (name, amount, created, payload) "
+                  "SELECT 'name ' || i, (i %% 100000) / 100.0, now() - i * interval '1 second', "
+                  "substr(repeat(md5(i::text), %(repeat)s), 1, %(payload_width)s) "
+                  "FROM generate_series(%(start)s, %(end)s) AS i")
+SQL_WAL_LSN = "SELECT pg_current_wal_lsn()"
+SQL_WAL_BYTES = "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)::BIGINT"
+SQL_TABLE_STATS = ("SELECT pg_relation_size(%s), pg_total_relation_size(%s), "
+                   "COALESCE((SELECT n_dead_tup FROM pg_stat_user_tables WHERE relname = %s), 0)")
+FILL_CHUNK = 1000000
+
+
+class BatchRecorder(MetricsSink):
+    """
+    Remembers how long every batch took, whole batch transaction
+    including its commit. Sinks are shared by parallel workers,
+    so batches of all of them are here
+    """
+    def __init__(self):
+        self.durations = []
+
+    def emit(self, event):
+        if isinstance(event, BatchEvent):
+            self.durations.append(event.duration)
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def query(sql, params=None):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if cursor.description:
+            return cursor.fetchone()
+
+
+def create_table(table, rows, row_width):
+    payload_width = max(row_width - 60, 1)
+    query('DROP TABLE IF EXISTS {}'.format(table))
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_CREATE_TABLE % {'table': table})
+        for start in range(1, rows + 1, FILL_CHUNK):
+            cursor.execute(SQL_FILL_TABLE % {
+                'table': table,
+                'repeat': payload_width // 32 + 1,
+                'payload_width': payload_width,
+                'start': start,
+                'end': min(start + FILL_CHUNK - 1, rows),
+            })
+        cursor.execute('VACUUM ANALYZE {}'.format(table))
+
+
+def make_model(table):
+    class Meta:
+        app_label = 'benchmarks'
+        db_table = table
+        managed = False
+    return type(str('Bench{}'.format(table)), (models.Model,), {
+        '__module__': __name__,
+        'Meta': Meta,
+        'name': models.CharField(max_length=250),
+    })
+
+
+def table_stats(table):
+    query('SELECT pg_stat_clear_snapshot()')
+    size, total_size, dead_tuples = query(SQL_TABLE_STATS, [table, table, table])
+    return {'table_bytes': size, 'total_bytes': total_size, 'dead_tuples': dead_tuples}
+
+
+def run(rows, row_width, keep, sinks=()):
+    table = 'zdm_bench_{}'.format(rows)
+    create_table(table, rows, row_width)
+    model = make_model(table)
+    result = {'rows': rows, 'row_width': row_width, 'before': table_stats(table)}
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name('flag')
+    recorder = BatchRecorder()
+    setattr(settings, SETTINGS_PREFIX + 'METRICS', [recorder] + list(sinks))
+    wal_lsn = query(SQL_WAL_LSN)[0]
+    started = monotonic()
+    with DatabaseSchemaEditor(connection=connection) as editor:
+        editor.add_field(model, field)
+    duration = monotonic() - started
+    durations = recorder.durations
+    result['add_field'] = {
+        'seconds': duration,
+        'rows_per_second': rows / duration if duration else None,
+        'batches': len(durations),
+        'batch_p50': percentile(durations, 50),
+        'batch_p95': percentile(durations, 95),
+        'batch_p99': percentile(durations, 99),
+        'batch_max': max(durations) if durations else None,
+        'wal_bytes': query(SQL_WAL_BYTES, [wal_lsn])[0],
+    }
+    result['after'] = table_stats(table)
+
+    started = monotonic()
+    with DatabaseSchemaEditor(connection=connection) as editor:
+        editor.execute('CREATE INDEX {0}_name ON {0} (name)'.format(table))
+    result['create_index'] = {'seconds': monotonic() - started}
+
+    if not keep:
+        query('DROP TABLE {}'.format(table))
+    return result
+
+
+def parse_setting(value):
+    name, _, raw = value.partition('=')
+    try:
+        return name, json.loads(raw)
+    except ValueError:
+        return name, raw
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, action='append',
+                        help='rows in generated table, may be repeated (default 1000000 and 10000000)')
+    parser.add_argument('--row-width', type=int, default=200, help='approximate row width in bytes')
+    parser.add_argument('--setting', action='append', default=[],
+                        help='NAME=VALUE of ZERO_DOWNTIME_MIGRATIONS_ setting (value is parsed as json if it can be)')
+    parser.add_argument('--output', help='append results to this file instead of stdout')
+    parser.add_argument('--keep', action='store_true', help='do not drop generated tables')
+    args = parser.parse_args()
+
+    bench_settings = dict(parse_setting(value) for value in args.setting)
+    for name, value in bench_settings.items():
+        setattr(settings, SETTINGS_PREFIX + name, value)
+    # batches are timed by metrics sink added to the ones from settings
+    sinks = bench_settings.get('METRICS') or []
+    if not isinstance(sinks, (list, tuple)):
+        sinks = [sinks]
+    meta = {
+        'commit': commit(),
+        'settings': bench_settings,
+        'server_version': connection.pg_version,
+        'django': django.get_version(),
+    }
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        for rows in args.rows or [1000000, 10000000]:
+            result = dict(meta, **run(rows, args.row_width, args.keep, sinks))
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'test_app',
+    'zero_downtime_migrations',
 ]
 
 MIDDLEWARE = [
@@ -3,6 +3,7 @@
 from __future__ import unicode_literals
 
 import pytest
+from django.db import connections
 
 from test_app.models import TestModel
 
@@ -20,3 +21,26 @@ def test_object_two():
 @pytest.fixture
 def test_object_three():
     return TestModel.objects.create(name='some different name')
+
+
+@pytest.fixture
+def empty_table(db):
+    """
+    Test table without rows and pages, rows inserted by
+    previous tests and rolled back still take its pages
+    """
+    with connections['default'].cursor() as cursor:
+        cursor.execute('TRUNCATE "test_app_testmodel"')
+
+
+@pytest.fixture
+def added_columns():
+    """
+    Names of columns added to test model by the test, dropped with
+    their indexes and constraints after it
+    """
+    columns = []
+    yield columns
+    with connections['default'].cursor() as cursor:
+        for column in columns:
+            cursor.execute('ALTER TABLE "test_app_testmodel" DROP COLUMN IF EXISTS "{}" CASCADE'.format(column))
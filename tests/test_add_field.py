@@ -43,7 +43,8 @@ def test_sqlmigrate_add_field_working():
             "SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns where table_name = 'test_app_testmodel' and column_name = 'bool_field';",
             'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL;',
             'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true;',
-            "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
+            ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+             "FROM pg_class WHERE relname = 'test_app_testmodel';"),
             ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  bool_field is null LIMIT  1000 )"
              " UPDATE test_app_testmodel table_ SET bool_field = true FROM   cte WHERE  table_.id = cte.pk;"),
             'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL;',
@@ -51,7 +52,7 @@ def test_sqlmigrate_add_field_working():
         ]
 
 
-def test_add_bool_field_no_existed_objects_success():
+def test_add_bool_field_no_existed_objects_success(empty_table):
     columns = column_classes(TestModel)
     assert "bool_field" not in columns
 
@@ -68,8 +69,8 @@ def test_add_bool_field_no_existed_objects_success():
                          "table_name = 'test_app_testmodel' and column_name = 'bool_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT',
                         ]
@@ -93,8 +94,9 @@ def test_add_bool_field_with_existed_object_success(test_object):
                          "table_name = 'test_app_testmodel' and column_name = 'bool_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                        'SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);',
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  bool_field is null LIMIT  1000 )"
                          " UPDATE test_app_testmodel table_ SET bool_field = true FROM   cte WHERE  table_.id = cte.pk"),
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  bool_field is null LIMIT  1000 )"
@@ -127,8 +129,9 @@ def test_add_bool_field_with_existed_many_objects_success(test_object, test_obje
                          "table_name = 'test_app_testmodel' and column_name = 'bool_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                        'SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);',
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  bool_field is null LIMIT  1000 )"
                          " UPDATE test_app_testmodel table_ SET bool_field = true FROM   cte WHERE  table_.id = cte.pk"),
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  bool_field is null LIMIT  1000 )"
@@ -148,7 +151,7 @@ def test_add_bool_field_with_existed_many_objects_success(test_object, test_obje
 
 
 @freeze_time("2017-12-15 03:21:34", tz_offset=-3)
-def test_add_datetime_field_no_existed_objects_success():
+def test_add_datetime_field_no_existed_objects_success(empty_table):
     columns = column_classes(TestModel)
     assert "datetime_field" not in columns
 
@@ -166,8 +169,8 @@ def test_add_datetime_field_no_existed_objects_success():
                          "= 'test_app_testmodel' and column_name = 'datetime_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "datetime_field" timestamp with time zone NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" SET DEFAULT \'2017-12-15T00:21:34+00:00\'::timestamptz',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" SET NOT NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" DROP DEFAULT',
                         ]
@@ -192,8 +195,9 @@ def test_add_datetime_field_with_existed_object_success(test_object):
                          "table_name = 'test_app_testmodel' and column_name = 'datetime_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "datetime_field" timestamp with time zone NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" SET DEFAULT \'2017-12-15T00:21:34+00:00\'::timestamptz',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                        'SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);',
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000 ) "
                          "UPDATE test_app_testmodel table_ SET datetime_field = \'2017-12-15T00:21:34+00:00\'::timestamptz FROM   cte WHERE  table_.id = cte.pk"),
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000"
@@ -228,8 +232,9 @@ def test_add_datetime_field_with_auto_now_add_existed_object_success(test_object
                          "table_name = 'test_app_testmodel' and column_name = 'datetime_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "datetime_field" timestamp with time zone NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" SET DEFAULT \'2017-12-15T03:21:34+00:00\'::timestamptz',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                        'SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);',
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000 ) "
                          "UPDATE test_app_testmodel table_ SET datetime_field = \'2017-12-15T03:21:34+00:00\'::timestamptz FROM   cte WHERE  table_.id = cte.pk"),
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000"
@@ -263,8 +268,9 @@ def test_add_datetime_field_with_auto_now_existed_object_success(test_object):
                              "table_name = 'test_app_testmodel' and column_name = 'datetime_field';"),
                             'ALTER TABLE "test_app_testmodel" ADD COLUMN "datetime_field" timestamp with time zone NULL',
                             'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" SET DEFAULT \'2017-12-15T03:21:34+00:00\'::timestamptz',
-                            "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                            'SELECT COUNT(*) FROM test_app_testmodel;',
+                            ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                             "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                            'SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);',
                             ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000 ) "
                              "UPDATE test_app_testmodel table_ SET datetime_field = \'2017-12-15T03:21:34+00:00\'::timestamptz FROM   cte WHERE  table_.id = cte.pk"),
                             ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000"
@@ -297,8 +303,9 @@ def test_add_datetime_field_with_existed_many_objects_success(test_object, test_
                          "table_name = 'test_app_testmodel' and column_name = 'datetime_field';"),
                         'ALTER TABLE "test_app_testmodel" ADD COLUMN "datetime_field" timestamp with time zone NULL',
                         'ALTER TABLE "test_app_testmodel" ALTER COLUMN "datetime_field" SET DEFAULT \'2017-12-15T00:21:34+00:00\'::timestamptz',
-                        "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                        'SELECT COUNT(*) FROM test_app_testmodel;',
+                        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                        'SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);',
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000 ) "
                          "UPDATE test_app_testmodel table_ SET datetime_field = \'2017-12-15T00:21:34+00:00\'::timestamptz FROM   cte WHERE  table_.id = cte.pk"),
                         ("WITH cte AS ( SELECT id as pk FROM test_app_testmodel WHERE  datetime_field is null LIMIT  1000 ) UPDATE test_app_testmodel table_ "
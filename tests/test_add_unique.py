@@ -11,6 +11,7 @@ from django.db import models
 from django.db import connections
 from django.test.utils import CaptureQueriesContext
 
+from zero_downtime_migrations.backend.exceptions import DuplicateValuesError
 from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
 from test_app.models import TestModel
 
@@ -59,3 +60,65 @@ def test_add_unique_correct_result():
     TestModel.objects.create(name='smth')
     with pytest.raises(django.db.utils.IntegrityError):
         TestModel.objects.create(name='test')
+
+
+def test_unique_index_parts():
+    editor = schema_editor(connection=connection)
+    assert editor._unique_index_parts(
+        'CREATE UNIQUE INDEX CONCURRENTLY "t_a_b_uniq" ON "t" ("a", lower("b")) WHERE ("a" > 0)'
+    ) == ('"t"', '"a", lower("b")', '("a" > 0)')
+    assert editor._unique_index_parts(
+        'CREATE UNIQUE INDEX CONCURRENTLY "t_a" ON "t" USING btree ("a")'
+    ) == ('"t"', '"a"', None)
+    assert editor._unique_index_parts('CREATE INDEX "t_a" ON "t" ("a")') is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode', ['sample', 'full'])
+def test_unique_precheck_finds_duplicates(settings, mode):
+    settings.ZERO_DOWNTIME_MIGRATIONS_UNIQUE_PRECHECK = mode
+    settings.ZERO_DOWNTIME_MIGRATIONS_UNIQUE_PRECHECK_SAMPLE_PERCENT = 100
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE zdm_duplicates (id serial PRIMARY KEY, value integer)')
+        cursor.execute('INSERT INTO zdm_duplicates (value) SELECT i FROM generate_series(1, 100) AS i')
+        cursor.execute('INSERT INTO zdm_duplicates (value) VALUES (NULL), (NULL), (7)')
+    with CaptureQueriesContext(connection) as ctx:
+        editor = schema_editor(connection=connection)
+        with pytest.raises(DuplicateValuesError) as error:
+            editor.execute('CREATE UNIQUE INDEX "zdm_duplicates_value" ON "zdm_duplicates" ("value")')
+    assert not [query for query in ctx.captured_queries if query['sql'].startswith('CREATE')]
+    assert 'Duplicates (values, count): (7, 2).' in str(error.value)
+
+
+@pytest.mark.django_db
+def test_unique_precheck_skips_nulls_and_predicate(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_UNIQUE_PRECHECK = 'full'
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE zdm_duplicates (id serial PRIMARY KEY, value integer)')
+        cursor.execute('INSERT INTO zdm_duplicates (value) VALUES (NULL), (NULL), (1), (-1), (-1)')
+    editor = schema_editor(connection=connection)
+    editor.check_unique_duplicates(
+        'CREATE UNIQUE INDEX "zdm_duplicates_value" ON "zdm_duplicates" ("value") WHERE ("value" > 0)'
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unique_precheck_runs_outside_migration_transaction(settings, monkeypatch):
+    settings.ZERO_DOWNTIME_MIGRATIONS_UNIQUE_PRECHECK = 'full'
+    in_atomic_block = []
+    check_unique_duplicates = schema_editor.check_unique_duplicates
+
+    def check(editor, sql):
+        in_atomic_block.append(editor.connection.in_atomic_block)
+        return check_unique_duplicates(editor, sql)
+
+    monkeypatch.setattr(schema_editor, 'check_unique_duplicates', check)
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE zdm_duplicates (id serial PRIMARY KEY, value integer)')
+    try:
+        with schema_editor(connection=connection) as editor:
+            editor.execute('CREATE UNIQUE INDEX "zdm_duplicates_value" ON "zdm_duplicates" ("value")')
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE zdm_duplicates')
+    assert in_atomic_block == [False]
@@ -0,0 +1,194 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import django
+import pytest
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.exceptions import TypeCastError
+from zero_downtime_migrations.backend.journal import Journal
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def make_fields(old_field, new_field):
+    old_field.set_attributes_from_name("name")
+    new_field.set_attributes_from_name("name")
+    return old_field, new_field
+
+
+def column_type():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT data_type, character_maximum_length FROM information_schema.columns "
+                       "WHERE table_name = 'test_app_testmodel' AND column_name = 'name'")
+        return cursor.fetchone()
+
+
+def test_shadow_index_sql():
+    editor = schema_editor(connection=connection)
+    definition = ('CREATE UNIQUE INDEX test_app_testmodel_name_key ON public.test_app_testmodel '
+                  'USING btree (name, upper(name)) WHERE (name IS NOT NULL)')
+    assert editor._shadow_index_sql(definition, 'test_app_testmodel', 'name', 'name_zdm_new', 'index_new') == (
+        'CREATE UNIQUE INDEX CONCURRENTLY "index_new" ON "test_app_testmodel" '
+        'USING btree ("name_zdm_new", upper("name_zdm_new")) WHERE ("name_zdm_new" IS NOT NULL)'
+    )
+
+
+@pytest.mark.django_db
+def test_type_change_is_online_only_if_enabled(settings):
+    editor = schema_editor(connection=connection)
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.CharField(max_length=100))
+    assert not editor._online_type_change_supported(TestModel, old_field, new_field)
+    settings.ZERO_DOWNTIME_MIGRATIONS_ALTER_TYPE_ONLINE = True
+    assert editor._online_type_change_supported(TestModel, old_field, new_field)
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.CharField(max_length=250, null=True))
+    assert not editor._online_type_change_supported(TestModel, old_field, new_field)
+
+
+@pytest.mark.parametrize('old_type, new_type, rewrites', [
+    ('varchar(50)', 'varchar(100)', False),
+    ('varchar(100)', 'varchar(50)', True),
+    ('varchar(100)', 'text', False),
+    ('text', 'varchar(100)', True),
+    ('numeric(10, 2)', 'numeric(12, 2)', False),
+    ('numeric(10, 2)', 'numeric(12, 3)', True),
+    ('numeric(10, 2)', 'numeric', False),
+    ('integer', 'bigint', True),
+])
+@pytest.mark.django_db
+def test_type_change_rewrites(old_type, new_type, rewrites):
+    editor = schema_editor(connection=connection)
+    assert editor._type_change_rewrites(old_type, new_type) == rewrites
+
+
+@pytest.mark.django_db(transaction=True)
+def test_alter_column_type_online(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_ALTER_TYPE_ONLINE = True
+    TestModel.objects.all().delete()
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(1500)])
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.CharField(max_length=100))
+
+    with CaptureQueriesContext(connection) as ctx:
+        with schema_editor(connection=connection) as editor:
+            editor.alter_field(TestModel, old_field, new_field)
+    queries = [query['sql'] for query in ctx.captured_queries]
+    assert 'ALTER TABLE "test_app_testmodel" ADD COLUMN "name_zdm_new" varchar(100) NULL;' in queries
+    assert ('CREATE TRIGGER "test_app_testmodel_name_zdm_sync" BEFORE INSERT OR UPDATE ON "test_app_testmodel" '
+            'FOR EACH ROW EXECUTE PROCEDURE "test_app_testmodel_name_zdm_sync"();') in queries
+    assert len([sql for sql in queries if sql.startswith('UPDATE test_app_testmodel SET "name_zdm_new"')]) == 2
+    swap = queries[queries.index('LOCK TABLE "test_app_testmodel" IN ACCESS EXCLUSIVE MODE;'):]
+    assert swap[1:3] == [
+        'DROP TRIGGER IF EXISTS "test_app_testmodel_name_zdm_sync" ON "test_app_testmodel";',
+        'ALTER TABLE "test_app_testmodel" DROP COLUMN "name";',
+    ]
+    assert column_type() == ('character varying', 100)
+    assert TestModel.objects.filter(name='1499').exists()
+    assert not TestModel.objects.filter(name__isnull=True).exists()
+
+    # growing length back does not rewrite the table, so it is changed as usual
+    with CaptureQueriesContext(connection) as ctx:
+        with schema_editor(connection=connection) as editor:
+            editor.alter_field(TestModel, new_field, old_field)
+    assert not [query for query in ctx.captured_queries if 'zdm_new' in query['sql']]
+    assert column_type() == ('character varying', 250)
+    assert TestModel.objects.count() == 1500
+
+
+@pytest.mark.django_db(transaction=True)
+def test_alter_column_type_resumes_from_journal(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_ALTER_TYPE_ONLINE = True
+    settings.ZERO_DOWNTIME_MIGRATIONS_JOURNAL = True
+    TestModel.objects.all().delete()
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(10)])
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.CharField(max_length=100))
+
+    with schema_editor(connection=connection) as editor:
+        shadow = editor._shadow_field(new_field)
+        editor.add_shadow_column(TestModel, old_field, new_field, shadow)
+        editor.create_sync_trigger(TestModel, old_field, new_field, shadow)
+        journal = Journal(connection)
+        for action in editor.ALTER_COLUMN_TYPE_ACTIONS[:2]:
+            journal.finish_action('test_app_testmodel', shadow.column, action)
+
+    with CaptureQueriesContext(connection) as ctx:
+        with schema_editor(connection=connection) as editor:
+            editor.alter_field(TestModel, old_field, new_field)
+    queries = [query['sql'] for query in ctx.captured_queries]
+    assert not [sql for sql in queries if 'ADD COLUMN' in sql or sql.startswith('CREATE TRIGGER')]
+    assert column_type() == ('character varying', 100)
+    assert Journal(connection).get('test_app_testmodel', shadow.column) is None
+
+    with schema_editor(connection=connection) as editor:
+        editor.alter_field(TestModel, new_field, old_field)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_alter_column_type_online_checks_cast(settings, added_columns):
+    settings.ZERO_DOWNTIME_MIGRATIONS_ALTER_TYPE_ONLINE = True
+    TestModel.objects.all().delete()
+    TestModel.objects.bulk_create([TestModel(name='1'), TestModel(name='one')])
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.IntegerField())
+    added_columns.append('name_zdm_new')
+
+    with CaptureQueriesContext(connection) as ctx:
+        with pytest.raises(TypeCastError):
+            with schema_editor(connection=connection, atomic=False) as editor:
+                editor.alter_field(TestModel, old_field, new_field)
+    assert not [query for query in ctx.captured_queries if query['sql'].startswith(('CREATE TRIGGER', 'CREATE OR'))]
+    assert column_type() == ('character varying', 250)
+    # writes are not broken by the trigger
+    TestModel.objects.create(name='two')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_invalid_shadow_index_is_built_again(added_columns):
+    added_columns.append('name_zdm_new')
+    TestModel.objects.all().delete()
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(10)])
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.CharField(max_length=100))
+    editor = schema_editor(connection=connection, atomic=False)
+    shadow = editor._shadow_field(new_field)
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE INDEX "zdm_name_idx" ON "test_app_testmodel" ("name")')
+    try:
+        editor.add_shadow_column(TestModel, old_field, new_field, shadow)
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE "test_app_testmodel" SET "name_zdm_new" = \'same\'')
+            # build fails on duplicates and leaves invalid index, as killed one does
+            with pytest.raises(django.db.utils.IntegrityError):
+                cursor.execute('CREATE UNIQUE INDEX CONCURRENTLY "zdm_name_idx_zdm_new" '
+                               'ON "test_app_testmodel" ("name_zdm_new")')
+        editor.create_shadow_indexes(TestModel, old_field, new_field, shadow)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_index.indisvalid, pg_index.indisunique FROM pg_class JOIN pg_index "
+                           "ON pg_index.indexrelid = pg_class.oid WHERE pg_class.relname = 'zdm_name_idx_zdm_new'")
+            assert cursor.fetchall() == [(True, False)]
+    finally:
+        TestModel.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS "zdm_name_idx"')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_alter_column_type_online_refuses_other_check_constraints(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_ALTER_TYPE_ONLINE = True
+    old_field, new_field = make_fields(models.CharField(max_length=250), models.CharField(max_length=100))
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE "test_app_testmodel" ADD CONSTRAINT "zdm_name_id_check" '
+                       'CHECK ("name" <> "id"::text)')
+    try:
+        with CaptureQueriesContext(connection) as ctx:
+            with pytest.raises(ValueError):
+                with schema_editor(connection=connection, atomic=False) as editor:
+                    editor.alter_field(TestModel, old_field, new_field)
+        assert not [query for query in ctx.captured_queries if 'zdm_new' in query['sql']]
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE "test_app_testmodel" DROP CONSTRAINT "zdm_name_id_check"')
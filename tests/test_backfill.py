@@ -0,0 +1,118 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import patch
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+pytestmark = pytest.mark.django_db
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def pk_range_mode(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+
+
+def test_sqlmigrate_add_field_pk_range_working(pk_range_mode):
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection, collect_sql=True) as editor:
+        editor.add_field(TestModel, field)
+        assert editor.collected_sql == [
+            "SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns where table_name = 'test_app_testmodel' and column_name = 'bool_field';",
+            'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL;',
+            'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true;',
+            ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+             "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+            "SELECT MIN(id), MAX(id) FROM test_app_testmodel;",
+            "UPDATE test_app_testmodel SET bool_field = true WHERE id > 0 AND id <= 1000 AND bool_field is null;",
+            'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL;',
+            'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT;'
+        ]
+
+
+def test_add_bool_field_pk_range_walks_all_ranges(pk_range_mode):
+    objects = TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(2500)])
+    min_pk = min(obj.id for obj in TestModel.objects.all())
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+        queries = [query_data['sql'] for query_data in ctx.captured_queries
+                   if query_data['sql'].startswith('UPDATE test_app_testmodel')]
+
+    max_pk = min_pk + 2499
+    assert queries == [
+        ("UPDATE test_app_testmodel SET bool_field = true WHERE id > {} AND id <= {} "
+         "AND bool_field is null".format(start, min(start + 1000, max_pk)))
+        for start in range(min_pk - 1, max_pk, 1000)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM "test_app_testmodel" WHERE bool_field')
+        assert cursor.fetchone()[0] == len(objects)
+
+
+def test_add_bool_field_pk_range_empty_table(pk_range_mode):
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    assert not [query_data for query_data in ctx.captured_queries
+                if query_data['sql'].startswith('UPDATE test_app_testmodel')]
+
+
+def test_pk_partitions_evenly_without_statistics():
+    editor = schema_editor(connection=connection)
+    with patch.object(schema_editor, 'get_pk_histogram_bounds', return_value=[]):
+        assert editor.get_pk_partitions(TestModel, 1, 10, 3) == [(0, 4), (4, 8), (8, 10)]
+        assert editor.get_pk_partitions(TestModel, 1, 2, 4) == [(0, 1), (1, 2)]
+
+
+def test_pk_partitions_by_histogram():
+    editor = schema_editor(connection=connection)
+    bounds = [1, 2, 3, 50, 60, 70, 80, 90, 100]
+    with patch.object(schema_editor, 'get_pk_histogram_bounds', return_value=bounds):
+        assert editor.get_pk_partitions(TestModel, 1, 100, 2) == [(0, 60), (60, 100)]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_field_in_parallel(settings, pk_range_mode, added_columns):
+    added_columns.append('bool_field')
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_WORKERS = 3
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_PARTITIONS = 5
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(5000)])
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM "test_app_testmodel" WHERE bool_field')
+        assert cursor.fetchone()[0] == 5000
+    TestModel.objects.all().delete()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_field_in_parallel_stops_on_error(settings, pk_range_mode, added_columns):
+    added_columns.append('bool_field')
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_WORKERS = 2
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_PARTITIONS = 4
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(4000)])
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with patch.object(schema_editor, 'update_batch_by_pk_range', side_effect=ValueError('broken batch')):
+        with pytest.raises(ValueError):
+            with schema_editor(connection=connection) as editor:
+                editor.add_field(TestModel, field)
+    TestModel.objects.all().delete()
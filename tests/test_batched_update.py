@@ -0,0 +1,119 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+
+from django.apps import apps
+from django.db import connections
+from django.db.migrations import Migration
+from django.db.migrations.state import ProjectState
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.journal import Journal
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from zero_downtime_migrations.operations import BatchedUpdate
+from test_app.models import TestModel
+
+pytestmark = pytest.mark.django_db
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def run_operation(operation, collect_sql=False, backwards=False):
+    state = ProjectState.from_apps(apps)
+    with schema_editor(connection=connection, collect_sql=collect_sql) as editor:
+        if backwards:
+            operation.database_backwards('test_app', editor, state, state)
+        else:
+            operation.database_forwards('test_app', editor, state, state)
+    return editor
+
+
+def test_batched_update_walks_all_ranges():
+    TestModel.objects.bulk_create([TestModel(name='name {}'.format(i)) for i in range(1500)])
+    pks = sorted(TestModel.objects.values_list('id', flat=True))
+    operation = BatchedUpdate('TestModel', "name = upper(name)", where_sql="name LIKE %s", params=['name 1%'])
+    with CaptureQueriesContext(connection) as ctx:
+        run_operation(operation)
+    assert [query_data['sql'] for query_data in ctx.captured_queries if query_data['sql'].startswith('UPDATE')] == [
+        "UPDATE test_app_testmodel SET name = upper(name) WHERE id > {} AND id <= {} AND (name LIKE 'name 1%')".format(
+            start, end,
+        )
+        for start, end in [(pks[0] - 1, pks[999]), (pks[999], pks[-1])]
+    ]
+    assert TestModel.objects.filter(name__startswith='NAME 1').count() == 611
+    assert TestModel.objects.filter(name__startswith='name').count() == 889
+
+
+def test_batched_update_reverse():
+    TestModel.objects.create(name='name')
+    operation = BatchedUpdate('TestModel', "name = upper(name)", reverse_set_sql="name = lower(name)")
+    assert operation.reversible
+    run_operation(operation)
+    assert TestModel.objects.get().name == 'NAME'
+    run_operation(operation, backwards=True)
+    assert TestModel.objects.get().name == 'name'
+    assert not BatchedUpdate('TestModel', "name = upper(name)").reversible
+
+
+def test_batched_update_resumes_from_journal(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_JOURNAL = True
+    TestModel.objects.bulk_create([TestModel(name='name') for i in range(1500)])
+    pks = sorted(TestModel.objects.values_list('id', flat=True))
+    journal = Journal(connection)
+    journal.record_batch('test_app_testmodel', 'uppercase_names', rows=1000, last_pk=pks[999])
+    with CaptureQueriesContext(connection) as ctx:
+        run_operation(BatchedUpdate('TestModel', "name = upper(name)", name='uppercase_names'))
+    assert [query_data['sql'] for query_data in ctx.captured_queries if query_data['sql'].startswith('UPDATE')] == [
+        "UPDATE test_app_testmodel SET name = upper(name) WHERE id > {} AND id <= {}".format(pks[999], pks[-1]),
+    ]
+    # finished update does not leave entry behind, so it runs again if applied again
+    assert journal.get('test_app_testmodel', 'uppercase_names') is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batched_update_in_parallel_resumes_ranges_from_journal(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_JOURNAL = True
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_WORKERS = 2
+    TestModel.objects.bulk_create([TestModel(name='name') for i in range(2000)])
+    pks = sorted(TestModel.objects.values_list('id', flat=True))
+    journal = Journal(connection)
+    # first run walked two ranges in parallel and crashed after the first batch of each
+    ranges = [(pks[0] - 1, pks[999]), (pks[999], pks[-1])]
+    journal.start_ranges('test_app_testmodel', 'append_x', ranges)
+    for pk_range, done in zip(ranges, (pks[:500], pks[1000:1500])):
+        TestModel.objects.filter(id__in=done).update(name='namex')
+        journal.record_batch('test_app_testmodel', Journal.range_key('append_x', pk_range),
+                             rows=len(done), last_pk=done[-1])
+    assert [last_pk for _, last_pk, _ in journal.ranges('test_app_testmodel', 'append_x')] == [pks[499], pks[1499]]
+
+    run_operation(BatchedUpdate('TestModel', "name = name || 'x'", name='append_x'))
+    # rows updated by the first run are not updated again
+    assert TestModel.objects.filter(name='namex').count() == 2000
+    assert journal.ranges('test_app_testmodel', 'append_x') == []
+
+
+def test_sqlmigrate_batched_update():
+    migration = Migration('0002_batched_update', 'test_app')
+    migration.operations = [BatchedUpdate('TestModel', "name = %s", params=['x'])]
+    with schema_editor(connection=connection, collect_sql=True) as editor:
+        migration.apply(ProjectState.from_apps(apps), editor, collect_sql=True)
+    assert editor.collected_sql == [
+        '--',
+        '-- Batched update of TestModel: SET name = %s',
+        '--',
+        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+        "SELECT MIN(id), MAX(id) FROM test_app_testmodel;",
+        "UPDATE test_app_testmodel SET name = 'x' WHERE id > 0 AND id <= 1000;",
+    ]
+
+
+def test_batched_update_deconstruct():
+    operation = BatchedUpdate('TestModel', "name = upper(name)", where_sql="name <> ''")
+    assert operation.deconstruct() == ('BatchedUpdate', [], {
+        'model_name': 'TestModel',
+        'set_sql': "name = upper(name)",
+        'where_sql': "name <> ''",
+    })
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import itertools
+
+import pytest
+from mock import patch
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.batching import (
+    BatchSizeController,
+    AdaptiveBatchSizeController,
+)
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def adaptive_controller(initial_size=1000):
+    return AdaptiveBatchSizeController(initial_size=initial_size, min_size=100, max_size=5000,
+                                       target_duration=1.0, max_lock_duration=5.0)
+
+
+def test_fixed_controller_keeps_size():
+    controller = BatchSizeController(1000)
+    assert controller.record(1000, 100.0) == 1000
+    assert controller.record(1000, 0.001) == 1000
+
+
+def test_adaptive_controller_grows_on_fast_batches():
+    controller = adaptive_controller()
+    assert controller.record(1000, 0.1) == 2000
+    assert controller.record(2000, 0.8) == 2500
+    assert controller.record(2500, 0.0) == 5000
+    assert controller.record(5000, 0.1) == 5000
+
+
+def test_adaptive_controller_shrinks_on_slow_batches():
+    controller = adaptive_controller()
+    assert controller.record(1000, 4.0) == 250
+    assert controller.record(250, 30.0) == 100
+
+
+def test_adaptive_controller_respects_max_lock_duration():
+    controller = AdaptiveBatchSizeController(initial_size=1000, min_size=100, max_size=5000,
+                                             target_duration=10.0, max_lock_duration=2.0)
+    assert controller.record(1000, 4.0) == 500
+
+
+def test_adaptive_controller_clamps_initial_size():
+    assert adaptive_controller(initial_size=10).size == 100
+    assert adaptive_controller(initial_size=10 ** 6).size == 5000
+
+
+@pytest.mark.django_db
+def test_add_field_with_adaptive_batch_size(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    settings.ZERO_DOWNTIME_MIGRATIONS_ADAPTIVE_BATCH_SIZE = True
+    settings.ZERO_DOWNTIME_MIGRATIONS_MIN_BATCH_SIZE = 100
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(2000)])
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    # every batch takes two seconds, twice as long as target duration
+    clock = itertools.count(step=2)
+    with patch('zero_downtime_migrations.backend.schema.monotonic', side_effect=lambda: next(clock)):
+        with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+            editor.add_field(TestModel, field)
+    ranges = [query_data['sql'] for query_data in ctx.captured_queries
+              if query_data['sql'].startswith('UPDATE test_app_testmodel')]
+    sizes = [int(sql.split(' <= ')[1].split()[0]) - int(sql.split(' > ')[1].split()[0]) for sql in ranges]
+    assert sizes[:4] == [1000, 500, 250, 125]
+    assert set(sizes[4:-1]) == {100}
+    assert sum(sizes) == 2000
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM "test_app_testmodel" WHERE bool_field is null')
+        assert cursor.fetchone()[0] == 0
@@ -0,0 +1,144 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import uuid
+import datetime
+
+import pytest
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.defaults import copy_text
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def per_row(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_CALLABLE_DEFAULT_PER_ROW = True
+
+
+def test_copy_text():
+    assert copy_text(None) == '\\N'
+    assert copy_text(True) == 't'
+    assert copy_text(12) == '12'
+    assert copy_text('a\tb\\c\nd') == 'a\\tb\\\\c\\nd'
+    assert copy_text(datetime.date(2020, 1, 2)) == '2020-01-02'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode', ['null_scan', 'pk_range'])
+def test_add_field_with_callable_default_per_row(settings, per_row, mode):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = mode
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(1500)])
+    field = models.UUIDField(default=uuid.uuid4)
+    field.set_attributes_from_name("uuid_field")
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    queries = [query_data['sql'] for query_data in ctx.captured_queries]
+    assert not [sql for sql in queries if 'SET DEFAULT' in sql]
+    assert len([sql for sql in queries if sql.startswith('COPY zero_downtime_migrations_backfill')]) == 2
+    # values table is created once and only truncated for the next batch
+    assert len([sql for sql in queries if sql.startswith('CREATE TEMPORARY TABLE')]) == 1
+    assert len([sql for sql in queries if sql.startswith('TRUNCATE zero_downtime_migrations_backfill')]) == 1
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(DISTINCT uuid_field), COUNT(*) FROM "test_app_testmodel"')
+        assert cursor.fetchone() == (1500, 1500)
+
+
+@pytest.mark.django_db
+def test_add_field_with_callable_default_per_row_sqlmigrate(settings, per_row):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    field = models.UUIDField(default=uuid.uuid4)
+    field.set_attributes_from_name("uuid_field")
+    with schema_editor(connection=connection, collect_sql=True) as editor:
+        editor.add_field(TestModel, field)
+    assert editor.collected_sql == [
+        ("SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns where "
+         "table_name = 'test_app_testmodel' and column_name = 'uuid_field';"),
+        'ALTER TABLE "test_app_testmodel" ADD COLUMN "uuid_field" uuid NULL;',
+        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+        "SELECT MIN(id), MAX(id) FROM test_app_testmodel;",
+        ('SELECT id FROM test_app_testmodel WHERE id > 0 AND id <= 1000 AND uuid_field is null FOR UPDATE;'),
+        ('CREATE TEMPORARY TABLE zero_downtime_migrations_backfill AS '
+         'SELECT id AS pk, uuid_field AS value FROM test_app_testmodel WITH NO DATA;'),
+        'COPY zero_downtime_migrations_backfill (pk, value) FROM STDIN;',
+        ('UPDATE test_app_testmodel table_ SET uuid_field = values_.value '
+         'FROM zero_downtime_migrations_backfill values_ '
+         'WHERE table_.id = values_.pk AND table_.uuid_field is null;'),
+        'SELECT id FROM test_app_testmodel WHERE uuid_field is null LIMIT 1000 FOR UPDATE;',
+        'TRUNCATE zero_downtime_migrations_backfill;',
+        'COPY zero_downtime_migrations_backfill (pk, value) FROM STDIN;',
+        ('UPDATE test_app_testmodel table_ SET uuid_field = values_.value '
+         'FROM zero_downtime_migrations_backfill values_ '
+         'WHERE table_.id = values_.pk AND table_.uuid_field is null;'),
+        'DROP TABLE IF EXISTS zero_downtime_migrations_backfill;',
+        # rows inserted after the last batch are updated with writes blocked
+        'LOCK TABLE "test_app_testmodel" IN SHARE ROW EXCLUSIVE MODE;',
+        'SELECT id FROM test_app_testmodel WHERE uuid_field is null LIMIT 1000 FOR UPDATE;',
+        ('CREATE TEMPORARY TABLE zero_downtime_migrations_backfill AS '
+         'SELECT id AS pk, uuid_field AS value FROM test_app_testmodel WITH NO DATA;'),
+        'COPY zero_downtime_migrations_backfill (pk, value) FROM STDIN;',
+        ('UPDATE test_app_testmodel table_ SET uuid_field = values_.value '
+         'FROM zero_downtime_migrations_backfill values_ '
+         'WHERE table_.id = values_.pk AND table_.uuid_field is null;'),
+        'DROP TABLE IF EXISTS zero_downtime_migrations_backfill;',
+        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "uuid_field" SET NOT NULL;',
+        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "uuid_field" DROP DEFAULT;',
+    ]
+
+
+class InsertingSchemaEditor(DatabaseSchemaEditor):
+    """
+    Rows are inserted by application while the first batch runs
+    """
+    inserted = False
+
+    def update_batch_by_pk_range(self, *args, **kwargs):
+        if not self.inserted:
+            self.inserted = True
+            TestModel.objects.bulk_create([TestModel(name='new') for i in range(10)])
+        return super(InsertingSchemaEditor, self).update_batch_by_pk_range(*args, **kwargs)
+
+
+@pytest.mark.django_db
+def test_add_field_per_row_updates_rows_inserted_during_backfill(settings, per_row):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(1500)])
+    field = models.UUIDField(default=uuid.uuid4)
+    field.set_attributes_from_name("uuid_field")
+    with InsertingSchemaEditor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(DISTINCT uuid_field), COUNT(*) FROM "test_app_testmodel"')
+        assert cursor.fetchone() == (1510, 1510)
+
+
+class LateInsertingSchemaEditor(DatabaseSchemaEditor):
+    """
+    Rows are inserted by application after the last batch
+    """
+    def set_not_null_for_field(self, model, field, nullable, default_factory=None):
+        TestModel.objects.bulk_create([TestModel(name='late') for i in range(10)])
+        return super(LateInsertingSchemaEditor, self).set_not_null_for_field(model, field, nullable, default_factory)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('via_check', [False, True])
+def test_add_field_per_row_updates_rows_inserted_after_last_batch(settings, per_row, via_check):
+    settings.ZERO_DOWNTIME_MIGRATIONS_NOT_NULL_VIA_CHECK = via_check
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(100)])
+    field = models.UUIDField(default=uuid.uuid4)
+    field.set_attributes_from_name("uuid_field")
+    with LateInsertingSchemaEditor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(DISTINCT uuid_field), COUNT(*) FROM "test_app_testmodel"')
+        assert cursor.fetchone() == (110, 110)
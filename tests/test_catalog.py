@@ -0,0 +1,114 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.catalog import CatalogCache
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def catalog_cache(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_CATALOG_CACHE = True
+
+
+def catalog_queries(ctx):
+    return [query_data['sql'] for query_data in ctx.captured_queries
+            if 'pg_class' in query_data['sql'] or 'information_schema' in query_data['sql']]
+
+
+@pytest.mark.django_db
+def test_catalog_snapshot():
+    catalog = CatalogCache(connection)
+    with CaptureQueriesContext(connection) as ctx:
+        catalog.prefetch(['test_app_testmodel', 'auth_user', 'no_such_table'])
+        snapshot = catalog.table('test_app_testmodel')
+        assert catalog.table('auth_user').columns['is_staff'] == ('NO', 'boolean', None)
+        assert catalog.table('no_such_table') is None
+    assert len(ctx.captured_queries) == 1
+    assert snapshot.columns == {
+        'id': ('NO', 'integer', "nextval('test_app_testmodel_id_seq'::regclass)"),
+        'name': ('NO', 'character varying', None),
+    }
+    assert snapshot.indexes == {'test_app_testmodel_pkey': True}
+
+
+@pytest.mark.django_db
+def test_stale_tables_are_loaded_together():
+    catalog = CatalogCache(connection, tables=['test_app_testmodel', 'auth_user'])
+    with CaptureQueriesContext(connection) as ctx:
+        catalog.table('test_app_testmodel')
+        assert catalog.table('auth_user') is not None
+        catalog.invalidate()
+        # sizes are not changed by DDL
+        assert catalog.sizes('auth_user') is not None
+        catalog.table('test_app_testmodel')
+        catalog.table('auth_user')
+    assert len(ctx.captured_queries) == 2
+    assert not catalog.stale
+
+
+@pytest.mark.django_db
+def test_add_fields_with_catalog_cache(catalog_cache, test_object):
+    first_field = models.BooleanField(default=True)
+    first_field.set_attributes_from_name("bool_field")
+    second_field = models.IntegerField(default=1)
+    second_field.set_attributes_from_name("int_field")
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, first_field)
+        editor.add_field(TestModel, second_field)
+        assert editor.get_column_info(TestModel, second_field) == ('NO', 'integer', None)
+        # only tables migration asks about are loaded
+        assert list(editor.get_catalog().tables) == ['test_app_testmodel']
+    # snapshot of the table is loaded again only after it was altered
+    queries = catalog_queries(ctx)
+    assert len(queries) == 3
+    assert all(sql.startswith('SELECT c.relname, c.reltuples::BIGINT, c.relpages') for sql in queries)
+
+
+@pytest.mark.django_db
+def test_sizes_are_loaded_again_after_backfill(catalog_cache):
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(100)])
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        catalog = editor.get_catalog()
+        catalog.table('test_app_testmodel')
+        editor.add_field(TestModel, field)
+        # the snapshot loaded before the backfill is not used for sizes
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_relation_size('test_app_testmodel') / current_setting('block_size')::INT")
+            assert catalog.sizes('test_app_testmodel')[2] == cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def test_invalidate_sizes():
+    catalog = CatalogCache(connection)
+    with CaptureQueriesContext(connection) as ctx:
+        catalog.table('test_app_testmodel')
+        catalog.invalidate('test_app_testmodel')
+        catalog.sizes('test_app_testmodel')
+        catalog.invalidate('test_app_testmodel', sizes=True)
+        catalog.sizes('test_app_testmodel')
+    assert len(ctx.captured_queries) == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_validity_from_catalog_cache(catalog_cache):
+    index = models.Index(fields=['first_name'], name='auth_user_first_name_idx')
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_index(User, index)
+    queries = [query_data['sql'] for query_data in ctx.captured_queries]
+    assert len(queries) == 2
+    assert queries[0].startswith('CREATE INDEX CONCURRENTLY "auth_user_first_name_idx"')
+    assert queries[1].startswith('SELECT c.relname, c.reltuples::BIGINT, c.relpages')
@@ -0,0 +1,124 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import json
+
+import pytest
+from mock import PropertyMock, patch
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import models
+from django.db import connections
+
+from zero_downtime_migrations.backend.cost import (
+    ACCESS_EXCLUSIVE,
+    ROW_EXCLUSIVE,
+    SHARE_UPDATE_EXCLUSIVE,
+    CostModel,
+    classify,
+    estimate,
+    split_operations,
+)
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def test_classify_statements():
+    plan = classify('ALTER TABLE "test" ALTER COLUMN "field" TYPE bigint USING "field"::bigint;')
+    assert (plan.table, plan.lock, plan.rewrite) == ('test', ACCESS_EXCLUSIVE, True)
+    plan = classify('CREATE INDEX CONCURRENTLY "test_field" ON "test" ("field");')
+    assert (plan.table, plan.lock, plan.scan, plan.index_build) == ('test', SHARE_UPDATE_EXCLUSIVE, True, True)
+    plan = classify('UPDATE test SET field = true WHERE id > 0 AND id <= 1000 AND field is null;')
+    assert (plan.table, plan.lock, plan.batched, plan.scan) == ('test', ROW_EXCLUSIVE, True, False)
+    plan = classify('ALTER TABLE "test" ADD COLUMN "field" boolean DEFAULT true NOT NULL;', pg_version=110000)
+    assert (plan.lock, plan.rewrite, plan.scan) == (ACCESS_EXCLUSIVE, False, False)
+    plan = classify('ALTER TABLE "test" ADD COLUMN "field" boolean DEFAULT true NOT NULL;', pg_version=100000)
+    assert plan.rewrite
+    plan = classify('ALTER TABLE "test" ALTER COLUMN "field" SET NOT NULL;', pg_version=120000,
+                    validated_not_null={('test', 'field')})
+    assert not plan.scan
+    assert classify('--') is None
+
+
+@pytest.mark.django_db
+def test_estimate_add_field(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(30000)])
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE "test_app_testmodel"')
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection, collect_sql=True) as editor:
+        editor.add_field(TestModel, field)
+    statements = ['--', '-- Add field bool_field to testmodel', '--'] + editor.collected_sql
+
+    operations = estimate(connection, statements, CostModel(scan_bytes=1024 ** 2, update_rows=1000),
+                          max_lock_window=60)
+    assert len(operations) == 1
+    operation = operations[0]
+    assert operation.description == 'Add field bool_field to testmodel'
+    # 30000 rows by 1500 (5%)
+    assert operation.batches == 20
+    assert operation.duration > 30
+    assert operation.wal_bytes > 0
+    assert any(cost.plan.batched for cost in operation.statements)
+    assert not any(cost.plan.rewrite for cost in operation.statements)
+    # only scan of set not null blocks writes
+    assert 0 < operation.lock_window < operation.duration
+    assert operation.risk == 'low'
+
+
+def test_split_operations():
+    statements = [
+        '--', '-- Add field bool_field to testmodel', '--',
+        'ALTER TABLE "test" ADD COLUMN "bool_field" boolean NULL;',
+        '-- Column "bool_field" in table "test" stays nullable',
+        'ALTER TABLE "test" ALTER COLUMN "bool_field" DROP DEFAULT;',
+        '--', '-- MIGRATION NOW PERFORMS OPERATION THAT CANNOT BE WRITTEN AS SQL:', '-- Raw Python operation', '--',
+    ]
+    assert split_operations(statements) == [
+        ('Add field bool_field to testmodel', [statements[3], statements[5]]),
+        ('Raw Python operation', []),
+    ]
+
+
+@pytest.mark.django_db
+def test_estimate_not_null_via_check_before_postgres_12(settings, test_object):
+    settings.ZERO_DOWNTIME_MIGRATIONS_NOT_NULL_VIA_CHECK = True
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    second_field = models.IntegerField(default=1)
+    second_field.set_attributes_from_name("int_field")
+    with patch.object(type(connection), 'pg_version', new_callable=PropertyMock, return_value=110000):
+        with schema_editor(connection=connection, collect_sql=True) as editor:
+            editor.add_field(TestModel, field)
+            first_sql = list(editor.collected_sql)
+            editor.add_field(TestModel, second_field)
+    assert any(sql.startswith('-- Column "bool_field"') for sql in first_sql)
+    statements = (['--', '-- Add field bool_field to testmodel', '--'] + first_sql +
+                  ['--', '-- Add field int_field to testmodel', '--'] + editor.collected_sql[len(first_sql):])
+
+    operations = estimate(connection, statements, CostModel())
+    # warning comment of the first operation does not start the next one
+    assert [operation.description for operation in operations] == [
+        'Add field bool_field to testmodel', 'Add field int_field to testmodel',
+    ]
+    assert all('int_field' not in cost.plan.sql for cost in operations[0].statements)
+    assert all('bool_field' not in cost.plan.sql for cost in operations[1].statements)
+
+
+@pytest.mark.django_db
+def test_migration_cost_command(capsys, settings):
+    # test_app tables are created without migrations, so they are loaded from separate package only here
+    settings.MIGRATION_MODULES = {'test_app': 'test_app.cost_migrations'}
+    call_command('migration_cost', 'test_app', '001', format='json')
+    operations = json.loads(capsys.readouterr()[0])
+    assert [operation['operation'] for operation in operations] == ['Create model TestClass']
+    assert operations[0]['risk'] == 'low'
+    assert operations[0]['statements'][0]['lock'] == ACCESS_EXCLUSIVE
+    with pytest.raises(CommandError):
+        call_command('migration_cost', 'test_app', '001', max_lock_window=0, lock_wait=1, fail_on='high')
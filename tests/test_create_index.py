@@ -6,6 +6,7 @@ import pytest
 import re
 import django
 
+from django.contrib.auth.models import User
 from django.db import models
 from django.db import connections
 from django.test.utils import CaptureQueriesContext
@@ -81,3 +82,79 @@ def test_create_index_fail():
                 editor.alter_field(TestModel, old_field, field)
             assert len(ctx.captured_queries) == 1
             assert re.search(index_pattern, ctx.captured_queries[0]['sql']) is not None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_index_builds(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_PARALLEL_INDEX_BUILDS = 2
+    test_model_index = models.Index(fields=['name'], name='test_app_testmodel_name_idx')
+    user_index = models.Index(fields=['first_name'], name='auth_user_first_name_idx')
+    with schema_editor(connection=connection) as editor:
+        editor.add_index(TestModel, test_model_index)
+        editor.add_index(User, user_index)
+        assert len(editor._index_queue) == 2
+        assert not index_exists('test_app_testmodel_name_idx')
+    assert index_exists('test_app_testmodel_name_idx')
+    assert index_exists('auth_user_first_name_idx')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_index_builds_invalid_index(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_PARALLEL_INDEX_BUILDS = 2
+    TestModel.objects.create(name='test_unique')
+    TestModel.objects.create(name='test_unique')
+    user_index = models.Index(fields=['first_name'], name='auth_user_first_name_idx')
+    with pytest.raises(InvalidIndexError):
+        with schema_editor(connection=connection) as editor:
+            editor.execute(editor._create_index_sql(TestModel, [TestModel._meta.get_field('name')],
+                                                    name='test_app_testmodel_name_idx',
+                                                    sql='CREATE UNIQUE INDEX %(name)s ON %(table)s (%(columns)s)%(extra)s'))
+            editor.add_index(User, user_index)
+    assert not index_exists('test_app_testmodel_name_idx')
+    assert index_exists(user_index.name)
+    TestModel.objects.all().delete()
+
+
+def index_exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indisvalid FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                       "WHERE relname = %s", [name])
+        return cursor.fetchone() == (True, )
+
+
+@pytest.fixture
+def partitioned_table():
+    if connection.pg_version < 110000:
+        pytest.skip('indexes on partitioned tables need postgres 11')
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE zdm_events (id integer NOT NULL, created date NOT NULL) '
+                       'PARTITION BY RANGE (created)')
+        cursor.execute("CREATE TABLE zdm_events_2024_01 PARTITION OF zdm_events "
+                       "FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')")
+        cursor.execute("CREATE TABLE zdm_events_2024_02 PARTITION OF zdm_events "
+                       "FOR VALUES FROM ('2024-02-01') TO ('2024-03-01') PARTITION BY HASH (id)")
+        cursor.execute("CREATE TABLE zdm_events_2024_02_0 PARTITION OF zdm_events_2024_02 "
+                       "FOR VALUES WITH (MODULUS 1, REMAINDER 0)")
+        cursor.execute("INSERT INTO zdm_events SELECT i, DATE '2024-01-01' + i % 50 FROM generate_series(1, 100) i")
+    yield 'zdm_events'
+    with connection.cursor() as cursor:
+        cursor.execute('DROP TABLE zdm_events')
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_create_index_on_partitioned_table(settings, partitioned_table, workers):
+    settings.ZERO_DOWNTIME_MIGRATIONS_PARTITION_INDEX_BUILDS = workers
+    with schema_editor(connection=connection) as editor:
+        editor.execute('CREATE INDEX "zdm_events_id" ON "zdm_events" ("id", "created")')
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT index_class.relname, pg_index.indisvalid FROM pg_index "
+                       "JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid "
+                       "WHERE pg_index.indrelid IN (SELECT oid FROM pg_class WHERE relname LIKE 'zdm_events%')")
+        indexes = sorted(cursor.fetchall())
+    assert indexes == [
+        ('zdm_events_2024_01_zdm_events_id', True),
+        ('zdm_events_2024_02_0_zdm_events_2024_02_zdm_events_id', True),
+        ('zdm_events_2024_02_zdm_events_id', True),
+        ('zdm_events_id', True),
+    ]
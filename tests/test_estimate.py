@@ -0,0 +1,62 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+pytestmark = pytest.mark.django_db
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def estimate(reltuples, relpages, curpages):
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        count = editor.estimate_objects_in_table(TestModel, reltuples, relpages, curpages)
+    return count, [query_data['sql'] for query_data in ctx.captured_queries
+                   if 'test_app' in query_data['sql']]
+
+
+def test_estimate_scaled_by_current_pages():
+    assert estimate(1000, 10, 25) == (2500, [])
+
+
+def test_estimate_analyzed_empty_table():
+    assert estimate(0, 0, 0) == (0, [])
+
+
+def test_estimate_never_analyzed_empty_table():
+    # reltuples is -1 for never analyzed table since postgres 14
+    assert estimate(-1, 0, 0) == (0, [])
+
+
+def test_estimate_sample_when_never_analyzed(test_object, test_object_two):
+    assert estimate(-1, 0, 1) == (2, ['SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);'])
+
+
+def test_estimate_sample_when_table_grown_from_empty(test_object):
+    assert estimate(0, 0, 1) == (1, ['SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (100);'])
+
+
+def test_estimate_sample_of_large_table(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_COUNT_SAMPLE_PAGES = 10
+    count, queries = estimate(-1, 0, 1000)
+    # nothing is sampled from empty table, but size says there may be rows
+    assert count == 1
+    assert queries == ['SELECT COUNT(*) FROM test_app_testmodel TABLESAMPLE SYSTEM (1);']
+
+
+def test_count_objects_in_table_never_counts_whole_table(test_object):
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE test_app_testmodel;')
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        assert editor.count_objects_in_table(TestModel) == 1
+    assert [query_data['sql'] for query_data in ctx.captured_queries if 'test_app' in query_data['sql']] == [
+        ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+         "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+    ]
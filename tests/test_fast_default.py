@@ -0,0 +1,60 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import uuid
+
+import pytest
+from mock import patch, PropertyMock
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+pytestmark = pytest.mark.django_db
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def fast_default(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_FAST_DEFAULT = True
+
+
+def add_field(field):
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    return [query_data['sql'] for query_data in ctx.captured_queries if 'test_app' in query_data['sql']]
+
+
+def test_add_field_with_constant_default(fast_default, test_object):
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    assert add_field(field) == [
+        ("SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns where "
+         "table_name = 'test_app_testmodel' and column_name = 'bool_field';"),
+        'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean DEFAULT true NOT NULL',
+        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT',
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT bool_field FROM "test_app_testmodel" WHERE id = %s', [test_object.id])
+        assert cursor.fetchone() == (True, )
+
+
+def test_add_field_with_callable_default_is_batched(fast_default, test_object):
+    field = models.UUIDField(default=uuid.uuid4)
+    field.set_attributes_from_name("uuid_field")
+    queries = add_field(field)
+    assert 'ALTER TABLE "test_app_testmodel" ADD COLUMN "uuid_field" uuid NULL' in queries
+    assert 'ALTER TABLE "test_app_testmodel" ALTER COLUMN "uuid_field" SET NOT NULL' in queries
+
+
+def test_add_field_before_postgres_11_is_batched(fast_default, test_object):
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with patch.object(type(connection), 'pg_version', new_callable=PropertyMock, return_value=100000):
+        queries = add_field(field)
+    assert 'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL' in queries
@@ -0,0 +1,76 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import re
+
+import pytest
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def foreign_keys(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_FOREIGN_KEYS = True
+
+
+def parent_field(**kwargs):
+    field = models.ForeignKey(TestModel, on_delete=models.CASCADE, **kwargs)
+    field.set_attributes_from_name("parent")
+    field.model = TestModel
+    return field
+
+
+def add_field(field):
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    return [query_data['sql'] for query_data in ctx.captured_queries if 'test_app' in query_data['sql']]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_nullable_foreign_key(foreign_keys, added_columns):
+    added_columns.append('parent_id')
+    queries = add_field(parent_field(null=True))
+    assert queries[0] == 'ALTER TABLE "test_app_testmodel" ADD COLUMN "parent_id" integer NULL'
+    assert re.match(r'CREATE INDEX CONCURRENTLY "test_app_testmodel_parent_id_\w+" ON "test_app_testmodel" \("parent_id"\)',
+                    queries[1])
+    fk_pattern = (r'ALTER TABLE "test_app_testmodel" ADD CONSTRAINT "(?P<name>test_app_testmodel_parent_id_\w+_fk_\w+)" '
+                  r'FOREIGN KEY \("parent_id"\) REFERENCES "test_app_testmodel" \("id"\) '
+                  r'DEFERRABLE INITIALLY DEFERRED NOT VALID')
+    fk_match = re.match(fk_pattern, queries[-2])
+    assert fk_match
+    assert queries[-1] == 'ALTER TABLE "test_app_testmodel" VALIDATE CONSTRAINT "{}"'.format(fk_match.group('name'))
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT convalidated FROM pg_constraint WHERE conname = %s", [fk_match.group('name')])
+        assert cursor.fetchone() == (True, )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_foreign_key_with_default(foreign_keys, added_columns):
+    added_columns.append('parent_id')
+    parent = TestModel.objects.create(name='parent')
+    TestModel.objects.create(name='child')
+    queries = add_field(parent_field(default=parent.pk))
+    assert 'ALTER TABLE "test_app_testmodel" ADD COLUMN "parent_id" integer NULL' in queries
+    assert [sql for sql in queries if sql.startswith('WITH cte AS')]
+    assert queries[-2].endswith('NOT VALID')
+    assert 'VALIDATE CONSTRAINT' in queries[-1]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT DISTINCT parent_id FROM "test_app_testmodel"')
+        assert cursor.fetchall() == [(parent.pk, )]
+    TestModel.objects.all().delete()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_foreign_key_without_setting(added_columns):
+    added_columns.append('parent_id')
+    queries = add_field(parent_field(null=True))
+    assert not [sql for sql in queries if 'NOT VALID' in sql or 'VALIDATE' in sql]
@@ -0,0 +1,96 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import patch
+
+from django.db import models
+from django.db import connections
+from django.db.migrations.questioner import InteractiveMigrationQuestioner
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.journal import Journal
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+pytestmark = pytest.mark.django_db
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def journal(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_JOURNAL = True
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    return Journal(connection)
+
+
+def test_add_field_journaled(journal):
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(1500)])
+    max_pk = max(TestModel.objects.values_list('id', flat=True))
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+
+    entry = journal.get('test_app_testmodel', 'bool_field')
+    assert entry.done_actions == schema_editor.ADD_FIELD_WITH_DEFAULT_ACTIONS
+    assert entry.last_pk == max_pk
+    assert entry.rows_updated == 1500
+    assert entry.batches == 2
+
+
+def test_add_field_resumes_from_journal(journal):
+    objects = TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(1500)])
+    pks = sorted(TestModel.objects.values_list('id', flat=True))
+    with connection.cursor() as cursor:
+        # first run added column and crashed after the first batch
+        cursor.execute('ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL')
+        cursor.execute('ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true')
+        cursor.execute('UPDATE "test_app_testmodel" SET bool_field = true WHERE id <= %s', [pks[999]])
+        cursor.execute('ANALYZE "test_app_testmodel"')
+    journal.finish_action('test_app_testmodel', 'bool_field', 'add field with default')
+    journal.record_batch('test_app_testmodel', 'bool_field', rows=1000, last_pk=pks[999])
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with patch.object(InteractiveMigrationQuestioner, '_choice_input') as choice_mock:
+        with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+            editor.add_field(TestModel, field)
+    assert not choice_mock.called
+    queries = [query_data['sql'] for query_data in ctx.captured_queries]
+    assert not [sql for sql in queries if 'COUNT(*)' in sql or 'ADD COLUMN' in sql]
+    assert [sql for sql in queries if sql.startswith('UPDATE test_app_testmodel')] == [
+        ("UPDATE test_app_testmodel SET bool_field = true WHERE id > {} AND id <= {} "
+         "AND bool_field is null".format(pks[999], pks[-1])),
+    ]
+
+    entry = journal.get('test_app_testmodel', 'bool_field')
+    assert entry.done_actions == schema_editor.ADD_FIELD_WITH_DEFAULT_ACTIONS
+    assert entry.rows_updated == len(objects)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM "test_app_testmodel" WHERE bool_field')
+        assert cursor.fetchone()[0] == len(objects)
+
+
+def test_stale_journal_entry_cleared(journal):
+    journal.finish_action('test_app_testmodel', 'bool_field', 'add field with default')
+    journal.record_batch('test_app_testmodel', 'bool_field', rows=1000, last_pk=1000)
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    entry = journal.get('test_app_testmodel', 'bool_field')
+    assert entry.done_actions == schema_editor.ADD_FIELD_WITH_DEFAULT_ACTIONS
+    assert entry.last_pk is None
+
+
+def test_sqlmigrate_does_not_use_journal(journal):
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection, collect_sql=True) as editor:
+        editor.add_field(TestModel, field)
+        assert not [sql for sql in editor.collected_sql if 'journal' in sql]
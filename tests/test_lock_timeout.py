@@ -0,0 +1,113 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import psycopg2
+import pytest
+from mock import patch
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.exceptions import LockTimeoutError
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from zero_downtime_migrations.backend.throttling import exponential_backoff
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def lock_timeout(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_LOCK_TIMEOUT = '100ms'
+    settings.ZERO_DOWNTIME_MIGRATIONS_LOCK_TIMEOUT_RETRIES = 2
+    settings.ZERO_DOWNTIME_MIGRATIONS_LOCK_TIMEOUT_BACKOFF = 0.01
+
+
+@pytest.fixture
+def blocker():
+    """
+    Separate connection with open transaction holding
+    lock which conflicts with any ALTER TABLE, asked
+    for after added_columns so it is released before
+    they are dropped
+    """
+    blocker = psycopg2.connect(**connection.get_connection_params())
+    with blocker.cursor() as cursor:
+        cursor.execute('LOCK TABLE "test_app_testmodel" IN ACCESS SHARE MODE')
+    yield blocker
+    blocker.rollback()
+    blocker.close()
+
+
+def bool_field():
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    return field
+
+
+def test_exponential_backoff():
+    for attempt, delay in [(1, 1), (2, 2), (3, 4), (4, 8), (10, 8)]:
+        assert delay / 2.0 <= exponential_backoff(attempt, 1, 8) <= delay
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lock_timeout_guards_alter_table(added_columns, lock_timeout):
+    added_columns.append('bool_field')
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, bool_field())
+    queries = [query_data['sql'] for query_data in ctx.captured_queries]
+    alter_index = queries.index('ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL')
+    assert queries[alter_index - 1] == "SELECT set_config('lock_timeout', '100ms', true);"
+    assert queries[alter_index + 1] == "SET LOCAL lock_timeout TO DEFAULT;"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lock_timeout_retries_until_lock_released(added_columns, lock_timeout, blocker):
+    added_columns.append('bool_field')
+    with patch('time.sleep', side_effect=lambda delay: blocker.rollback()) as sleep_mock:
+        with schema_editor(connection=connection) as editor:
+            editor.add_field(TestModel, bool_field())
+    assert sleep_mock.call_count == 1
+    assert 'bool_field' in [column.name for column in connection.introspection.get_table_description(
+        connection.cursor(), 'test_app_testmodel')]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lock_timeout_gives_up(added_columns, lock_timeout, blocker):
+    added_columns.append('bool_field')
+    with patch('time.sleep') as sleep_mock:
+        with pytest.raises(LockTimeoutError):
+            with schema_editor(connection=connection) as editor:
+                editor.add_field(TestModel, bool_field())
+    assert sleep_mock.call_count == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lock_timeout_respects_budget(added_columns, lock_timeout, settings, blocker):
+    added_columns.append('bool_field')
+    settings.ZERO_DOWNTIME_MIGRATIONS_LOCK_TIMEOUT_BUDGET = 0
+    with patch('time.sleep') as sleep_mock:
+        with pytest.raises(LockTimeoutError):
+            with schema_editor(connection=connection) as editor:
+                editor.add_field(TestModel, bool_field())
+    assert not sleep_mock.called
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lock_timeout_fails_fast_when_transaction_holds_locks(added_columns, lock_timeout, blocker):
+    added_columns.append('bool_field')
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE zdm_locked (id serial PRIMARY KEY)')
+    try:
+        with patch('time.sleep') as sleep_mock:
+            with pytest.raises(LockTimeoutError):
+                with schema_editor(connection=connection) as editor:
+                    editor.execute('LOCK TABLE "zdm_locked" IN SHARE ROW EXCLUSIVE MODE')
+                    editor.add_field(TestModel, bool_field())
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE zdm_locked')
+    assert not sleep_mock.called
@@ -0,0 +1,103 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import Mock
+
+from django.db import models
+from django.db import connections
+
+from zero_downtime_migrations.backend.metrics import (
+    MetricsSink,
+    PrometheusSink,
+    StatsdSink,
+    BatchEvent,
+    StatementEvent,
+    RetryEvent,
+    IndexValidationEvent,
+)
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+class ListSink(MetricsSink):
+    def __init__(self):
+        self.events = []
+        self.flushed = 0
+
+    def emit(self, event):
+        self.events.append(event)
+
+    def flush(self):
+        self.flushed += 1
+
+
+def test_prometheus_sink_textfile(tmpdir):
+    path = str(tmpdir.join('zdm.prom'))
+    sink = PrometheusSink(path=path, interval=3600)
+    sink.emit(BatchEvent('table', 'column', 1000, 0.5, 0.25, 30.0))
+    sink.emit(BatchEvent('table', 'column', 500, 0.25, 0.5, 10.0))
+    sink.emit(RetryEvent('ALTER TABLE "table" ...', 'table', 1, 1.5))
+    sink.flush()
+    with open(path) as metrics:
+        lines = metrics.read().splitlines()
+    assert '# TYPE zero_downtime_migrations_batches_total counter' in lines
+    assert 'zero_downtime_migrations_batches_total{column="column",table="table"} 2.0' in lines
+    assert 'zero_downtime_migrations_rows_updated_total{column="column",table="table"} 1500.0' in lines
+    assert 'zero_downtime_migrations_batch_seconds_total{column="column",table="table"} 0.75' in lines
+    assert 'zero_downtime_migrations_backfill_done_ratio{column="column",table="table"} 0.5' in lines
+    assert 'zero_downtime_migrations_lock_retries_total{table="table"} 1.0' in lines
+    assert [line for line in lines if line.startswith('zero_downtime_migrations_last_event_timestamp_seconds ')]
+
+
+def test_statsd_sink():
+    sink = StatsdSink(prefix='zdm')
+    sink.socket = Mock()
+    sink.emit(BatchEvent('table', 'column', 1000, 0.5, None, None))
+    sink.emit(StatementEvent('ALTER TABLE ...', 'table', 0.01, 2.0))
+    sink.emit(IndexValidationEvent('index', 'table', False, 0.001))
+    assert [args[0][0] for args in sink.socket.sendto.call_args_list] == [
+        b'zdm.table.batches:1|c\nzdm.table.rows_updated:1000|c\nzdm.table.batch:500.000|ms',
+        b'zdm.table.statement:10.000|ms\nzdm.table.lock_wait:2000.000|ms',
+        b'zdm.table.index_invalid:1|c',
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_field_emits_events(settings, test_object, added_columns):
+    added_columns.append('bool_field')
+    sink = ListSink()
+    settings.ZERO_DOWNTIME_MIGRATIONS_METRICS = [sink]
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+        editor.execute('CREATE INDEX "test_app_testmodel_bool_field" ON "test_app_testmodel" ("bool_field")')
+
+    batches = [event for event in sink.events if isinstance(event, BatchEvent)]
+    assert [(event.table, event.column, event.rows) for event in batches] == [
+        ('test_app_testmodel', 'bool_field', 1),
+    ]
+    statements = [event for event in sink.events if isinstance(event, StatementEvent)]
+    assert statements[0].sql == 'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL'
+    assert set(event.table for event in statements) == {'test_app_testmodel'}
+    validations = [event for event in sink.events if isinstance(event, IndexValidationEvent)]
+    assert [(event.index_name, event.table, event.valid) for event in validations] == [
+        ('test_app_testmodel_bool_field', 'test_app_testmodel', True),
+    ]
+    assert sink.flushed == 1
+
+
+@pytest.mark.django_db
+def test_no_metrics_for_sqlmigrate(settings):
+    sink = ListSink()
+    settings.ZERO_DOWNTIME_MIGRATIONS_METRICS = sink
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection, collect_sql=True) as editor:
+        editor.add_field(TestModel, field)
+    assert sink.events == []
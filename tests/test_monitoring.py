@@ -0,0 +1,154 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import time
+import threading
+
+import psycopg2
+import pytest
+
+from django.db import models
+from django.db import connections
+
+from zero_downtime_migrations.backend.metrics import BlockedQueriesEvent, MetricsSink
+from zero_downtime_migrations.backend.monitoring import BlockedQueriesObserver, IndexBuildMonitor
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def test_index_build_progress_eta():
+    monitor = IndexBuildMonitor(alias='default', pid=1, index_name='idx', callback=None, interval=1)
+    monitor.started = 0
+    row = ('building index: scanning table', 100, 1000, 0, 0, 0, 0, 0)
+    progress = monitor.progress(row, now=10)
+    assert progress.phase == 'building index: scanning table'
+    assert progress.elapsed == 10
+    assert progress.eta is None
+    progress = monitor.progress(('building index: scanning table', 300, 1000, 0, 0, 0, 0, 0), now=20)
+    # 200 blocks in 10 seconds, 700 left
+    assert progress.eta == 35
+    progress = monitor.progress(('building index: loading tuples in tree', 0, 0, 50, 500, 0, 0, 0), now=25)
+    assert progress.eta is None
+    progress = monitor.progress(('building index: loading tuples in tree', 0, 0, 150, 500, 0, 0, 0), now=30)
+    assert progress.eta == 17.5
+
+
+@pytest.fixture
+def name_index():
+    """
+    Index built on test model name column by the test is committed,
+    it's dropped after the test
+    """
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'test_app_testmodel' "
+                       "AND indexname LIKE 'test_app_testmodel_name_%%'")
+        for index_name, in cursor.fetchall():
+            cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS "{}"'.format(index_name))
+
+
+def rollback_when_build_waits(writer, events, timeout=10):
+    """
+    Rollback writer transaction as soon as concurrent index build
+    waits for it and this was reported (or after timeout, so the
+    build never hangs)
+    """
+    observer = psycopg2.connect(**connection.get_connection_params())
+    observer.autocommit = True
+    deadline = time.time() + timeout
+    try:
+        with observer.cursor() as cursor:
+            while time.time() < deadline:
+                cursor.execute("SELECT phase FROM pg_stat_progress_create_index "
+                               "WHERE relid = 'test_app_testmodel'::regclass")
+                row = cursor.fetchone()
+                if (row is not None and row[0].startswith('waiting for writers') and
+                        any(event.phase.startswith('waiting for writers') for event in events)):
+                    break
+                time.sleep(0.01)
+    finally:
+        observer.close()
+        writer.rollback()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_build_reports_waiting_for_writers(settings, name_index):
+    events = []
+    settings.ZERO_DOWNTIME_MIGRATIONS_INDEX_PROGRESS_CALLBACK = events.append
+    settings.ZERO_DOWNTIME_MIGRATIONS_INDEX_PROGRESS_INTERVAL = 0.05
+    # open write transaction which concurrent build has to wait for
+    writer = psycopg2.connect(**connection.get_connection_params())
+    with writer.cursor() as cursor:
+        cursor.execute('LOCK TABLE "test_app_testmodel" IN ROW EXCLUSIVE MODE')
+        cursor.execute('SELECT pg_backend_pid()')
+        writer_pid = cursor.fetchone()[0]
+    thread = threading.Thread(target=rollback_when_build_waits, args=(writer, events))
+    thread.start()
+
+    old_field = models.IntegerField()
+    old_field.set_attributes_from_name("name")
+    field = models.IntegerField(db_index=True)
+    field.set_attributes_from_name("name")
+    try:
+        with schema_editor(connection=connection) as editor:
+            editor.alter_field(TestModel, old_field, field)
+    finally:
+        thread.join()
+        writer.close()
+
+    assert events
+    assert all(event.index_name.startswith('test_app_testmodel_name_') for event in events)
+    waiting = [event for event in events if event.phase.startswith('waiting for writers')]
+    assert waiting
+    assert waiting[0].current_locker_pid == writer_pid
+
+
+def test_blocked_queries_summary():
+    events = []
+    observer = BlockedQueriesObserver(alias='default', pid=1, interval=1, callback=events.append)
+    observer.record([(10, 100.0, 'SELECT 1', 0.5, 'ALTER TABLE t')])
+    observer.record([(10, 100.0, 'SELECT 1', 1.5, 'ALTER TABLE t'), (11, 101.0, 'SELECT 2', 0.5, 'ALTER TABLE t')])
+    observer.record([])
+    assert observer.samples == 3
+    assert [(event.sessions, event.max_wait) for event in events] == [(1, 0.5), (2, 1.5)]
+    assert observer.summary() == (
+        '2 queries were blocked by migration, longest for 1.5s:\n'
+        '  1.5s pid 10 "SELECT 1" blocked by "ALTER TABLE t"\n'
+        '  0.5s pid 11 "SELECT 2" blocked by "ALTER TABLE t"'
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_blocked_queries_observed(settings, added_columns):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BLOCKED_QUERIES_INTERVAL = 0.05
+    sink = MetricsSink()
+    sink.events = []
+    sink.emit = sink.events.append
+    settings.ZERO_DOWNTIME_MIGRATIONS_METRICS = sink
+    reader = psycopg2.connect(**connection.get_connection_params())
+
+    def read():
+        with reader.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM "test_app_testmodel"')
+        reader.rollback()
+
+    thread = threading.Thread(target=read)
+    added_columns.append('int_field')
+    try:
+        with schema_editor(connection=connection) as editor:
+            # lock is held till the end of migration transaction
+            editor.execute('ALTER TABLE "test_app_testmodel" ADD COLUMN "int_field" integer NULL')
+            thread.start()
+            time.sleep(0.5)
+    finally:
+        thread.join()
+        reader.close()
+
+    blocked = [event for event in sink.events if isinstance(event, BlockedQueriesEvent)]
+    assert blocked
+    assert blocked[0].sessions == 1
+    assert blocked[0].statement == 'ALTER TABLE "test_app_testmodel" ADD COLUMN "int_field" integer NULL'
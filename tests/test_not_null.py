@@ -0,0 +1,69 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import patch, PropertyMock
+
+from django.db import models
+from django.db import connections, IntegrityError
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+pytestmark = pytest.mark.django_db
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+@pytest.fixture
+def not_null_via_check(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_NOT_NULL_VIA_CHECK = True
+
+
+def add_bool_field():
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    queries = [query_data['sql'] for query_data in ctx.captured_queries if 'test_app' in query_data['sql']]
+    return queries[queries.index("SELECT 1 FROM pg_constraint WHERE conname = 'test_app_testmodel_bool_field_notnull';"):]
+
+
+def column_nullable():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT is_nullable FROM information_schema.columns "
+                       "WHERE table_name = 'test_app_testmodel' AND column_name = 'bool_field'")
+        return cursor.fetchone()[0]
+
+
+def test_set_not_null_via_check(not_null_via_check, test_object):
+    assert add_bool_field() == [
+        "SELECT 1 FROM pg_constraint WHERE conname = 'test_app_testmodel_bool_field_notnull';",
+        ('ALTER TABLE "test_app_testmodel" ADD CONSTRAINT "test_app_testmodel_bool_field_notnull" '
+         'CHECK ("bool_field" IS NOT NULL) NOT VALID'),
+        'ALTER TABLE "test_app_testmodel" VALIDATE CONSTRAINT "test_app_testmodel_bool_field_notnull"',
+        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL',
+        'ALTER TABLE "test_app_testmodel" DROP CONSTRAINT "test_app_testmodel_bool_field_notnull"',
+        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT',
+    ]
+    assert column_nullable() == 'NO'
+
+
+def test_set_not_null_via_check_before_postgres_12(not_null_via_check, test_object, capsys):
+    with patch.object(type(connection), 'pg_version', new_callable=PropertyMock, return_value=110000):
+        queries = add_bool_field()
+    assert ('Warning: Column "bool_field" in table "test_app_testmodel" stays nullable, not null is enforced only by '
+            'check constraint "test_app_testmodel_bool_field_notnull"') in capsys.readouterr()[0]
+    assert queries == [
+        "SELECT 1 FROM pg_constraint WHERE conname = 'test_app_testmodel_bool_field_notnull';",
+        ('ALTER TABLE "test_app_testmodel" ADD CONSTRAINT "test_app_testmodel_bool_field_notnull" '
+         'CHECK ("bool_field" IS NOT NULL) NOT VALID'),
+        'ALTER TABLE "test_app_testmodel" VALIDATE CONSTRAINT "test_app_testmodel_bool_field_notnull"',
+        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT',
+    ]
+    assert column_nullable() == 'YES'
+    with pytest.raises(IntegrityError):
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE "test_app_testmodel" SET bool_field = NULL')
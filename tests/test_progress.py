@@ -0,0 +1,98 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import patch
+
+from django.db import models
+from django.db import connections
+from django.db.migrations.questioner import InteractiveMigrationQuestioner
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.progress import BackfillProgress
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+def test_progress_by_pk_position():
+    progress = BackfillProgress('table', 'column', 1000, min_pk=1, max_pk=1000, start_pk=0)
+    assert progress.done == 0
+    progress.record(100, start_pk=0, end_pk=250)
+    assert progress.done == 0.25
+    assert progress.remaining == 750
+    progress.record(100, start_pk=250, end_pk=1000)
+    assert progress.done == 1.0
+    assert progress.remaining == 0
+
+
+def test_progress_by_rows_updated():
+    progress = BackfillProgress('table', 'column', 1000, rows_updated=200)
+    assert progress.done == 0.2
+    progress.record(300)
+    assert progress.remaining == 500
+    assert progress.batches == 1
+
+
+def test_progress_unknown_total():
+    progress = BackfillProgress('table', 'column', None)
+    assert progress.done is None
+    assert progress.eta is None
+    assert str(progress) == '0 rows updated, ? done, ~? rows left, eta ?'
+
+
+@pytest.mark.django_db
+def test_add_field_tracks_progress(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(1500)])
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+        progress = editor.get_backfill_progress(TestModel, field)
+    assert progress.rows_updated == 1500
+    assert progress.batches == 2
+    assert progress.done == 1.0
+
+
+@pytest.mark.django_db
+def test_show_rows_to_update_does_not_count(add_column_with_nulls):
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with patch.object(InteractiveMigrationQuestioner, '_choice_input') as choice_mock:
+        # show progress, continue, then mark operation as successful
+        choice_mock.side_effect = [4, 1, 5]
+        with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+            editor.add_field(TestModel, field)
+    assert choice_mock.call_args_list[1][0][0] == (
+        'Update of existing rows: 1 rows updated, 50.0% done, ~1 rows left, eta ?'
+    )
+    assert not [query_data['sql'] for query_data in ctx.captured_queries if 'COUNT(*)' in query_data['sql']]
+
+
+@pytest.mark.django_db
+def test_count_rows_to_update_by_pk_chunks(settings, add_column_with_nulls):
+    settings.ZERO_DOWNTIME_MIGRATIONS_COUNT_CHUNK_SIZE = 1
+    settings.ZERO_DOWNTIME_MIGRATIONS_COUNT_CHUNK_PAUSE = 0
+    min_pk, max_pk = add_column_with_nulls
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with CaptureQueriesContext(connection) as ctx, schema_editor(connection=connection) as editor:
+        assert editor.count_need_to_update(TestModel, field) == 1
+    assert [query_data['sql'] for query_data in ctx.captured_queries if 'COUNT(*)' in query_data['sql']] == [
+        ("SELECT COUNT(*) FROM test_app_testmodel WHERE id > {} AND id <= {} "
+         "AND bool_field is NULL;".format(pk - 1, pk))
+        for pk in range(min_pk, max_pk + 1)
+    ]
+
+
+@pytest.fixture
+def add_column_with_nulls(test_object, test_object_two):
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" BOOLEAN NULL;')
+        cursor.execute('UPDATE "test_app_testmodel" SET bool_field = true WHERE id = %s;', [test_object.pk])
+        cursor.execute('ANALYZE "test_app_testmodel";')
+    return test_object.pk, test_object_two.pk
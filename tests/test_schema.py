@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import pytest
 from mock import patch, call
 
+from django.core.exceptions import ImproperlyConfigured
 from django.db import models
 from django.db import connections
 from django.db.migrations.questioner import InteractiveMigrationQuestioner
@@ -25,8 +26,8 @@ def add_column():
         cursor.execute(sql, ())
 
 
-def base_questioner_test(choice_return):
-    field = models.BooleanField(default=True)
+def base_questioner_test(choice_return, null=False):
+    field = models.BooleanField(default=True, null=null)
     field.set_attributes_from_name("bool_field")
     with CaptureQueriesContext(connection) as ctx:
         with patch.object(InteractiveMigrationQuestioner, '_choice_input') as choice_mock:
@@ -44,15 +45,15 @@ def test_retry_with_exit_working(add_column):
         base_questioner_test(1)
 
 
-def test_retry_with_drop_working(add_column):
+def test_retry_with_drop_working(add_column, empty_table):
     _, queries = base_questioner_test(2)
     assert queries == [("SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns "
                         "where table_name = 'test_app_testmodel' and column_name = 'bool_field';"),
                        'ALTER TABLE "test_app_testmodel" DROP COLUMN "bool_field" CASCADE',
                        'ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" boolean NULL',
                        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true',
-                       "SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'test_app_testmodel';",
-                       'SELECT COUNT(*) FROM test_app_testmodel;',
+                       ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                        "FROM pg_class WHERE relname = 'test_app_testmodel';"),
                        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL',
                        'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT',
                        ]
@@ -102,3 +103,76 @@ def test_retry_with_skip_working(add_column):
     assert len(queries) == 1
     assert queries[0] == ("SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns "
                           "where table_name = 'test_app_testmodel' and column_name = 'bool_field';")
+
+
+@pytest.fixture
+def add_column_with_default():
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" BOOLEAN NULL;', ())
+        cursor.execute('ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET DEFAULT true;', ())
+
+
+def test_resume_policy_resume_from_update(settings, add_column_with_default, empty_table):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'resume'
+    choice_mock, queries = base_questioner_test(1)
+    assert not choice_mock.called
+    assert queries == [("SELECT IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT from information_schema.columns where "
+                        "table_name = 'test_app_testmodel' and column_name = 'bool_field';"),
+                       ("SELECT (pg_stats.null_frac * pg_class.reltuples)::BIGINT FROM pg_stats JOIN pg_class "
+                        "ON pg_class.relname = pg_stats.tablename WHERE pg_stats.tablename = 'test_app_testmodel' "
+                        "AND pg_stats.attname = 'bool_field';"),
+                       ("SELECT reltuples::BIGINT, relpages, pg_relation_size(oid) / current_setting('block_size')::INT "
+                        "FROM pg_class WHERE relname = 'test_app_testmodel';"),
+                       'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL',
+                       'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" DROP DEFAULT',
+                       ]
+
+
+def test_resume_policy_resume_finished_column(settings, add_column):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'resume'
+    choice_mock, queries = base_questioner_test(1, null=True)
+    assert not choice_mock.called
+    assert len(queries) == 1
+
+
+def test_resume_policy_resume_not_null_column_without_default(settings, add_column):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'resume'
+    choice_mock, queries = base_questioner_test(1)
+    assert not choice_mock.called
+    assert queries[-1] == 'ALTER TABLE "test_app_testmodel" ALTER COLUMN "bool_field" SET NOT NULL'
+    assert not [sql for sql in queries if 'SET DEFAULT' in sql or 'DROP DEFAULT' in sql]
+
+
+def test_resume_policy_resume_other_type(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'resume'
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE "test_app_testmodel" ADD COLUMN "bool_field" integer NULL;', ())
+    with pytest.raises(SystemExit):
+        base_questioner_test(2)
+
+
+def test_resume_policy_restart(settings, add_column):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'restart'
+    choice_mock, queries = base_questioner_test(1)
+    assert not choice_mock.called
+    assert queries[1] == 'ALTER TABLE "test_app_testmodel" DROP COLUMN "bool_field" CASCADE'
+
+
+def test_resume_policy_mark_done(settings, add_column):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'mark-done'
+    choice_mock, queries = base_questioner_test(2)
+    assert not choice_mock.called
+    assert len(queries) == 1
+
+
+def test_resume_policy_fail_from_environment(settings, add_column, monkeypatch):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'mark-done'
+    monkeypatch.setenv('ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY', 'fail')
+    with pytest.raises(SystemExit):
+        base_questioner_test(5)
+
+
+def test_resume_policy_unknown(settings, add_column):
+    settings.ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY = 'skip'
+    with pytest.raises(ImproperlyConfigured):
+        base_questioner_test(5)
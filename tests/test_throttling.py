@@ -0,0 +1,148 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import MagicMock
+
+from django.db import models
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from zero_downtime_migrations.backend.exceptions import ReplicationLagError
+from zero_downtime_migrations.backend.schema import DatabaseSchemaEditor
+from zero_downtime_migrations.backend.throttling import (
+    DeadTuplesThrottle,
+    ReplicationLagThrottle,
+    replication_lag_bytes,
+)
+from test_app.models import TestModel
+
+connection = connections['default']
+schema_editor = DatabaseSchemaEditor
+
+
+class StubProbe(object):
+    def __init__(self, *lags):
+        self.lags = list(lags)
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        if len(self.lags) > 1:
+            return self.lags.pop(0)
+        return self.lags[0]
+
+
+def test_throttle_does_not_wait_without_lag():
+    sleeps = []
+    throttle = ReplicationLagThrottle(probe=StubProbe(0), max_lag=100, sleep=sleeps.append)
+    assert throttle.wait() == 0
+    assert sleeps == []
+
+
+def test_throttle_waits_until_lag_recovers():
+    sleeps = []
+    throttle = ReplicationLagThrottle(probe=StubProbe(500, 200, 50), max_lag=100,
+                                      check_interval=2, sleep=sleeps.append)
+    assert throttle.wait() == 4
+    assert sleeps == [2, 2]
+
+
+def test_throttle_gives_up_after_max_wait():
+    throttle = ReplicationLagThrottle(probe=StubProbe(500), max_lag=100, check_interval=1,
+                                      max_wait=3, sleep=lambda seconds: None)
+    with pytest.raises(ReplicationLagError):
+        throttle.wait()
+
+
+@pytest.mark.django_db
+def test_default_probe_without_replicas():
+    assert replication_lag_bytes(connection) == 0
+
+
+def stat_replication_connection(pg_version, row):
+    stub = MagicMock(pg_version=pg_version)
+    cursor = stub.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = row
+    return stub, cursor
+
+
+def test_default_probe_fails_if_replica_positions_are_hidden():
+    stub, cursor = stat_replication_connection(100000, (0, 2, 0))
+    with pytest.raises(ReplicationLagError):
+        replication_lag_bytes(stub)
+    stub, cursor = stat_replication_connection(100000, (4096, 2, 1))
+    assert replication_lag_bytes(stub) == 4096
+
+
+def test_default_probe_before_postgres_10():
+    stub, cursor = stat_replication_connection(90600, (0, 0, 0))
+    assert replication_lag_bytes(stub) == 0
+    sql = cursor.execute.call_args[0][0]
+    assert 'pg_xlog_location_diff(pg_current_xlog_location(), replay_location)' in sql
+
+
+@pytest.mark.django_db
+def test_add_field_checks_replication_lag(settings):
+    probe = StubProbe(0)
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    settings.ZERO_DOWNTIME_MIGRATIONS_REPLICATION_LAG_MAX = 1024
+    settings.ZERO_DOWNTIME_MIGRATIONS_REPLICATION_LAG_PROBE = probe
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(2500)])
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with schema_editor(connection=connection) as editor:
+        editor.add_field(TestModel, field)
+    # three batches, lag is checked between them
+    assert probe.calls == 2
+
+
+def test_dead_tuples_throttle_does_not_wait_below_ratio():
+    sleeps = []
+    throttle = DeadTuplesThrottle(probe=StubProbe((100, 1000)), max_ratio=0.2, sleep=sleeps.append)
+    assert throttle.wait() == 0
+    assert sleeps == []
+
+
+def test_dead_tuples_throttle_waits_for_autovacuum():
+    sleeps = []
+    throttle = DeadTuplesThrottle(probe=StubProbe((500, 1000), (300, 1000), (0, 1000)), max_ratio=0.2,
+                                  check_interval=5, sleep=sleeps.append)
+    assert throttle.wait() == 10
+    assert sleeps == [5, 5]
+
+
+def test_dead_tuples_throttle_vacuums_once():
+    vacuums = []
+    sleeps = []
+    throttle = DeadTuplesThrottle(probe=StubProbe((500, 1000), (0, 1000)), max_ratio=0.2,
+                                  vacuum=lambda: vacuums.append(1), sleep=sleeps.append)
+    assert throttle.wait() == 0
+    assert vacuums == [1]
+    assert sleeps == []
+
+
+def test_dead_tuples_throttle_continues_after_max_wait():
+    throttle = DeadTuplesThrottle(probe=StubProbe((500, 1000)), max_ratio=0.2, check_interval=1,
+                                  max_wait=3, sleep=lambda seconds: None)
+    assert throttle.wait() == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_add_field_vacuums_dead_tuples(settings):
+    settings.ZERO_DOWNTIME_MIGRATIONS_BACKFILL_MODE = 'pk_range'
+    settings.ZERO_DOWNTIME_MIGRATIONS_DEAD_TUPLES_MAX_RATIO = 0.1
+    settings.ZERO_DOWNTIME_MIGRATIONS_DEAD_TUPLES_VACUUM = True
+    settings.ZERO_DOWNTIME_MIGRATIONS_DEAD_TUPLES_MAX_WAIT = 0
+    TestModel.objects.bulk_create([TestModel(name=str(i)) for i in range(2500)])
+
+    field = models.BooleanField(default=True)
+    field.set_attributes_from_name("bool_field")
+    with CaptureQueriesContext(connection) as ctx:
+        with schema_editor(connection=connection) as editor:
+            editor.add_field(TestModel, field)
+    queries = [query['sql'] for query in ctx.captured_queries]
+    assert len([sql for sql in queries if sql.startswith('SELECT n_dead_tup')]) >= 2
+    assert 'ANALYZE test_app_testmodel (bool_field);' in queries
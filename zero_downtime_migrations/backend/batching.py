@@ -0,0 +1,49 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import time
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class BatchSizeController(object):
+    """
+    Keep the same batch size for the whole update
+    """
+    def __init__(self, initial_size):
+        self.size = initial_size
+
+    def record(self, rows, duration):
+        """
+        Account batch of `rows` rows which took `duration` seconds
+        (including commit) and return size for the next batch
+        """
+        return self.size
+
+
+class AdaptiveBatchSizeController(BatchSizeController):
+    """
+    Grow or shrink the next batch so it takes about `target_duration`
+    seconds and never holds row locks longer than `max_lock_duration`,
+    staying within [min_size, max_size]
+    """
+    # do not let one fast batch blow up the next one
+    MAX_GROWTH = 2.0
+
+    def __init__(self, initial_size, min_size, max_size, target_duration, max_lock_duration):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_duration = min(target_duration, max_lock_duration)
+        super(AdaptiveBatchSizeController, self).__init__(self.clamp(initial_size))
+
+    def clamp(self, size):
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def record(self, rows, duration):
+        if duration <= 0:
+            size = self.size * self.MAX_GROWTH
+        else:
+            size = self.size * min(self.target_duration / duration, self.MAX_GROWTH)
+        self.size = self.clamp(size)
+        return self.size
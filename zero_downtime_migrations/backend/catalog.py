@@ -0,0 +1,81 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+from zero_downtime_migrations.backend.sql_template import SQL_CATALOG_SNAPSHOT
+
+# columns: {name: (IS_NULLABLE, DATA_TYPE, COLUMN_DEFAULT)} as in information_schema.columns
+# indexes: {name: indisvalid}
+TableSnapshot = namedtuple('TableSnapshot', ['reltuples', 'relpages', 'curpages', 'columns', 'indexes'])
+
+
+class CatalogCache(object):
+    """
+    Column, index and size metadata of tables, loaded from pg_catalog
+    with one query for any number of tables. Tables which are likely to
+    be needed are loaded together with the first one asked for, stale
+    ones together with the next one. DDL touching the table makes its
+    columns and indexes stale, sizes are still served from the old
+    snapshot unless they are invalidated too, after backfill or index build
+    """
+    def __init__(self, connection, tables=()):
+        self.connection = connection
+        self.tables = {}
+        self.stale = set()
+        self.expected = list(tables)
+
+    def _missing(self, table):
+        return table not in self.tables or table in self.stale
+
+    def prefetch(self, tables):
+        missing = [table for table in tables if self._missing(table)]
+        if not missing:
+            return
+        for table in self.expected + sorted(self.stale):
+            if table not in missing and self._missing(table):
+                missing.append(table)
+        self.expected = []
+        with self.connection.cursor() as cursor:
+            cursor.execute(SQL_CATALOG_SNAPSHOT, [missing])
+            rows = cursor.fetchall()
+        for table in missing:
+            # table does not exist (yet)
+            self.tables[table] = None
+            self.stale.discard(table)
+        for table, reltuples, relpages, curpages, columns, indexes in rows:
+            self.tables[table] = TableSnapshot(
+                reltuples=reltuples,
+                relpages=relpages,
+                curpages=curpages,
+                columns={column[0]: tuple(column[1:]) for column in columns or []},
+                indexes={index: valid for index, valid in indexes or []},
+            )
+
+    def table(self, table):
+        self.prefetch([table])
+        return self.tables[table]
+
+    def sizes(self, table):
+        """
+        (reltuples, relpages, current pages) of table,
+        None if it does not exist
+        """
+        if table not in self.tables or (self.tables[table] is None and table in self.stale):
+            self.prefetch([table])
+        snapshot = self.tables[table]
+        if snapshot is None:
+            return None
+        return snapshot.reltuples, snapshot.relpages, snapshot.curpages
+
+    def invalidate(self, table=None, sizes=False):
+        if sizes:
+            # forgotten snapshot is loaded again even for sizes
+            for name in list(self.tables) if table is None else [table]:
+                self.tables.pop(name, None)
+                self.stale.discard(name)
+        elif table is None:
+            self.stale.update(self.tables)
+        else:
+            self.stale.add(table)
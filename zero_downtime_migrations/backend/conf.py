@@ -0,0 +1,16 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+SETTINGS_PREFIX = 'ZERO_DOWNTIME_MIGRATIONS_'
+
+
+def get_setting(name, default=None):
+    """
+    Read ZERO_DOWNTIME_MIGRATIONS_<name> from django settings,
+    settings are read on every call so they can be changed
+    between migrations (and in tests)
+    """
+    return getattr(settings, SETTINGS_PREFIX + name, default)
@@ -0,0 +1,256 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import re
+from collections import namedtuple
+
+from zero_downtime_migrations.backend.schema import MAX_BATCH_SIZE, MIN_BATCH_SIZE, TABLE_SIZE_FOR_MAX_BATCH
+from zero_downtime_migrations.backend.sql_template import SQL_TABLE_SIZES
+
+ACCESS_SHARE = 'ACCESS SHARE'
+ROW_EXCLUSIVE = 'ROW EXCLUSIVE'
+SHARE_UPDATE_EXCLUSIVE = 'SHARE UPDATE EXCLUSIVE'
+SHARE = 'SHARE'
+SHARE_ROW_EXCLUSIVE = 'SHARE ROW EXCLUSIVE'
+ACCESS_EXCLUSIVE = 'ACCESS EXCLUSIVE'
+# locks which block writes to the table (ACCESS EXCLUSIVE blocks reads too)
+WRITE_BLOCKING_LOCKS = (SHARE, SHARE_ROW_EXCLUSIVE, 'EXCLUSIVE', ACCESS_EXCLUSIVE)
+
+RISK_LOW = 'low'
+RISK_MEDIUM = 'medium'
+RISK_HIGH = 'high'
+RISKS = (RISK_LOW, RISK_MEDIUM, RISK_HIGH)
+
+TableSize = namedtuple('TableSize', ['rows', 'table_bytes', 'indexes_bytes'])
+# what statement does to the table: `scan` - reads whole table, `rewrite` - writes
+# whole table (and its indexes) again, `batched` - one representative batch
+# of update which is repeated for the whole table
+StatementPlan = namedtuple('StatementPlan', ['sql', 'table', 'lock', 'scan', 'rewrite', 'batched', 'index_build'])
+StatementCost = namedtuple('StatementCost', [
+    'plan', 'rows', 'batches', 'duration', 'wal_bytes', 'lock_window',
+])
+OperationCost = namedtuple('OperationCost', [
+    'description', 'statements', 'batches', 'duration', 'wal_bytes', 'lock_window', 'risk',
+])
+
+
+class CostModel(object):
+    """
+    Rough throughput of the server, everything is per second.
+    Batch size is chosen as schema editor does if not given
+    """
+    def __init__(self, scan_bytes=100 * 1024 ** 2, write_bytes=50 * 1024 ** 2, update_rows=10000,
+                 index_bytes=30 * 1024 ** 2, batch_size=None, row_overhead=60, lock_wait=0.0):
+        self.scan_bytes = scan_bytes
+        self.write_bytes = write_bytes
+        self.update_rows = update_rows
+        self.index_bytes = index_bytes
+        self.batch_size = batch_size
+        # WAL record and tuple header per updated row
+        self.row_overhead = row_overhead
+        # how long heavy lock may be waited for (lock_timeout) before statement runs
+        self.lock_wait = lock_wait
+
+    def get_batch_size(self, rows):
+        if self.batch_size:
+            return self.batch_size
+        if rows > TABLE_SIZE_FOR_MAX_BATCH:
+            return MAX_BATCH_SIZE
+        return max(MIN_BATCH_SIZE, rows * 5 // 100)
+
+
+def _table(pattern, sql):
+    match = re.search(pattern, sql, re.IGNORECASE)
+    if match:
+        return match.group('table').strip('"')
+
+
+def classify(sql, pg_version=None, validated_not_null=()):
+    """
+    StatementPlan of one statement of collected migration sql
+    (None for comments and transaction control). `validated_not_null`
+    are (table, column) with validated not null check constraint
+    which lets postgres 12+ set not null without scan
+    """
+    statement = sql.strip().rstrip(';')
+    upper = statement.upper()
+    if not statement or statement.startswith('--') or upper in ('BEGIN', 'COMMIT'):
+        return None
+
+    def plan(table, lock, scan=False, rewrite=False, batched=False, index_build=False):
+        return StatementPlan(statement, table, lock, scan, rewrite, batched, index_build)
+
+    if re.match(r'CREATE (UNIQUE )?INDEX', upper):
+        table = _table(r' ON (ONLY )?(?P<table>[^\s(]+)', statement)
+        if 'CONCURRENTLY' in upper:
+            return plan(table, SHARE_UPDATE_EXCLUSIVE, scan=True, index_build=True)
+        return plan(table, SHARE, scan=True, index_build=True)
+    if re.match(r'(CREATE (OR REPLACE )?|DROP )FUNCTION', upper):
+        return plan(None, ACCESS_SHARE)
+    if re.match(r'(CREATE|DROP) TRIGGER', upper):
+        return plan(_table(r' ON (?P<table>[^\s(;]+)', statement), SHARE_ROW_EXCLUSIVE)
+    if upper.startswith('ANALYZE') or upper.startswith('VACUUM'):
+        # analyze reads only a sample of the table
+        return plan(_table(r'(ANALYZE|VACUUM) (?P<table>[^\s(;]+)', statement), SHARE_UPDATE_EXCLUSIVE,
+                    scan=upper.startswith('VACUUM'))
+    if upper.startswith('DROP INDEX'):
+        return plan(None, SHARE_UPDATE_EXCLUSIVE if 'CONCURRENTLY' in upper else ACCESS_EXCLUSIVE)
+    if upper.startswith('UPDATE') or upper.startswith('WITH'):
+        table = _table(r'UPDATE (?P<table>[^\s(]+)', statement)
+        batched = bool(re.search(r'> -?\d+ AND \S+ <= -?\d+|LIMIT\s+\d+', statement, re.IGNORECASE))
+        return plan(table, ROW_EXCLUSIVE, scan=not batched, batched=batched)
+    if upper.startswith('SELECT') or upper.startswith('COPY') or upper.startswith('CREATE TEMPORARY'):
+        table = _table(r'FROM (?P<table>[^\s(;]+)', statement)
+        full_count = upper.startswith('SELECT COUNT(*)') and 'TABLESAMPLE' not in upper and ' WHERE ' in upper
+        return plan(table, ACCESS_SHARE, scan=full_count and ' > ' not in upper)
+    if upper.startswith('CREATE TABLE') or upper.startswith('DROP TABLE'):
+        return plan(_table(r'TABLE (IF (NOT )?EXISTS )?(?P<table>[^\s(]+)', statement), ACCESS_EXCLUSIVE)
+    if upper.startswith('LOCK TABLE'):
+        mode = re.search(r' IN (?P<mode>.+) MODE', upper)
+        return plan(_table(r'TABLE (ONLY )?(?P<table>[^\s(]+)', statement),
+                    mode.group('mode') if mode else ACCESS_EXCLUSIVE)
+    if upper.startswith('ALTER TABLE'):
+        table = _table(r'ALTER TABLE (IF EXISTS )?(ONLY )?(?P<table>[^\s(]+)', statement)
+        if 'VALIDATE CONSTRAINT' in upper:
+            return plan(table, SHARE_UPDATE_EXCLUSIVE, scan=True)
+        if 'FOREIGN KEY' in upper:
+            # referenced table is locked the same way
+            return plan(table, SHARE_ROW_EXCLUSIVE, scan='NOT VALID' not in upper)
+        if 'ADD CONSTRAINT' in upper and 'CHECK' in upper:
+            return plan(table, ACCESS_EXCLUSIVE, scan='NOT VALID' not in upper)
+        if 'ADD CONSTRAINT' in upper and 'USING INDEX' not in upper and ('UNIQUE' in upper or 'PRIMARY KEY' in upper):
+            return plan(table, ACCESS_EXCLUSIVE, scan=True, index_build=True)
+        if 'SET NOT NULL' in upper:
+            column = _table(r'ALTER COLUMN (?P<table>\S+) SET NOT NULL', statement)
+            skip_scan = (pg_version or 0) >= 120000 and (table, column) in validated_not_null
+            return plan(table, ACCESS_EXCLUSIVE, scan=not skip_scan)
+        if re.search(r'ALTER COLUMN \S+ (SET DATA )?TYPE', upper):
+            return plan(table, ACCESS_EXCLUSIVE, rewrite=True)
+        if 'ADD COLUMN' in upper and ' DEFAULT ' in upper:
+            volatile = re.search(r' DEFAULT [^\s]*\(', upper) is not None
+            return plan(table, ACCESS_EXCLUSIVE, rewrite=volatile or (pg_version or 0) < 110000)
+        return plan(table, ACCESS_EXCLUSIVE)
+    return plan(None, ACCESS_EXCLUSIVE)
+
+
+def split_operations(statements):
+    """
+    Group collected sql by operations as [(description, statements)],
+    sqlmigrate puts description of every operation between two empty
+    comments before its sql. Other comments (schema editor adds some)
+    are skipped
+    """
+    operations = []
+    header = None
+    for sql in statements:
+        if sql.strip() == '--':
+            if header:
+                # the last line is description, the ones before it are notes
+                operations.append((header[-1], []))
+                header = None
+            else:
+                header = []
+        elif header is not None and sql.startswith('--'):
+            header.append(sql[2:].strip())
+        elif sql.startswith('--'):
+            continue
+        elif sql.strip():
+            header = None
+            if not operations:
+                operations.append(('', []))
+            operations[-1][1].append(sql)
+    return operations
+
+
+def table_size(connection, table):
+    """
+    TableSize from pg_class, rows are estimated from table size
+    if it was never analyzed, None if there is no such table yet
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_TABLE_SIZES, [table])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    rows, table_bytes, indexes_bytes = row
+    if rows < 0:
+        rows = table_bytes // 100
+    return TableSize(rows, table_bytes, indexes_bytes)
+
+
+def statement_cost(plan, size, model):
+    size = size or TableSize(0, 0, 0)
+    rows, batches, duration, wal_bytes = 0, 0, 0.0, 0
+    row_bytes = size.table_bytes / float(size.rows) if size.rows else 0
+    if plan.batched:
+        rows = size.rows
+        batches = -(-rows // model.get_batch_size(rows))
+        duration = rows / float(model.update_rows)
+        wal_bytes = int(rows * (row_bytes + model.row_overhead))
+    elif plan.rewrite:
+        rows = size.rows
+        duration = (size.table_bytes + size.indexes_bytes) / float(model.write_bytes)
+        wal_bytes = size.table_bytes + size.indexes_bytes
+    elif plan.lock == ROW_EXCLUSIVE and plan.scan:
+        # update of whole table at once
+        rows = size.rows
+        duration = size.table_bytes / float(model.scan_bytes) + rows / float(model.update_rows)
+        wal_bytes = int(rows * (row_bytes + model.row_overhead))
+    elif plan.scan:
+        rows = size.rows
+        duration = size.table_bytes / float(model.scan_bytes)
+        if plan.index_build:
+            # concurrent build scans table twice
+            index_bytes = rows * 32
+            scans = 2 if plan.lock == SHARE_UPDATE_EXCLUSIVE else 1
+            duration = duration * scans + index_bytes / float(model.index_bytes)
+            wal_bytes = index_bytes
+    lock_window = 0.0
+    if plan.lock in WRITE_BLOCKING_LOCKS:
+        lock_window = duration + model.lock_wait
+    return StatementCost(plan, rows, batches, duration, wal_bytes, lock_window)
+
+
+def operation_risk(lock_window, max_lock_window):
+    if lock_window > max_lock_window:
+        return RISK_HIGH
+    if lock_window > max_lock_window / 10.0:
+        return RISK_MEDIUM
+    return RISK_LOW
+
+
+def estimate(connection, statements, model, max_lock_window=1.0):
+    """
+    OperationCost of every operation of collected migration sql
+    with sizes of tables taken from `connection`
+    """
+    sizes = {}
+    validated_not_null = set()
+    result = []
+    for description, lines in split_operations(statements):
+        costs = []
+        for sql in lines:
+            plan = classify(sql, connection.pg_version, validated_not_null)
+            if plan is None:
+                continue
+            check = re.search(r'ADD CONSTRAINT (?P<name>\S+) CHECK \((?P<column>\S+) IS NOT NULL\)', plan.sql)
+            if check:
+                validated_not_null.add((plan.table, check.group('column').strip('"')))
+            if plan.table is not None and plan.table not in sizes:
+                sizes[plan.table] = table_size(connection, plan.table)
+            costs.append(statement_cost(plan, sizes.get(plan.table), model))
+        if not costs:
+            continue
+        # worst case: locks taken in migration transaction are held till its end
+        lock_window = sum(cost.lock_window for cost in costs)
+        result.append(OperationCost(
+            description=description,
+            statements=costs,
+            batches=sum(cost.batches for cost in costs),
+            duration=sum(cost.duration for cost in costs),
+            wal_bytes=sum(cost.wal_bytes for cost in costs),
+            lock_window=lock_window,
+            risk=operation_risk(lock_window, max_lock_window),
+        ))
+    return result
@@ -0,0 +1,39 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import io
+
+
+def copy_text(value):
+    """
+    Value in COPY text format
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'adapted') and hasattr(value, 'dumps'):
+        # psycopg2 Json adapter
+        value = value.dumps(value.adapted)
+    return ('{}'.format(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class PerRowDefault(object):
+    """
+    Callable default of field evaluated separately for every
+    row, `effective_default` is schema editor's method which
+    calls the default and prepares its value for database
+    """
+    def __init__(self, field, effective_default):
+        self.field = field
+        self.effective_default = effective_default
+
+    def copy_data(self, pks):
+        """
+        (pk, value) rows with new value for every pk, ready for COPY FROM STDIN
+        """
+        return io.StringIO(''.join(
+            '{}\t{}\n'.format(copy_text(pk), copy_text(self.effective_default(self.field))) for pk in pks
+        ))
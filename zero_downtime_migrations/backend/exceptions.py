@@ -5,3 +5,19 @@ from __future__ import unicode_literals
 
 class InvalidIndexError(ValueError):
     pass
+
+
+class ReplicationLagError(RuntimeError):
+    pass
+
+
+class LockTimeoutError(RuntimeError):
+    pass
+
+
+class DuplicateValuesError(InvalidIndexError):
+    pass
+
+
+class TypeCastError(ValueError):
+    pass
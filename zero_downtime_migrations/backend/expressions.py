@@ -0,0 +1,21 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import hashlib
+
+
+class UpdateExpression(object):
+    """
+    SET (and optional WHERE) part of arbitrary batched update.
+    `column` is the name progress of update is journaled and
+    reported under, derived from sql if not given
+    """
+    def __init__(self, set_sql, where_sql=None, params=(), name=None):
+        self.set_sql = set_sql
+        self.where_sql = where_sql
+        self.params = list(params or ())
+        if name is None:
+            digest = hashlib.md5('{}|{}'.format(set_sql, where_sql or '').encode('utf-8')).hexdigest()
+            name = 'batched_update_{}'.format(digest[:8])
+        self.column = name
@@ -0,0 +1,79 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+from zero_downtime_migrations.backend.sql_template import (
+    SQL_CREATE_JOURNAL,
+    SQL_GET_JOURNAL_ENTRY,
+    SQL_JOURNAL_FINISH_ACTION,
+    SQL_JOURNAL_RECORD_BATCH,
+    SQL_JOURNAL_START_RANGE,
+    SQL_GET_JOURNAL_RANGES,
+    SQL_CLEAR_JOURNAL_ENTRY,
+)
+
+JournalEntry = namedtuple('JournalEntry', ['done_actions', 'last_pk', 'rows_updated', 'batches'])
+
+
+class Journal(object):
+    """
+    Ledger table in the target database remembering which add field
+    actions are finished and how far the update of existing rows got,
+    so a restarted migration continues from the exact batch. Every
+    primary key range of parallel update has its own entry
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.table_ready = False
+
+    def _execute(self, sql, params=(), fetchall=False):
+        if not self.table_ready:
+            self.table_ready = True
+            self._execute(SQL_CREATE_JOURNAL)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description:
+                return cursor.fetchall() if fetchall else cursor.fetchone()
+
+    def get(self, table, column):
+        row = self._execute(SQL_GET_JOURNAL_ENTRY, [table, column])
+        if row is not None:
+            return JournalEntry(*row)
+
+    def finish_action(self, table, column, action):
+        self._execute(SQL_JOURNAL_FINISH_ACTION, [table, column, action])
+
+    def record_batch(self, table, column, rows, last_pk=None):
+        """
+        Should be called in the batch transaction, so the journal
+        is updated if and only if the batch is committed
+        """
+        self._execute(SQL_JOURNAL_RECORD_BATCH, [table, column, last_pk, rows or 0])
+
+    @staticmethod
+    def range_key(column, pk_range):
+        return '{}:{}:{}'.format(column, pk_range[0], pk_range[1])
+
+    def start_ranges(self, table, column, ranges):
+        """
+        Save primary key ranges of parallel update before workers
+        start, so ranges nobody got to are not lost if it fails
+        """
+        for pk_range in ranges:
+            self._execute(SQL_JOURNAL_START_RANGE, [table, self.range_key(column, pk_range), pk_range[0]])
+
+    def ranges(self, table, column):
+        """
+        [((start_pk, end_pk), last_pk, rows_updated)] of parallel update
+        """
+        rows = self._execute(SQL_GET_JOURNAL_RANGES, [table, column, column], fetchall=True)
+        ranges = []
+        for key, last_pk, rows_updated in rows:
+            start_pk, end_pk = key[len(column) + 1:].split(':')
+            ranges.append(((int(start_pk), int(end_pk)), last_pk, rows_updated))
+        return sorted(ranges)
+
+    def clear(self, table, column):
+        self._execute(SQL_CLEAR_JOURNAL_ENTRY, [table, column, column, column])
@@ -0,0 +1,212 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import os
+import re
+import time
+import socket
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import Request, urlopen
+
+from zero_downtime_migrations.backend.batching import monotonic
+
+# DDL (or any other) statement run by schema editor, lock_wait is time lost
+# in lock timeouts and backoff before it got its lock (None if not guarded)
+StatementEvent = namedtuple('StatementEvent', ['sql', 'table', 'duration', 'lock_wait'])
+# committed batch of update, done is part of whole update from 0 to 1
+# (None if unknown) and eta is in seconds (None if unknown)
+BatchEvent = namedtuple('BatchEvent', ['table', 'column', 'rows', 'duration', 'done', 'eta'])
+# statement is retried after it could not get its lock in time
+RetryEvent = namedtuple('RetryEvent', ['sql', 'table', 'attempt', 'delay'])
+# concurrently built index was checked, invalid index is dropped
+IndexValidationEvent = namedtuple('IndexValidationEvent', ['index_name', 'table', 'valid', 'duration'])
+# sample of sessions blocked by migration connection, statement is query of migration at that time
+BlockedQueriesEvent = namedtuple('BlockedQueriesEvent', ['statement', 'sessions', 'max_wait'])
+
+
+class MetricsSink(object):
+    """
+    Receives events of schema editor. Sinks are shared by
+    parallel workers, so emit may be called from several threads
+    """
+    enabled = True
+
+    def emit(self, event):
+        pass
+
+    def flush(self):
+        """
+        Called when schema editor is done
+        """
+        pass
+
+
+class NullSink(MetricsSink):
+    """
+    Default sink, nothing is even built for it
+    """
+    enabled = False
+
+
+class MultiSink(MetricsSink):
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+
+class LoggingSink(MetricsSink):
+    def __init__(self, logger='zero_downtime_migrations', level=logging.INFO):
+        self.logger = logging.getLogger(logger) if not isinstance(logger, logging.Logger) else logger
+        self.level = level
+
+    def emit(self, event):
+        self.logger.log(self.level, '%s', event)
+
+
+def _metric_name(value):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', value)
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Counters and gauges in prometheus text format written to `path`
+    (for node exporter textfile collector, file is replaced atomically)
+    and/or pushed to pushgateway at `pushgateway_url` under `job`, at most
+    every `interval` seconds and when schema editor is done.
+    zero_downtime_migrations_last_event_timestamp_seconds can be used
+    to alert on migration which stalled
+    """
+    def __init__(self, path=None, pushgateway_url=None, job='zero_downtime_migrations',
+                 prefix='zero_downtime_migrations', interval=10.0, timeout=5.0):
+        self.path = path
+        self.pushgateway_url = pushgateway_url
+        self.job = job
+        self.prefix = prefix
+        self.interval = interval
+        self.timeout = timeout
+        self.metrics = OrderedDict()
+        self.last_flush = None
+        self.lock = threading.Lock()
+
+    def _add(self, kind, name, labels, value, increment=True):
+        key = ('{}_{}'.format(self.prefix, name), tuple(sorted(labels.items())))
+        self.metrics[key] = (kind, (self.metrics.get(key, (kind, 0))[1] if increment else 0) + value)
+
+    def emit(self, event):
+        with self.lock:
+            if isinstance(event, BatchEvent):
+                labels = {'table': event.table, 'column': event.column}
+                self._add('counter', 'batches_total', labels, 1)
+                self._add('counter', 'rows_updated_total', labels, event.rows or 0)
+                self._add('counter', 'batch_seconds_total', labels, event.duration)
+                self._add('gauge', 'batch_last_seconds', labels, event.duration, increment=False)
+                if event.done is not None:
+                    self._add('gauge', 'backfill_done_ratio', labels, event.done, increment=False)
+                if event.eta is not None:
+                    self._add('gauge', 'backfill_eta_seconds', labels, event.eta, increment=False)
+            elif isinstance(event, StatementEvent):
+                labels = {'table': event.table or ''}
+                self._add('counter', 'statements_total', labels, 1)
+                self._add('counter', 'statement_seconds_total', labels, event.duration)
+                if event.lock_wait is not None:
+                    self._add('counter', 'lock_wait_seconds_total', labels, event.lock_wait)
+            elif isinstance(event, RetryEvent):
+                self._add('counter', 'lock_retries_total', {'table': event.table or ''}, 1)
+            elif isinstance(event, IndexValidationEvent):
+                labels = {'table': event.table or '', 'valid': 'true' if event.valid else 'false'}
+                self._add('counter', 'index_validations_total', labels, 1)
+            elif isinstance(event, BlockedQueriesEvent):
+                self._add('gauge', 'blocked_sessions', {}, event.sessions, increment=False)
+                self._add('gauge', 'blocked_max_wait_seconds', {}, event.max_wait, increment=False)
+                self._add('counter', 'blocked_samples_total', {}, 1)
+            else:
+                self._add('counter', '{}_total'.format(_metric_name(type(event).__name__).lower()), {}, 1)
+            self._add('gauge', 'last_event_timestamp_seconds', {}, time.time(), increment=False)
+            if self.last_flush is None or monotonic() - self.last_flush >= self.interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def render(self):
+        lines = []
+        typed = set()
+        for (name, labels), (kind, value) in self.metrics.items():
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+            label_text = ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"'))
+                                  for key, value in labels)
+            lines.append('{}{} {!r}'.format(name, '{' + label_text + '}' if label_text else '', float(value)))
+        return '\n'.join(lines) + '\n'
+
+    def _flush(self):
+        self.last_flush = monotonic()
+        text = self.render()
+        try:
+            if self.path:
+                tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+                with open(tmp_path, 'w') as output:
+                    output.write(text)
+                os.rename(tmp_path, self.path)
+            if self.pushgateway_url:
+                request = Request('{}/metrics/job/{}'.format(self.pushgateway_url.rstrip('/'), self.job),
+                                  data=text.encode('utf-8'), headers={'Content-Type': 'text/plain; version=0.0.4'})
+                request.get_method = lambda: 'PUT'
+                urlopen(request, timeout=self.timeout).close()
+        except Exception as exc:
+            # metrics should never break the migration
+            print('Could not export metrics: {!r}'.format(exc))
+
+
+class StatsdSink(MetricsSink):
+    """
+    Send counters and timings to statsd over UDP as
+    <prefix>.<table>.<metric>, fire and forget
+    """
+    def __init__(self, host='localhost', port=8125, prefix='zero_downtime_migrations'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _send(self, *metrics):
+        try:
+            self.socket.sendto('\n'.join(metrics).encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+    def _name(self, table, metric):
+        return '.'.join([self.prefix, _metric_name(table or 'unknown'), metric])
+
+    def emit(self, event):
+        if isinstance(event, BatchEvent):
+            self._send('{}:1|c'.format(self._name(event.table, 'batches')),
+                       '{}:{}|c'.format(self._name(event.table, 'rows_updated'), event.rows or 0),
+                       '{}:{:.3f}|ms'.format(self._name(event.table, 'batch'), event.duration * 1000))
+        elif isinstance(event, StatementEvent):
+            metrics = ['{}:{:.3f}|ms'.format(self._name(event.table, 'statement'), event.duration * 1000)]
+            if event.lock_wait is not None:
+                metrics.append('{}:{:.3f}|ms'.format(self._name(event.table, 'lock_wait'), event.lock_wait * 1000))
+            self._send(*metrics)
+        elif isinstance(event, RetryEvent):
+            self._send('{}:1|c'.format(self._name(event.table, 'lock_retries')))
+        elif isinstance(event, IndexValidationEvent):
+            self._send('{}:1|c'.format(self._name(event.table, 'index_valid' if event.valid else 'index_invalid')))
+        elif isinstance(event, BlockedQueriesEvent):
+            self._send('{}.blocked_sessions:{}|g'.format(self.prefix, event.sessions),
+                       '{}.blocked_max_wait:{:.3f}|ms'.format(self.prefix, event.max_wait * 1000))
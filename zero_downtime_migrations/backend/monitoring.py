@@ -0,0 +1,156 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import threading
+from collections import namedtuple, OrderedDict
+
+from django.db import connections
+
+from zero_downtime_migrations.backend.batching import monotonic
+from zero_downtime_migrations.backend.metrics import BlockedQueriesEvent
+from zero_downtime_migrations.backend.sql_template import SQL_INDEX_BUILD_PROGRESS, SQL_BLOCKED_BY_BACKEND
+
+IndexBuildProgress = namedtuple('IndexBuildProgress', [
+    'index_name', 'phase',
+    'blocks_done', 'blocks_total',
+    'tuples_done', 'tuples_total',
+    'lockers_done', 'lockers_total', 'current_locker_pid',
+    'elapsed', 'eta',
+])
+
+BlockedQuery = namedtuple('BlockedQuery', ['pid', 'query', 'wait', 'statement'])
+
+
+class NullMonitor(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class IndexBuildMonitor(NullMonitor):
+    """
+    Poll pg_stat_progress_create_index (postgres 12+) every `interval` seconds
+    from a side connection while backend `pid` builds index and pass
+    IndexBuildProgress to `callback`. ETA is estimated for the current
+    phase only, from its throughput so far
+    """
+    def __init__(self, alias, pid, index_name, callback, interval):
+        self.alias = alias
+        self.pid = pid
+        self.index_name = index_name
+        self.callback = callback
+        self.interval = interval
+        self.started = None
+        self.phase_start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.started = monotonic()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # connections are thread local so this is a separate connection
+        connection = connections[self.alias]
+        try:
+            while not self._stop.wait(self.interval):
+                with connection.cursor() as cursor:
+                    cursor.execute(SQL_INDEX_BUILD_PROGRESS, [self.pid])
+                    row = cursor.fetchone()
+                if row is not None:
+                    self.callback(self.progress(row, monotonic()))
+        except Exception as exc:
+            # monitoring should never break the migration
+            print('Index build monitoring of {} stopped: {!r}'.format(self.index_name, exc))
+        finally:
+            connection.close()
+
+    def progress(self, row, now):
+        phase, blocks_done, blocks_total, tuples_done, tuples_total = row[:5]
+        if blocks_total:
+            done, total = blocks_done, blocks_total
+        else:
+            done, total = tuples_done, tuples_total
+        if self.phase_start is None or self.phase_start[0] != phase:
+            self.phase_start = (phase, now, done)
+        _, phase_started, phase_done = self.phase_start
+        eta = None
+        if total and done > phase_done and now > phase_started:
+            rate = (done - phase_done) / float(now - phase_started)
+            eta = (total - done) / rate
+        return IndexBuildProgress(self.index_name, *row, elapsed=now - self.started, eta=eta)
+
+
+class BlockedQueriesObserver(NullMonitor):
+    """
+    Every `interval` seconds look from a side connection for sessions
+    blocked by backend `pid` (directly or waiting in lock queue behind it)
+    and remember every blocked query with the longest wait seen and
+    the migration statement which blocked it. `callback` gets
+    BlockedQueriesEvent for every sample which found blocked sessions
+    """
+    def __init__(self, alias, pid, interval, callback=None):
+        self.alias = alias
+        self.pid = pid
+        self.interval = interval
+        self.callback = callback
+        self.blocked = OrderedDict()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # connections are thread local so this is a separate connection
+        connection = connections[self.alias]
+        try:
+            while not self._stop.wait(self.interval):
+                with connection.cursor() as cursor:
+                    cursor.execute(SQL_BLOCKED_BY_BACKEND, [self.pid, self.pid])
+                    self.record(cursor.fetchall())
+        except Exception as exc:
+            # monitoring should never break the migration
+            print('Blocked queries observing stopped: {!r}'.format(exc))
+        finally:
+            connection.close()
+
+    def record(self, rows):
+        self.samples += 1
+        for pid, query_start, query, wait, statement in rows:
+            key = (pid, query_start)
+            known = self.blocked.get(key)
+            if known is None or wait > known.wait:
+                self.blocked[key] = BlockedQuery(pid, query, wait, statement)
+        if rows and self.callback is not None:
+            statement = rows[0][4]
+            self.callback(BlockedQueriesEvent(statement, len(rows), max(row[3] for row in rows)))
+
+    def summary(self, limit=5):
+        if not self.blocked:
+            return 'No queries were blocked by migration ({} samples)'.format(self.samples)
+        blocked = sorted(self.blocked.values(), key=lambda query: -query.wait)
+        lines = ['{} queries were blocked by migration, longest for {:.1f}s:'.format(len(blocked), blocked[0].wait)]
+        for query in blocked[:limit]:
+            lines.append('  {:.1f}s pid {} "{}" blocked by "{}"'.format(
+                query.wait, query.pid, query.query, query.statement,
+            ))
+        return '\n'.join(lines)
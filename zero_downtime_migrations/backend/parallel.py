@@ -0,0 +1,57 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from django.db import connections
+
+
+def run_in_parallel(tasks, workers, alias, make_handler, stop_on_error=True):
+    """
+    Handle `tasks` from at most `workers` threads. Every thread calls
+    `make_handler()` once (e.g. to build its own schema editor, connections
+    are thread local so it gets its own connection to `alias`) and then
+    handler(task, stop) for every task it takes from the queue.
+    With `stop_on_error` the first error sets `stop` event and no new tasks
+    are taken, otherwise all tasks are handled. The first error is raised
+    when all threads are done
+    """
+    pending = queue.Queue()
+    for task in tasks:
+        pending.put(task)
+    stop = threading.Event()
+    errors = []
+
+    def worker():
+        try:
+            handler = make_handler()
+            while not stop.is_set():
+                try:
+                    task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    handler(task, stop)
+                except Exception as exc:
+                    errors.append(exc)
+                    if stop_on_error:
+                        stop.set()
+        except Exception as exc:
+            errors.append(exc)
+            stop.set()
+        finally:
+            connections[alias].close()
+
+    threads = [threading.Thread(target=worker) for _ in range(min(workers, len(tasks)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import threading
+
+from zero_downtime_migrations.backend.batching import monotonic
+
+
+class BackfillProgress(object):
+    """
+    Remaining work of update of existing rows derived from the
+    backfill's own state: primary key position against max primary
+    key if table is walked by ranges, rows updated against estimated
+    total otherwise. Counters are updated by every batch (from any
+    worker thread), so reading figures never touches the table
+    """
+    def __init__(self, table, column, total, min_pk=None, max_pk=None, start_pk=None, rows_updated=0):
+        self.table = table
+        self.column = column
+        self.total = total or 0
+        self.min_pk = min_pk
+        self.max_pk = max_pk
+        self.rows_updated = rows_updated or 0
+        self.batches = 0
+        # primary keys (max_pk - min_pk + 1 in total) already walked over
+        self.pks_done = 0
+        if min_pk is not None and start_pk is not None:
+            self.pks_done = max(start_pk - min_pk + 1, 0)
+        self.started = monotonic()
+        # work done before, e.g. by interrupted run, does not tell the speed
+        self.initial_done = self.done
+        self.lock = threading.Lock()
+
+    def record(self, rows, start_pk=None, end_pk=None):
+        with self.lock:
+            self.rows_updated += rows or 0
+            self.batches += 1
+            if start_pk is not None and end_pk is not None:
+                self.pks_done += end_pk - start_pk
+
+    @property
+    def done(self):
+        """
+        Finished part of work from 0 to 1, None if unknown
+        """
+        if self.min_pk is not None and self.max_pk is not None:
+            return min(float(self.pks_done) / max(self.max_pk - self.min_pk + 1, 1), 1.0)
+        if self.total > 0:
+            return min(float(self.rows_updated) / self.total, 1.0)
+        return None
+
+    @property
+    def remaining(self):
+        """
+        Estimated number of rows still to go through
+        """
+        done = self.done
+        if done is None:
+            return None
+        if self.min_pk is not None:
+            return int(round(self.total * (1 - done)))
+        return max(self.total - self.rows_updated, 0)
+
+    @property
+    def eta(self):
+        """
+        Seconds left if work goes on with the same speed
+        """
+        done, initial_done = self.done, self.initial_done or 0
+        if done is None or done <= initial_done:
+            return None
+        return (monotonic() - self.started) / (done - initial_done) * (1 - done)
+
+    def __str__(self):
+        done, eta = self.done, self.eta
+        return '{} rows updated, {} done, ~{} rows left, eta {}'.format(
+            self.rows_updated,
+            '?' if done is None else '{:.1%}'.format(done),
+            '?' if done is None else self.remaining,
+            '?' if eta is None else '{:.0f}s'.format(eta),
+        )
@@ -2,9 +2,14 @@
 
 from __future__ import unicode_literals
 
+import os
 import re
+import copy
 import sys
+import time
 import inspect
+import functools
+from collections import OrderedDict
 
 from packaging.version import Version
 
@@ -14,28 +19,146 @@ except ImportError:
     from django.db.backends.postgresql_psycopg2.schema import DatabaseSchemaEditor as BaseEditor
 
 import django
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
 from django.db.models.fields import NOT_PROVIDED
 from django.db.models.fields.related import RelatedField
-from django.db import transaction
+from django.db import connections, transaction
+from django.db.backends.utils import truncate_name
 from django.db.migrations.questioner import InteractiveMigrationQuestioner
+from django.utils.module_loading import import_string
 
 from zero_downtime_migrations.backend.sql_template import (
-    SQL_ESTIMATE_COUNT_IN_TABLE,
+    SQL_ESTIMATE_COUNT_BY_PAGES,
     SQL_CHECK_COLUMN_STATUS,
-    SQL_COUNT_IN_TABLE,
+    SQL_SAMPLE_COUNT_IN_TABLE,
     SQL_COUNT_IN_TABLE_WITH_NULL,
+    SQL_COUNT_IN_TABLE_WITH_NULL_BY_PK_RANGE,
+    SQL_ESTIMATE_COUNT_IN_TABLE_WITH_NULL,
     SQL_UPDATE_BATCH,
     SQL_CREATE_UNIQUE_INDEX,
     SQL_ADD_UNIQUE_CONSTRAINT_FROM_INDEX,
     SQL_CHECK_INDEX_STATUS,
+    SQL_PK_RANGE,
+    SQL_UPDATE_BATCH_BY_PK_RANGE,
+    SQL_PK_HISTOGRAM_BOUNDS,
+    SQL_SET_LOCK_TIMEOUT,
+    SQL_RESET_LOCK_TIMEOUT,
+    SQL_HELD_TABLE_LOCKS,
+    SQL_CHECK_CONSTRAINT_EXISTS,
+    SQL_ADD_NOT_NULL_CHECK,
+    SQL_VALIDATE_CONSTRAINT,
+    SQL_DROP_CONSTRAINT,
+    SQL_SELECT_BATCH_FOR_UPDATE,
+    SQL_SELECT_BATCH_BY_PK_RANGE_FOR_UPDATE,
+    SQL_CREATE_BACKFILL_VALUES,
+    SQL_COPY_BACKFILL_VALUES,
+    SQL_UPDATE_BATCH_FROM_VALUES,
+    SQL_DROP_BACKFILL_VALUES,
+    SQL_TRUNCATE_BACKFILL_VALUES,
+    SQL_UPDATE_EXPRESSION_BY_PK_RANGE,
+    SQL_ANALYZE_TABLE,
+    SQL_ANALYZE_COLUMN,
+    SQL_ADD_SHADOW_COLUMN,
+    SQL_CREATE_SYNC_FUNCTION,
+    SQL_CREATE_SYNC_TRIGGER,
+    SQL_TRIGGER_EXISTS,
+    SQL_BINARY_COERCIBLE,
+    SQL_CHECK_CAST_BY_PK_RANGE,
+    SQL_COLUMN_CHECK_CONSTRAINTS,
+    SQL_DROP_TRIGGER,
+    SQL_DROP_FUNCTION,
+    SQL_INDEX_VALIDITY,
+    SQL_COLUMN_INDEXES,
+    SQL_ADD_CHECK_NOT_VALID,
+    SQL_LOCK_TABLE,
+    SQL_LOCK_TABLE_FOR_WRITES,
+    SQL_DROP_COLUMN,
+    SQL_RENAME_COLUMN,
+    SQL_RENAME_INDEX,
+    SQL_RENAME_CONSTRAINT,
+    SQL_SAMPLE_DUPLICATES,
+    SQL_FIND_DUPLICATES,
+    SQL_TABLE_IS_PARTITIONED,
+    SQL_PARTITIONS,
+    SQL_ATTACH_INDEX_PARTITION,
 )
 
-from zero_downtime_migrations.backend.exceptions import InvalidIndexError
+from zero_downtime_migrations.backend.batching import (
+    BatchSizeController,
+    AdaptiveBatchSizeController,
+    monotonic,
+)
+from zero_downtime_migrations.backend.catalog import CatalogCache
+from zero_downtime_migrations.backend.conf import SETTINGS_PREFIX, get_setting
+from zero_downtime_migrations.backend.defaults import PerRowDefault
+from zero_downtime_migrations.backend.exceptions import (
+    DuplicateValuesError,
+    InvalidIndexError,
+    LockTimeoutError,
+    TypeCastError,
+)
+from zero_downtime_migrations.backend.expressions import UpdateExpression
+from zero_downtime_migrations.backend.journal import Journal
+from zero_downtime_migrations.backend.metrics import (
+    NullSink,
+    MultiSink,
+    StatementEvent,
+    BatchEvent,
+    RetryEvent,
+    IndexValidationEvent,
+)
+from zero_downtime_migrations.backend.monitoring import BlockedQueriesObserver, IndexBuildMonitor, NullMonitor
+from zero_downtime_migrations.backend.parallel import run_in_parallel
+from zero_downtime_migrations.backend.progress import BackfillProgress
+from zero_downtime_migrations.backend.throttling import (
+    DeadTuplesThrottle,
+    ReplicationLagThrottle,
+    dead_tuples,
+    exponential_backoff,
+    replication_lag_bytes,
+    vacuum_table,
+)
 
 DJANGO_VERISON = Version(django.get_version())
 TABLE_SIZE_FOR_MAX_BATCH = 500000
 MAX_BATCH_SIZE = 10000
 MIN_BATCH_SIZE = 1000
+BATCH_TARGET_DURATION = 1.0
+BATCH_MAX_LOCK_DURATION = 5.0
+REPLICATION_LAG_CHECK_INTERVAL = 1.0
+DEAD_TUPLES_CHECK_INTERVAL = 5.0
+LOCK_TIMEOUT_RETRIES = 5
+LOCK_TIMEOUT_BACKOFF = 1.0
+LOCK_TIMEOUT_MAX_BACKOFF = 30.0
+LOCK_TIMEOUT_BUDGET = 300.0
+INDEX_PROGRESS_INTERVAL = 10.0
+COUNT_SAMPLE_PAGES = 1000
+COUNT_CHUNK_SIZE = 100000
+COUNT_CHUNK_PAUSE = 0.1
+BACKFILL_VALUES_TABLE = 'zero_downtime_migrations_backfill'
+UNIQUE_PRECHECK_SAMPLE_PERCENT = 1.0
+UNIQUE_PRECHECK_LIMIT = 10
+# Statements which take ACCESS EXCLUSIVE (or close to it) lock on the table
+LOCK_TAKING_SQL = r'\s*(ALTER\s+TABLE|DROP\s+TABLE|LOCK\s+TABLE|TRUNCATE|CREATE\s+TRIGGER|DROP\s+TRIGGER)\b'
+# lock_not_available
+LOCK_NOT_AVAILABLE = '55P03'
+# column type with optional length or precision, like varchar(100) or numeric(10, 2)
+COLUMN_TYPE_RE = re.compile(r'^(?P<name>[^(]+?)\s*(\((?P<modifier>[^)]*)\))?$')
+# types whose length or precision grows without table rewrite
+TYPES_WITH_WIDENING_MODIFIER = ('varchar', 'numeric')
+
+RESUME_POLICY_ASK = 'ask'
+RESUME_POLICY_RESUME = 'resume'
+RESUME_POLICY_RESTART = 'restart'
+RESUME_POLICY_FAIL = 'fail'
+RESUME_POLICY_MARK_DONE = 'mark-done'
+
+BACKFILL_MODE_NULL_SCAN = 'null_scan'
+BACKFILL_MODE_PK_RANGE = 'pk_range'
+
+UNIQUE_PRECHECK_SAMPLE = 'sample'
+UNIQUE_PRECHECK_FULL = 'full'
 
 _getargspec = getattr(inspect, 'getfullargspec', getattr(inspect, 'getargspec', None))
 
@@ -52,6 +175,24 @@ class ZeroDownTimeMixin(object):
         'drop column and run migration from standard SchemaEditor',
     )
 
+    RESUME_POLICY_CHOICES = {
+        RESUME_POLICY_FAIL: 1,
+        RESUME_POLICY_RESTART: 2,
+        RESUME_POLICY_RESUME: 3,
+        RESUME_POLICY_MARK_DONE: 5,
+    }
+
+    # django db_type -> information_schema.columns.data_type
+    COLUMN_TYPE_ALIASES = {
+        'varchar': 'character varying',
+        'char': 'character',
+        'serial': 'integer',
+        'bigserial': 'bigint',
+        'smallserial': 'smallint',
+        'timestamp': 'timestamp without time zone',
+        'time': 'time without time zone',
+    }
+
     ADD_FIELD_WITH_DEFAULT_ACTIONS = [
         'add field with default',
         'update existing rows',
@@ -59,7 +200,18 @@ class ZeroDownTimeMixin(object):
         'drop default',
     ]
 
+    ALTER_COLUMN_TYPE_ACTIONS = [
+        'add shadow column',
+        'create sync trigger',
+        'copy existing rows',
+        'create shadow indexes',
+        'validate shadow constraints',
+        'swap columns',
+    ]
+
     def alter_field(self, model, old_field, new_field, strict=False):
+        if self._online_type_change_supported(model, old_field, new_field):
+            return self.alter_column_type_online(model, old_field, new_field)
 
         if DJANGO_VERISON >= Version('2.1'):
             from django.db.backends.ddl_references import IndexName
@@ -74,9 +226,392 @@ class ZeroDownTimeMixin(object):
 
         return super(ZeroDownTimeMixin, self).alter_field(model, old_field, new_field, strict=strict)
 
+    def _online_type_change_supported(self, model, old_field, new_field):
+        """
+        Only type of the column changes (and maybe its nullability), change
+        rewrites the table, column is not a key and table can be walked by
+        integer primary key
+        """
+        if not get_setting('ALTER_TYPE_ONLINE', False):
+            return False
+        old_type = old_field.db_parameters(connection=self.connection)['type']
+        new_type = new_field.db_parameters(connection=self.connection)['type']
+        return (old_type is not None and new_type is not None and old_type != new_type and
+                old_field.column == new_field.column and
+                not old_field.primary_key and not new_field.primary_key and
+                not isinstance(old_field, RelatedField) and not isinstance(new_field, RelatedField) and
+                old_field.unique == new_field.unique and
+                old_field.db_index == new_field.db_index and
+                self._pk_walkable(model) and
+                self._type_change_rewrites(old_type, new_type))
+
+    def _type_change_rewrites(self, old_type, new_type):
+        """
+        Postgres keeps the table as is if types are binary coercible (e.g.
+        varchar to text) and new type has no length limit, or length of
+        varchar or precision of numeric with the same scale only grows
+        """
+        old_match = COLUMN_TYPE_RE.match(old_type.strip().lower())
+        new_match = COLUMN_TYPE_RE.match(new_type.strip().lower())
+        if old_match is None or new_match is None:
+            return True
+        old_name, new_name = old_match.group('name'), new_match.group('name')
+        if old_name != new_name:
+            with self.connection.cursor() as cursor:
+                cursor.execute(SQL_BINARY_COERCIBLE % {"old_type": old_name, "new_type": new_name})
+                if cursor.fetchone() is None:
+                    return True
+        new_modifier = new_match.group('modifier')
+        if new_modifier is None:
+            return False
+        old_modifier = old_match.group('modifier')
+        if old_modifier is None or old_name != new_name or new_name not in TYPES_WITH_WIDENING_MODIFIER:
+            return True
+        try:
+            old_args = [int(arg) for arg in old_modifier.split(',')]
+            new_args = [int(arg) for arg in new_modifier.split(',')]
+        except ValueError:
+            return True
+        # precision and scale (0 if omitted) for numeric, length for varchar
+        old_args, new_args = old_args + [0], new_args + [0]
+        return new_args[0] < old_args[0] or new_args[1] != old_args[1]
+
+    def _shadow_field(self, field):
+        """
+        Copy of `field` for the column of the new type, which
+        is nullable till it replaces the original column
+        """
+        shadow = copy.copy(field)
+        shadow.column = truncate_name('{}_zdm_new'.format(field.column), self.connection.ops.max_name_length())
+        shadow.null = True
+        return shadow
+
+    def _sync_trigger_names(self, table, column):
+        """
+        (trigger, function) names for copying column to its shadow
+        """
+        name = truncate_name('{}_{}_zdm_sync'.format(table, column), self.connection.ops.max_name_length())
+        return name, name
+
+    def alter_column_type_online(self, model, old_field, new_field):
+        """
+        Change column type without rewriting the table under ACCESS EXCLUSIVE
+        lock: add shadow column of the new type, keep it in sync with the
+        column by trigger, copy existing rows by primary key ranges, build
+        copies of column indexes concurrently, validate not null and check
+        constraints and finally swap columns in one short transaction.
+        Finished actions are journaled the same way as for add field
+        """
+        actions = self.get_type_change_actions(model, old_field, new_field)
+        if not actions:
+            return
+        self.check_column_constraints(model, old_field)
+        shadow = self._shadow_field(new_field)
+
+        atomic = getattr(self, 'atomic_migration', True)
+        if self.connection.in_atomic_block:
+            self.atomic.__exit__(None, None, None)
+
+        journal = self.get_journal()
+        for action in actions:
+            func = getattr(self, '_'.join(action.split()))
+            func(model=model, old_field=old_field, new_field=new_field, shadow=shadow)
+            if journal is not None:
+                journal.finish_action(model._meta.db_table, shadow.column, action)
+        if journal is not None:
+            # shadow column name is used again by the next type change
+            journal.clear(model._meta.db_table, shadow.column)
+
+        if atomic:
+            self.atomic = transaction.atomic(self.connection.alias)
+            self.atomic.__enter__()
+
+    def get_type_change_actions(self, model, old_field, new_field):
+        """
+        All actions if there is no shadow column yet, ones left after
+        the previous run otherwise (by journal if it's on, all but adding
+        shadow column if not, since the rest of them can be repeated).
+        Nothing is left if column already has the new type
+        """
+        actions = self.ALTER_COLUMN_TYPE_ACTIONS
+        shadow = self._shadow_field(new_field)
+        table = model._meta.db_table
+        column_info = self.get_column_info(model, old_field)
+        if column_info is not None and not self._column_type_matches(column_info[1], old_field) and \
+                self._column_type_matches(column_info[1], new_field):
+            print('Column "{}" in table "{}" already has type "{}"'.format(old_field.column, table, column_info[1]))
+            return []
+        journal = self.get_journal()
+        if self.get_column_info(model, shadow) is None:
+            if journal is not None:
+                # Entry left from column which does not exist anymore
+                journal.clear(table, shadow.column)
+            return actions
+        if journal is not None:
+            entry = journal.get(table, shadow.column)
+            if entry is not None:
+                return [action for action in actions if action not in entry.done_actions]
+        print('Column "{}" in table "{}" is left from previous run, continuing'.format(shadow.column, table))
+        return actions[1:]
+
+    def add_shadow_column(self, model, old_field, new_field, shadow):
+        self.execute(SQL_ADD_SHADOW_COLUMN % {
+            "table": self.quote_name(model._meta.db_table),
+            "shadow": self.quote_name(shadow.column),
+            "type": new_field.db_parameters(connection=self.connection)['type'],
+        })
+
+    def create_sync_trigger(self, model, old_field, new_field, shadow):
+        """
+        Every inserted or updated row gets its column
+        copied to shadow column in the same statement
+        """
+        table = model._meta.db_table
+        trigger, function = self._sync_trigger_names(table, old_field.column)
+        exists_sql = SQL_TRIGGER_EXISTS % {"table": table, "trigger": trigger}
+        trigger_exists = self.parse_cursor_result(self.get_query_result(exists_sql), collect_sql_value=None)
+        if not trigger_exists:
+            self.check_cast(model, old_field, new_field)
+        self.execute(SQL_CREATE_SYNC_FUNCTION % {
+            "function": self.quote_name(function),
+            "shadow": self.quote_name(shadow.column),
+            "column": self.quote_name(old_field.column),
+            "type": new_field.db_parameters(connection=self.connection)['type'],
+        })
+        if not trigger_exists:
+            self.execute(SQL_CREATE_SYNC_TRIGGER % {
+                "trigger": self.quote_name(trigger),
+                "table": self.quote_name(table),
+                "function": self.quote_name(function),
+            })
+
+    def check_cast(self, model, old_field, new_field):
+        """
+        Make sure every value of the column can be cast to the new type
+        before trigger casts it on every write to the table, since failed
+        cast would fail writes of the application instead of migration.
+        Table is read by primary key ranges of batch size, each range in
+        its own short transaction
+        """
+        if self.collect_sql:
+            return
+        min_pk, max_pk = self.get_pk_range(model)
+        if min_pk is None:
+            return
+        new_type = new_field.db_parameters(connection=self.connection)['type']
+        batch_size = self.get_objects_in_batch_count(self.count_objects_in_table(model=model))
+        start = min_pk
+        while start <= max_pk:
+            try:
+                # failed check should not leave connection in failed transaction
+                with transaction.atomic(self.connection.alias):
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(SQL_CHECK_CAST_BY_PK_RANGE % {
+                            "table": self.quote_name(model._meta.db_table),
+                            "pk_column_name": self.get_pk_column_name(model),
+                            "min_pk": start,
+                            "max_pk": start + batch_size,
+                            "column": self.quote_name(old_field.column),
+                            "type": new_type,
+                        })
+            except django.db.utils.DataError as exc:
+                raise TypeCastError('Column "{}" of table "{}" has values which can not be cast to "{}": {}'.format(
+                    old_field.column, model._meta.db_table, new_type, exc,
+                ))
+            start += batch_size
+
+    def check_column_constraints(self, model, old_field):
+        """
+        Check constraints on the column besides the ones this editor
+        makes for the new type are dropped together with the column
+        on swap, so such column can't be changed online
+        """
+        if self.collect_sql:
+            return
+        table = model._meta.db_table
+        known = {self._type_check_name(table, old_field.column), self._not_null_check_name(table, old_field.column)}
+        with self.connection.cursor() as cursor:
+            cursor.execute(SQL_COLUMN_CHECK_CONSTRAINTS % {"table": table, "column": old_field.column})
+            constraints = [name for name, in cursor.fetchall() if name not in known]
+        if constraints:
+            raise ValueError('Check constraints {} on column "{}" can not be copied to shadow column'.format(
+                ', '.join('"{}"'.format(name) for name in constraints), old_field.column,
+            ))
+
+    def copy_existing_rows(self, model, old_field, new_field, shadow):
+        """
+        Copy rows which are not synced by trigger yet by primary key
+        ranges, with the same batching, throttling, parallel workers,
+        journal and progress as update of existing rows for new field
+        """
+        column = self.quote_name(old_field.column)
+        expression = UpdateExpression(
+            set_sql='{} = {}::{}'.format(self.quote_name(shadow.column), column,
+                                        new_field.db_parameters(connection=self.connection)['type']),
+            where_sql='{} IS NULL AND {} IS NOT NULL'.format(self.quote_name(shadow.column), column),
+            name=shadow.column,
+        )
+        objects_in_table = self.count_objects_in_table(model=model)
+        if objects_in_table > 0:
+            self.update_existing_rows_by_pk_range(
+                model=model, field=expression,
+                objects_in_batch_count=self.get_objects_in_batch_count(objects_in_table),
+                value=expression,
+                total=objects_in_table,
+            )
+            self.analyze_after_backfill(model, shadow.column)
+
+    def get_column_indexes(self, model, column):
+        """
+        [(index_name, definition, constraint_name, constraint_type)]
+        of indexes which depend on `column`, except primary key
+        """
+        sql = SQL_COLUMN_INDEXES % {"table": model._meta.db_table, "column": column}
+        if self.collect_sql:
+            self.execute(sql)
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    def _shadow_index_name(self, index_name):
+        return truncate_name('{}_zdm_new'.format(index_name), self.connection.ops.max_name_length())
+
+    def _replace_column(self, sql, column, new_column):
+        """
+        Replace column, quoted or not, in index definition or
+        check expression, function calls are left alone
+        """
+        pattern = r'(?<![\w."])(?:"{0}"|{0})(?![\w"(])'.format(re.escape(column))
+        return re.sub(pattern, lambda match: self.quote_name(new_column), sql)
+
+    def _shadow_index_sql(self, definition, table, column, shadow_column, index_name):
+        """
+        Index definition from pg_get_indexdef rewritten to build
+        the same index on shadow column concurrently
+        """
+        match = re.match(r'CREATE (?P<unique>UNIQUE )?INDEX \S+ ON (ONLY )?\S+ USING (?P<rest>.+)$', definition)
+        return 'CREATE {}INDEX CONCURRENTLY {} ON {} USING {}'.format(
+            match.group('unique') or '', self.quote_name(index_name), self.quote_name(table),
+            self._replace_column(match.group('rest'), column, shadow_column),
+        )
+
+    def create_shadow_indexes(self, model, old_field, new_field, shadow):
+        """
+        Build copy of every index of the column for shadow column,
+        exclusion constraints can't be moved this way
+        """
+        for index_name, definition, constraint_name, constraint_type in self.get_column_indexes(model,
+                                                                                               old_field.column):
+            if constraint_type == 'x':
+                raise ValueError('Exclusion constraint "{}" on column "{}" can not be copied to shadow column'.format(
+                    constraint_name, old_field.column,
+                ))
+            shadow_index_name = self._shadow_index_name(index_name)
+            validity_sql = SQL_INDEX_VALIDITY % {"name": shadow_index_name}
+            valid = self.parse_cursor_result(self.get_query_result(validity_sql), collect_sql_value=None)
+            if valid:
+                continue
+            if valid is False:
+                # left by build which was killed, it must not replace the index of the column
+                print('Index "{}" is left invalid from previous run, building it again'.format(shadow_index_name))
+                self.execute(self.sql_delete_index % {'name': self.quote_name(shadow_index_name)})
+            self.execute(self._shadow_index_sql(definition, model._meta.db_table, old_field.column, shadow.column,
+                                                shadow_index_name))
+
+    def _type_check_name(self, table, column):
+        return truncate_name('{}_{}_check'.format(table, column), self.connection.ops.max_name_length())
+
+    def validate_shadow_constraints(self, model, old_field, new_field, shadow):
+        """
+        Not null and check constraint of the new type are added
+        NOT VALID and validated without blocking writes, so swap
+        does not scan the table
+        """
+        table = model._meta.db_table
+        constraints = []
+        if not new_field.null:
+            constraints.append((self._not_null_check_name(table, shadow.column),
+                                '{} IS NOT NULL'.format(self.quote_name(shadow.column))))
+        check = new_field.db_parameters(connection=self.connection)['check']
+        if check:
+            constraints.append((self._type_check_name(table, shadow.column),
+                                self._replace_column(check, new_field.column, shadow.column)))
+        for name, check in constraints:
+            check_sql = SQL_CHECK_CONSTRAINT_EXISTS % {"name": name}
+            if not self.parse_cursor_result(self.get_query_result(check_sql), collect_sql_value=None):
+                self.execute(SQL_ADD_CHECK_NOT_VALID % {
+                    "table": self.quote_name(table),
+                    "name": self.quote_name(name),
+                    "check": check,
+                })
+            self.execute(SQL_VALIDATE_CONSTRAINT % {
+                "table": self.quote_name(table),
+                "name": self.quote_name(name),
+            })
+
+    def swap_columns(self, model, old_field, new_field, shadow):
+        """
+        Replace column with shadow column in one transaction holding
+        ACCESS EXCLUSIVE lock only for catalog changes: indexes and
+        constraints of the old column are dropped with it, their copies
+        get its names. Not null is set by validated check since postgres
+        12, on older versions the check is kept instead
+        """
+        table = model._meta.db_table
+        trigger, function = self._sync_trigger_names(table, old_field.column)
+        indexes = self.get_column_indexes(model, old_field.column)
+        quoted_table = self.quote_name(table)
+        with transaction.atomic(self.connection.alias):
+            self.execute(SQL_LOCK_TABLE % {"table": quoted_table})
+            self.execute(SQL_DROP_TRIGGER % {"trigger": self.quote_name(trigger), "table": quoted_table})
+            self.execute(SQL_DROP_COLUMN % {"table": quoted_table, "column": self.quote_name(old_field.column)})
+            self.execute(SQL_RENAME_COLUMN % {
+                "table": quoted_table,
+                "old_column": self.quote_name(shadow.column),
+                "new_column": self.quote_name(new_field.column),
+            })
+            for index_name, definition, constraint_name, constraint_type in indexes:
+                self.execute(SQL_RENAME_INDEX % {
+                    "old_name": self.quote_name(self._shadow_index_name(index_name)),
+                    "new_name": self.quote_name(index_name),
+                })
+                if constraint_type == 'u':
+                    self.execute(SQL_ADD_UNIQUE_CONSTRAINT_FROM_INDEX % {
+                        "table": quoted_table,
+                        "name": self.quote_name(constraint_name),
+                        "index_name": self.quote_name(index_name),
+                    })
+            if new_field.db_parameters(connection=self.connection)['check']:
+                self.execute(SQL_RENAME_CONSTRAINT % {
+                    "table": quoted_table,
+                    "old_name": self.quote_name(self._type_check_name(table, shadow.column)),
+                    "new_name": self.quote_name(self._type_check_name(table, new_field.column)),
+                })
+            not_null_check = self._not_null_check_name(table, shadow.column)
+            if not new_field.null and self.connection.pg_version >= 120000:
+                self.execute_alter_column(model, self.generate_set_not_null(new_field))
+                self.execute(SQL_DROP_CONSTRAINT % {"table": quoted_table, "name": self.quote_name(not_null_check)})
+            elif not new_field.null:
+                self.execute(SQL_RENAME_CONSTRAINT % {
+                    "table": quoted_table,
+                    "old_name": self.quote_name(not_null_check),
+                    "new_name": self.quote_name(self._not_null_check_name(table, new_field.column)),
+                })
+            self.execute(SQL_DROP_FUNCTION % {"function": self.quote_name(function)})
+
+    @property
+    def sql_create_fk(self):
+        sql = super(ZeroDownTimeMixin, self).sql_create_fk
+        if get_setting('FOREIGN_KEYS', False):
+            # Constraint is validated by separate statement, see execute
+            sql += ' NOT VALID'
+        return sql
+
     def _field_supported(self, field):
         supported = True
-        if isinstance(field, RelatedField):
+        if isinstance(field, RelatedField) and not (
+                isinstance(field, models.ForeignKey) and get_setting('FOREIGN_KEYS', False)):
             supported = False
         elif field.default is NOT_PROVIDED:
             supported = False
@@ -99,8 +634,20 @@ class ZeroDownTimeMixin(object):
         if not actions:
             return
 
+        if actions == self.ADD_FIELD_WITH_DEFAULT_ACTIONS and self._fast_default_supported(field):
+            # Column with constant default is added without rewriting table
+            super(ZeroDownTimeMixin, self).add_field(model, field)
+            journal = self.get_journal()
+            if journal is not None:
+                for action in actions:
+                    journal.finish_action(model._meta.db_table, field.column, action)
+            return
+
         # Saving initial values
         default_effective_value = self.effective_default(field)
+        default_factory = None
+        if self._per_row_default(field):
+            default_factory = PerRowDefault(copy.copy(field), self.effective_default)
         nullable = field.null
         # Update the values to the required ones
         field.default = None if DJANGO_VERISON < Version('1.11') else NOT_PROVIDED
@@ -123,15 +670,18 @@ class ZeroDownTimeMixin(object):
             'field': field,
             'nullable': nullable,
             'default_effective_value': default_effective_value,
+            'default_factory': default_factory,
         }
+        journal = self.get_journal()
         # Performing needed actions
         for action in actions:
-            action = '_'.join(action.split())
-            func = getattr(self, action)
+            func = getattr(self, '_'.join(action.split()))
             func_args = {arg: available_args[arg] for arg in
                          _getargspec(func).args if arg != 'self'
                          }
             func(**func_args)
+            if journal is not None:
+                journal.finish_action(model._meta.db_table, field.column, action)
 
         # If migrations was atomic=True initially
         # entering atomic block again
@@ -139,46 +689,527 @@ class ZeroDownTimeMixin(object):
             self.atomic = transaction.atomic(self.connection.alias)
             self.atomic.__enter__()
 
-    def add_field_with_default(self, model, field, default_effective_value):
+    def _fast_default_supported(self, field):
+        """
+        Since postgres 11 adding column with non-volatile default is
+        catalog only change. Callable defaults and auto_now fields are
+        expected to differ from row to row, so they are still batched
+        """
+        return (get_setting('FAST_DEFAULT', False) and
+                self.connection.pg_version >= 110000 and
+                not callable(field.default) and
+                not getattr(field, 'auto_now', False) and
+                not getattr(field, 'auto_now_add', False))
+
+    def _per_row_default(self, field):
+        """
+        Callable default is evaluated for every existing row if
+        ZERO_DOWNTIME_MIGRATIONS_CALLABLE_DEFAULT_PER_ROW is on
+        """
+        return get_setting('CALLABLE_DEFAULT_PER_ROW', False) and callable(field.default)
+
+    def add_field_with_default(self, model, field, default_effective_value, default_factory=None):
         """
         Adding field with default in two separate
         operations, so we can avoid rewriting the
-        whole table
+        whole table. Default evaluated per row is not
+        set on column, otherwise every new row would get the same value
         """
         with transaction.atomic():
             super(ZeroDownTimeMixin, self).add_field(model, field)
-            self.add_default(model, field, default_effective_value)
+            if default_factory is None:
+                self.add_default(model, field, default_effective_value)
 
-    def update_existing_rows(self, model, field, default_effective_value):
+    def update_existing_rows(self, model, field, default_effective_value, default_factory=None):
         """
         Updating existing rows in table by (relatively) small batches
         to avoid long locks on table
         """
         if default_effective_value is None:
             return
+        if default_factory is not None:
+            default_effective_value = default_factory
         objects_in_table = self.count_objects_in_table(model=model)
         if objects_in_table > 0:
             objects_in_batch_count = self.get_objects_in_batch_count(objects_in_table)
-            while True:
-                with transaction.atomic():
-                    updated = self.update_batch(model=model, field=field,
-                                                objects_in_batch_count=objects_in_batch_count,
-                                                value=default_effective_value,
-                                                )
-                    print('Update {} rows in {}'.format(updated, model._meta.db_table))
-                    if updated is None or updated == 0:
-                        break
-
-    def set_not_null_for_field(self, model, field, nullable):
+            if self.get_backfill_mode(model) == BACKFILL_MODE_PK_RANGE:
+                self.update_existing_rows_by_pk_range(
+                    model=model, field=field,
+                    objects_in_batch_count=objects_in_batch_count,
+                    value=default_effective_value,
+                    total=objects_in_table,
+                )
+                if default_factory is not None:
+                    # column has no default, so rows inserted above max pk
+                    # during the walk are still null
+                    self.update_null_rows(model=model, field=field,
+                                          objects_in_batch_count=objects_in_batch_count,
+                                          value=default_effective_value,
+                                          progress=self._backfill_progress,
+                                          )
+            else:
+                journal = self.get_journal()
+                entry = journal.get(model._meta.db_table, field.column) if journal is not None else None
+                self.update_null_rows(model=model, field=field,
+                                      objects_in_batch_count=objects_in_batch_count,
+                                      value=default_effective_value,
+                                      progress=BackfillProgress(
+                                          model._meta.db_table, field.column, objects_in_table,
+                                          rows_updated=entry.rows_updated if entry is not None else 0,
+                                      ),
+                                      )
+            if default_factory is not None:
+                self.drop_backfill_values()
+            self.analyze_after_backfill(model, field.column)
+
+    def update_null_rows(self, model, field, objects_in_batch_count, value, progress):
+        """
+        Update batches of rows where column is null till there are none
+        """
+        batch_size = self.get_batch_size_controller(objects_in_batch_count)
+        throttles = self.get_throttles(model)
+        journal = self.get_journal()
+        self._backfill_progress = progress
+        while True:
+            started = monotonic()
+            with transaction.atomic(self.connection.alias):
+                updated = self.update_batch(model=model, field=field,
+                                            objects_in_batch_count=batch_size.size,
+                                            value=value,
+                                            )
+                if updated is None or updated == 0:
+                    break
+                if journal is not None:
+                    journal.record_batch(model._meta.db_table, field.column, rows=updated)
+            duration = monotonic() - started
+            progress.record(updated)
+            self.report_batch(model._meta.db_table, field.column, updated, duration, progress)
+            batch_size.record(updated, duration)
+            self.wait_for_throttles(throttles)
+
+    def batched_update(self, model, set_sql, where_sql=None, params=(), name=None):
+        """
+        UPDATE table SET `set_sql` WHERE `where_sql` walking primary key
+        ranges with the same batching, throttling, parallel workers,
+        journal and progress as update of existing rows for new field.
+        Journal entry is cleared when update is finished,
+        so migration applied again runs it from beginning
+        """
+        if not self._pk_walkable(model):
+            raise ValueError('Batched update needs integer primary key, table "{}" has {}'.format(
+                model._meta.db_table, model._meta.pk.__class__.__name__,
+            ))
+        expression = UpdateExpression(set_sql, where_sql, params, name)
+
+        atomic = getattr(self, 'atomic_migration', True)
+        if self.connection.in_atomic_block:
+            self.atomic.__exit__(None, None, None)
+
+        objects_in_table = self.count_objects_in_table(model=model)
+        if objects_in_table > 0:
+            self.update_existing_rows_by_pk_range(
+                model=model, field=expression,
+                objects_in_batch_count=self.get_objects_in_batch_count(objects_in_table),
+                value=expression,
+                total=objects_in_table,
+            )
+            self.analyze_after_backfill(model)
+        journal = self.get_journal()
+        if journal is not None:
+            journal.clear(model._meta.db_table, expression.column)
+
+        if atomic:
+            self.atomic = transaction.atomic(self.connection.alias)
+            self.atomic.__enter__()
+
+    def update_existing_rows_by_pk_range(self, model, field, objects_in_batch_count, value, total=None):
+        """
+        Walk primary key in ascending ranges carrying the cursor
+        from one batch to the next, so every batch reads only its
+        own slice of the table instead of rescanning rows
+        which were already updated
+        """
+        min_pk, max_pk = self.get_pk_range(model)
+        if max_pk is None:
+            return
+        if self.collect_sql:
+            # For sqlmigrate purpose render one full batch
+            max_pk = min_pk - 1 + objects_in_batch_count
+        start_pk = min_pk - 1
+        table = model._meta.db_table
+        journal = self.get_journal()
+        entry = journal.get(table, field.column) if journal is not None else None
+        if entry is not None and entry.last_pk is not None:
+            # Continue right after the last committed batch
+            start_pk = max(start_pk, entry.last_pk)
+        rows_updated = entry.rows_updated if entry is not None else 0
+        workers = get_setting('BACKFILL_WORKERS', 1)
+        ranges = journal.ranges(table, field.column) if journal is not None else []
+        if ranges:
+            # Previous run was parallel, every range continues right
+            # after its last committed batch, even with one worker now
+            resume = {pk_range: last_pk for pk_range, last_pk, _ in ranges}
+            partitions = [pk_range for pk_range, last_pk, _ in ranges if last_pk < pk_range[1]]
+            last_end_pk = ranges[-1][0][1]
+            if max_pk > last_end_pk:
+                # rows inserted since
+                partitions.append((last_end_pk, max_pk))
+                journal.start_ranges(table, field.column, partitions[-1:])
+            rows_updated += sum(rows for _, _, rows in ranges)
+            # keys of the ranges left are what is still to walk
+            start_pk = max_pk - sum(end_pk - resume.get((begin_pk, end_pk), begin_pk)
+                                    for begin_pk, end_pk in partitions)
+        progress = self._backfill_progress = BackfillProgress(
+            table, field.column, total,
+            min_pk=min_pk, max_pk=max_pk, start_pk=start_pk,
+            rows_updated=rows_updated,
+        )
+        if ranges:
+            return self.update_pk_ranges_in_parallel(model=model, field=field, partitions=partitions,
+                                                     workers=workers,
+                                                     objects_in_batch_count=objects_in_batch_count,
+                                                     value=value, progress=progress, resume=resume,
+                                                     )
+        if workers > 1 and not self.collect_sql:
+            partitions = self.get_pk_partitions(model, start_pk + 1, max_pk,
+                                                get_setting('BACKFILL_PARTITIONS', workers))
+            if journal is not None:
+                journal.start_ranges(table, field.column, partitions)
+            return self.update_pk_ranges_in_parallel(model=model, field=field, partitions=partitions,
+                                                     workers=workers,
+                                                     objects_in_batch_count=objects_in_batch_count,
+                                                     value=value, progress=progress,
+                                                     )
+        self.update_pk_range(model=model, field=field, start_pk=start_pk, end_pk=max_pk,
+                             batch_size=self.get_batch_size_controller(objects_in_batch_count),
+                             throttles=self.get_throttles(model), value=value, journal=journal,
+                             progress=progress,
+                             )
+
+    def update_pk_range(self, model, field, start_pk, end_pk, batch_size, throttles, value,
+                        stop=None, journal=None, progress=None, journal_key=None):
+        """
+        Update rows with start_pk < pk <= end_pk batch by batch,
+        stop early if `stop` event is set by someone else.
+        Position is saved to `journal` (under `journal_key`, column
+        name by default) together with every batch and accounted
+        in `progress` after it's committed
+        """
+        last_pk = start_pk
+        while last_pk < end_pk:
+            next_pk = min(last_pk + batch_size.size, end_pk)
+            started = monotonic()
+            with transaction.atomic(self.connection.alias):
+                updated = self.update_batch_by_pk_range(model=model, field=field,
+                                                        start_pk=last_pk, end_pk=next_pk,
+                                                        value=value,
+                                                        )
+                if journal is not None:
+                    journal.record_batch(model._meta.db_table, journal_key or field.column,
+                                         rows=updated, last_pk=next_pk)
+            duration = monotonic() - started
+            if progress is not None:
+                progress.record(updated, start_pk=last_pk, end_pk=next_pk)
+            self.report_batch(model._meta.db_table, field.column, updated, duration, progress)
+            batch_size.record(updated, duration)
+            last_pk = next_pk
+            if stop is not None and stop.is_set():
+                return
+            if last_pk < end_pk:
+                self.wait_for_throttles(throttles)
+
+    def report_batch(self, table, column, rows, duration, progress=None):
+        """
+        Emit BatchEvent to metrics sinks, print
+        progress if there are none
+        """
+        metrics = self.get_metrics()
+        if metrics.enabled:
+            metrics.emit(BatchEvent(table, column, rows, duration,
+                                    progress.done if progress is not None else None,
+                                    progress.eta if progress is not None else None))
+        elif progress is not None:
+            print('Update {} rows in {}: {}'.format(rows, table, progress))
+        else:
+            print('Update {} rows in {}'.format(rows, table))
+
+    def update_pk_ranges_in_parallel(self, model, field, partitions, workers, objects_in_batch_count, value,
+                                     progress=None, resume=None):
+        """
+        Update disjoint primary key ranges from `workers` threads,
+        each thread uses its own connection and its own schema editor
+        and takes the next range from the queue when it's done with
+        the previous one. If any worker fails all others stop after
+        their current batch and the first error is raised.
+        With journal every range saves its position on its own,
+        `resume` maps ranges to their positions saved before
+        """
+        resume = resume or {}
+
+        def make_handler():
+            editor = self.__class__(connections[self.connection.alias])
+            batch_size = editor.get_batch_size_controller(objects_in_batch_count)
+            throttles = editor.get_throttles(model)
+            journal = editor.get_journal()
+
+            def handler(pk_range, stop):
+                editor.update_pk_range(model=model, field=field,
+                                       start_pk=resume.get(pk_range, pk_range[0]), end_pk=pk_range[1],
+                                       batch_size=batch_size, throttles=throttles, value=value,
+                                       stop=stop, progress=progress, journal=journal,
+                                       journal_key=Journal.range_key(field.column, pk_range),
+                                       )
+            return handler
+
+        run_in_parallel(partitions, workers, self.connection.alias, make_handler)
+
+    def get_pk_partitions(self, model, min_pk, max_pk, count):
+        """
+        Split (min_pk - 1, max_pk] into `count` disjoint ranges,
+        by pg_stats histogram if table was analyzed so ranges hold
+        about the same number of rows, evenly by value otherwise
+        """
+        bounds = [bound for bound in self.get_pk_histogram_bounds(model) if min_pk <= bound < max_pk]
+        if len(bounds) >= count:
+            bounds = [bounds[len(bounds) * i // count] for i in range(1, count)]
+        else:
+            step = -(-(max_pk - min_pk + 1) // count)
+            bounds = range(min_pk - 1 + step, max_pk, step)
+        edges = sorted(set([min_pk - 1, max_pk] + list(bounds)))
+        return list(zip(edges[:-1], edges[1:]))
+
+    def get_pk_histogram_bounds(self, model):
+        sql = SQL_PK_HISTOGRAM_BOUNDS % {
+            "table": model._meta.db_table,
+            "pk_column_name": self.get_pk_column_name(model),
+        }
+        cursor_result = self.get_query_result(sql)
+        return self.parse_cursor_result(cursor_result=cursor_result, collect_sql_value=None) or []
+
+    def get_batch_size_controller(self, objects_in_batch_count):
+        """
+        Batch size is fixed unless ZERO_DOWNTIME_MIGRATIONS_ADAPTIVE_BATCH_SIZE
+        is on, in which case it is tuned after every batch by its duration
+        """
+        if not get_setting('ADAPTIVE_BATCH_SIZE', False):
+            return BatchSizeController(objects_in_batch_count)
+        return AdaptiveBatchSizeController(
+            initial_size=objects_in_batch_count,
+            min_size=get_setting('MIN_BATCH_SIZE', MIN_BATCH_SIZE),
+            max_size=get_setting('MAX_BATCH_SIZE', MAX_BATCH_SIZE),
+            target_duration=get_setting('BATCH_TARGET_DURATION', BATCH_TARGET_DURATION),
+            max_lock_duration=get_setting('BATCH_MAX_LOCK_DURATION', BATCH_MAX_LOCK_DURATION),
+        )
+
+    def get_throttles(self, model=None):
+        """
+        Throttles to wait for between batches. Replication lag is checked if
+        ZERO_DOWNTIME_MIGRATIONS_REPLICATION_LAG_MAX is set, lag is measured by
+        ZERO_DOWNTIME_MIGRATIONS_REPLICATION_LAG_PROBE (callable or dotted path,
+        called with connection) which defaults to replay lag in bytes.
+        Dead tuples of updated `model` table are checked if
+        ZERO_DOWNTIME_MIGRATIONS_DEAD_TUPLES_MAX_RATIO is set
+        """
+        throttles = []
+        max_lag = get_setting('REPLICATION_LAG_MAX')
+        if max_lag is not None and not self.collect_sql:
+            probe = get_setting('REPLICATION_LAG_PROBE', replication_lag_bytes)
+            if not callable(probe):
+                probe = import_string(probe)
+            throttles.append(ReplicationLagThrottle(
+                probe=functools.partial(probe, self.connection),
+                max_lag=max_lag,
+                check_interval=get_setting('REPLICATION_LAG_CHECK_INTERVAL', REPLICATION_LAG_CHECK_INTERVAL),
+                max_wait=get_setting('REPLICATION_LAG_MAX_WAIT'),
+            ))
+        max_ratio = get_setting('DEAD_TUPLES_MAX_RATIO')
+        if max_ratio is not None and model is not None and not self.collect_sql:
+            table = model._meta.db_table
+            vacuum = None
+            if get_setting('DEAD_TUPLES_VACUUM', False):
+                vacuum = functools.partial(vacuum_table, self.connection.alias, table)
+            throttles.append(DeadTuplesThrottle(
+                probe=functools.partial(dead_tuples, self.connection, table),
+                max_ratio=max_ratio,
+                vacuum=vacuum,
+                check_interval=get_setting('DEAD_TUPLES_CHECK_INTERVAL', DEAD_TUPLES_CHECK_INTERVAL),
+                max_wait=get_setting('DEAD_TUPLES_MAX_WAIT'),
+            ))
+        return throttles
+
+    def analyze_after_backfill(self, model, column=None):
+        """
+        ANALYZE updated column (or whole table) so planner sees its new
+        statistics right away. Done if ZERO_DOWNTIME_MIGRATIONS_ANALYZE_AFTER_BACKFILL
+        is on, which it is by default when dead tuples are checked.
+        Cached sizes of the table are forgotten either way
+        """
+        catalog = getattr(self, '_catalog', None)
+        if catalog is not None:
+            catalog.invalidate(model._meta.db_table, sizes=True)
+        if not get_setting('ANALYZE_AFTER_BACKFILL', get_setting('DEAD_TUPLES_MAX_RATIO') is not None):
+            return
+        params = {"table": model._meta.db_table, "column": column}
+        self.execute((SQL_ANALYZE_COLUMN if column is not None else SQL_ANALYZE_TABLE) % params)
+
+    def get_catalog(self):
+        """
+        Editor scoped cache of catalog metadata if
+        ZERO_DOWNTIME_MIGRATIONS_CATALOG_CACHE is on,
+        it is never used for sqlmigrate. Only tables
+        migration asks about are loaded
+        """
+        if self.collect_sql or not get_setting('CATALOG_CACHE', False):
+            return None
+        if getattr(self, '_catalog', None) is None:
+            self._catalog = CatalogCache(self.connection)
+        return self._catalog
+
+    def invalidate_catalog(self, sql):
+        """
+        Forget cached metadata of table changed by DDL statement,
+        everything if table can't be found in it. Index build
+        changes sizes too
+        """
+        catalog = getattr(self, '_catalog', None)
+        if catalog is None or not re.match(r'\s*(ALTER|CREATE|DROP|COMMENT)\b', sql, re.IGNORECASE):
+            return
+        table = self._table_from_sql(sql)
+        sizes = re.match(r'\s*CREATE (UNIQUE )?INDEX', sql, re.IGNORECASE) is not None
+        if table is None or sql.startswith('DROP INDEX'):
+            catalog.invalidate(sizes=sizes)
+        else:
+            catalog.invalidate(table, sizes=sizes)
+
+    def _table_from_sql(self, sql):
+        table_match = re.match(r'\s*(ALTER|DROP) TABLE (IF EXISTS )?(ONLY )?(?P<table>[^\s(]+)', sql)
+        table = table_match.group('table') if table_match else self._index_table_from_sql(sql)
+        return self._unquote(table)
+
+    def _unquote(self, name):
+        return name.strip('"') if name else name
+
+    def get_metrics(self):
+        """
+        Sink for events of this editor from ZERO_DOWNTIME_MIGRATIONS_METRICS
+        (sink or list of sinks, each may be dotted path to it),
+        events are not even built if there are none
+        """
+        if getattr(self, '_metrics', None) is None:
+            sinks = get_setting('METRICS')
+            if self.collect_sql or not sinks:
+                self._metrics = NullSink()
+            else:
+                if not isinstance(sinks, (list, tuple)):
+                    sinks = [sinks]
+                sinks = [sink if hasattr(sink, 'emit') else import_string(sink) for sink in sinks]
+                self._metrics = sinks[0] if len(sinks) == 1 else MultiSink(sinks)
+        return self._metrics
+
+    def get_journal(self):
+        """
+        Journal of add field progress if ZERO_DOWNTIME_MIGRATIONS_JOURNAL is on,
+        it is never used for sqlmigrate
+        """
+        if self.collect_sql or not get_setting('JOURNAL', False):
+            return None
+        if getattr(self, '_journal', None) is None:
+            self._journal = Journal(self.connection)
+        return self._journal
+
+    def wait_for_throttles(self, throttles):
+        for throttle in throttles:
+            throttle.wait()
+
+    def get_backfill_mode(self, model):
+        """
+        Primary key ranges can only be walked for integer keys,
+        tables with any other key are updated with null scan
+        """
+        mode = get_setting('BACKFILL_MODE', BACKFILL_MODE_NULL_SCAN)
+        if mode == BACKFILL_MODE_PK_RANGE and not self._pk_walkable(model):
+            mode = BACKFILL_MODE_NULL_SCAN
+        return mode
+
+    def _pk_walkable(self, model):
+        return isinstance(model._meta.pk, (models.AutoField, models.IntegerField))
+
+    def get_backfill_progress(self, model, field):
+        """
+        Progress of update of existing rows without counting them:
+        figures of update running in this editor if any, otherwise
+        restored from journal entry or, if there is none, from planner
+        statistics of nulls in column
+        """
+        table = model._meta.db_table
+        progress = getattr(self, '_backfill_progress', None)
+        if progress is not None and (progress.table, progress.column) == (table, field.column):
+            return progress
+        total = self.count_objects_in_table(model)
+        journal = self.get_journal()
+        entry = journal.get(table, field.column) if journal is not None else None
+        if entry is None:
+            need_to_update = self.estimate_need_to_update(model, field)
+            if need_to_update is None:
+                return BackfillProgress(table, field.column, None)
+            return BackfillProgress(table, field.column, total, rows_updated=max(total - need_to_update, 0))
+        if entry.last_pk is not None and self.get_backfill_mode(model) == BACKFILL_MODE_PK_RANGE:
+            min_pk, max_pk = self.get_pk_range(model)
+            return BackfillProgress(table, field.column, total, min_pk=min_pk, max_pk=max_pk,
+                                    start_pk=entry.last_pk, rows_updated=entry.rows_updated)
+        return BackfillProgress(table, field.column, total, rows_updated=entry.rows_updated)
+
+    def set_not_null_for_field(self, model, field, nullable, default_factory=None):
         # If field was not null - adding
         # this knowledge to table
-        if nullable is False:
+        if nullable is False and default_factory is not None:
+            self.set_not_null_after_final_sweep(model, field, default_factory)
+        elif nullable is False:
+            self.set_not_null(model, field)
+
+    def set_not_null_after_final_sweep(self, model, field, default):
+        """
+        Column gets no default while rows get values per row, so rows
+        inserted by code which doesn't know about the field after the last
+        batch are still null. Writes to the table are blocked (lock is
+        taken with ZERO_DOWNTIME_MIGRATIONS_LOCK_TIMEOUT if it's set)
+        while these rows are updated and not null is set. With
+        ZERO_DOWNTIME_MIGRATIONS_NOT_NULL_VIA_CHECK not valid check
+        constraint stops new nulls instead, and rows left are updated
+        before it is validated
+        """
+        if get_setting('NOT_NULL_VIA_CHECK', False):
+            self.set_not_null_via_check(model, field, sweep=lambda: self.update_rows_left(model, field, default))
+            return
+        with transaction.atomic(self.connection.alias):
+            self.execute(SQL_LOCK_TABLE_FOR_WRITES % {"table": self.quote_name(model._meta.db_table)})
+            self.update_rows_left(model, field, default)
             self.set_not_null(model, field)
 
+    def update_rows_left(self, model, field, default):
+        """
+        Update rows where column is still null, there should be
+        only few of them, so there is no throttling
+        """
+        objects_in_batch_count = self.get_objects_in_batch_count(0)
+        while True:
+            with transaction.atomic(self.connection.alias):
+                updated = self.update_batch(model=model, field=field,
+                                            objects_in_batch_count=objects_in_batch_count,
+                                            value=default,
+                                            )
+            if not updated:
+                break
+        self.drop_backfill_values()
+
     def get_column_info(self, model, field):
+        catalog = self.get_catalog()
+        if catalog is not None:
+            snapshot = catalog.table(model._meta.db_table)
+            return snapshot.columns.get(field.column) if snapshot is not None else None
         sql = SQL_CHECK_COLUMN_STATUS % {
             "table": model._meta.db_table,
-            "column": field.name,
+            "column": field.column,
         }
         return self.get_query_result(sql)
 
@@ -187,6 +1218,16 @@ class ZeroDownTimeMixin(object):
         # Checking maybe this column already exists
         # if so asking user what to do next
         column_info = self.get_column_info(model, field)
+        journal = self.get_journal()
+
+        if column_info is None and journal is not None:
+            # Entry left from column which does not exist anymore
+            journal.clear(model._meta.db_table, field.column)
+        elif column_info is not None and journal is not None:
+            entry = journal.get(model._meta.db_table, field.column)
+            if entry is not None:
+                # Previous run was journaled, so we know exactly where it stopped
+                return [action for action in actions if action not in entry.done_actions]
 
         if column_info is not None:
             existed_nullable, existed_type, existed_default = column_info
@@ -199,21 +1240,41 @@ class ZeroDownTimeMixin(object):
                 existed_nullable,
             )
 
-            result = questioner._choice_input(question, self.RETRY_CHOICES)
+            policy = self.get_resume_policy()
+            resume_actions = None
+            if policy == RESUME_POLICY_ASK:
+                result = questioner._choice_input(question, self.RETRY_CHOICES)
+            else:
+                print(question)
+                result = self.RESUME_POLICY_CHOICES[policy]
+                if policy == RESUME_POLICY_RESUME:
+                    resume_actions = self.get_actions_to_resume(model, field, column_info)
+                    if resume_actions is None:
+                        result = self.RESUME_POLICY_CHOICES[RESUME_POLICY_FAIL]
+                print('Resume policy "{}": {}'.format(policy, self.RETRY_CHOICES[result - 1]))
+
             if result == 1:
                 sys.exit(1)
             elif result == 2:
                 self.remove_field(model, field)
+            elif result == 3 and resume_actions is not None:
+                actions = resume_actions
             elif result == 3:
                 question = 'Now choose from which action process should continue'
                 result = questioner._choice_input(question, actions)
                 actions = actions[result - 1:]
             elif result == 4:
-                question = 'Rows in table where column is null: "{}"'
-                need_to_update = self.need_to_update(model=model, field=field)
-                questioner._choice_input(question.format(need_to_update),
-                                         ('Continue',)
-                                         )
+                question = 'Update of existing rows: {}'
+                progress = self.get_backfill_progress(model=model, field=field)
+                result = questioner._choice_input(question.format(progress),
+                                                  ('Continue', 'Count rows where column is null exactly'),
+                                                  )
+                if result == 2:
+                    question = 'Rows in table where column is null: "{}"'
+                    need_to_update = self.count_need_to_update(model=model, field=field)
+                    questioner._choice_input(question.format(need_to_update),
+                                             ('Continue',)
+                                             )
                 return self.get_actions_to_perform(model, field)
             elif result == 5:
                 actions = []
@@ -223,14 +1284,67 @@ class ZeroDownTimeMixin(object):
                 actions = []
         return actions
 
+    def get_resume_policy(self):
+        """
+        What to do if column already exists (previous run crashed),
+        ZERO_DOWNTIME_MIGRATIONS_RESUME_POLICY environment variable
+        takes precedence over the setting with the same name
+        """
+        policy = (os.environ.get(SETTINGS_PREFIX + 'RESUME_POLICY') or
+                  get_setting('RESUME_POLICY', RESUME_POLICY_ASK))
+        if policy != RESUME_POLICY_ASK and policy not in self.RESUME_POLICY_CHOICES:
+            raise ImproperlyConfigured('Unknown resume policy "{}", choose one of: {}'.format(
+                policy, ', '.join([RESUME_POLICY_ASK] + sorted(self.RESUME_POLICY_CHOICES)),
+            ))
+        return policy
+
+    def get_actions_to_resume(self, model, field, column_info):
+        """
+        Decide from existing column which actions are left,
+        None means column can't be resumed (e.g. it has another type)
+        """
+        existed_nullable, existed_type, existed_default = column_info
+        if not self._column_type_matches(existed_type, field):
+            print('Column type "{}" does not match "{}"'.format(existed_type, field.db_type(self.connection)))
+            return None
+        actions = self.ADD_FIELD_WITH_DEFAULT_ACTIONS
+        if existed_nullable == 'NO':
+            # not null is set right before dropping default
+            return actions[actions.index('drop default'):] if existed_default is not None else []
+        if existed_default is None and not self._per_row_default(field):
+            if field.null:
+                # default is set together with column and dropped last
+                return []
+            # default is dropped already or was never set, but rows still may be null
+            actions = actions[:actions.index('drop default')]
+        print('Rows in table where column is null (estimate): "{}"'.format(
+            self.estimate_need_to_update(model, field),
+        ))
+        return actions[actions.index('update existing rows'):]
+
+    def _column_type_matches(self, existed_type, field):
+        db_type = field.db_type(self.connection)
+        if db_type is None:
+            return True
+        db_type = db_type.split('(')[0].strip()
+        return self.COLUMN_TYPE_ALIASES.get(db_type, db_type) == existed_type
+
     def get_pk_column_name(self, model):
         return model._meta.pk.name
 
     def update_batch(self, model, field, objects_in_batch_count, value):
         pk_column_name = self.get_pk_column_name(model)
+        if isinstance(value, PerRowDefault):
+            sql = SQL_SELECT_BATCH_FOR_UPDATE % {
+                "table": model._meta.db_table,
+                "column": field.column,
+                "batch_size": objects_in_batch_count,
+                "pk_column_name": pk_column_name,
+            }
+            return self.update_batch_per_row(model, field, sql, value)
         sql = SQL_UPDATE_BATCH % {
             "table": model._meta.db_table,
-            "column": field.name,
+            "column": field.column,
             "batch_size": objects_in_batch_count,
             "pk_column_name": pk_column_name,
             "value": "%s",
@@ -238,6 +1352,109 @@ class ZeroDownTimeMixin(object):
         params = [value]
         return self.get_query_result(sql, params, row_count=True)
 
+    def update_batch_by_pk_range(self, model, field, start_pk, end_pk, value):
+        if isinstance(value, UpdateExpression):
+            return self.update_expression_by_pk_range(model, value, start_pk, end_pk)
+        template = SQL_UPDATE_BATCH_BY_PK_RANGE
+        if isinstance(value, PerRowDefault):
+            template = SQL_SELECT_BATCH_BY_PK_RANGE_FOR_UPDATE
+        sql = template % {
+            "table": model._meta.db_table,
+            "column": field.column,
+            "pk_column_name": self.get_pk_column_name(model),
+            "start_pk": int(start_pk),
+            "end_pk": int(end_pk),
+            "value": "%s",
+        }
+        if isinstance(value, PerRowDefault):
+            return self.update_batch_per_row(model, field, sql, value)
+        params = [value]
+        return self.get_query_result(sql, params, row_count=True)
+
+    def update_expression_by_pk_range(self, model, expression, start_pk, end_pk):
+        sql = SQL_UPDATE_EXPRESSION_BY_PK_RANGE % {
+            "table": model._meta.db_table,
+            "set_sql": expression.set_sql,
+            "pk_column_name": self.get_pk_column_name(model),
+            "start_pk": int(start_pk),
+            "end_pk": int(end_pk),
+            "where_sql": ' AND ({})'.format(expression.where_sql) if expression.where_sql else '',
+        }
+        # without params sql is not formatted, so it may contain % as is
+        return self.get_query_result(sql, expression.params or None, row_count=True)
+
+    def update_batch_per_row(self, model, field, select_sql, default):
+        """
+        Lock batch of rows selected by `select_sql`, generate new
+        default for each of them, COPY values to temporary table
+        and apply all of them with one UPDATE ... FROM.
+        Temporary table is created by the first batch and only
+        truncated by the next ones, see drop_backfill_values.
+        Should be run in the batch transaction
+        """
+        params = {
+            "table": model._meta.db_table,
+            "column": field.column,
+            "pk_column_name": self.get_pk_column_name(model),
+            "values_table": BACKFILL_VALUES_TABLE,
+        }
+        created = getattr(self, '_backfill_values_for', None) == (model._meta.db_table, field.column)
+        if self.collect_sql:
+            # For sqlmigrate purpose render statements of one batch
+            for sql in (select_sql, SQL_TRUNCATE_BACKFILL_VALUES if created else SQL_CREATE_BACKFILL_VALUES,
+                        SQL_COPY_BACKFILL_VALUES, SQL_UPDATE_BATCH_FROM_VALUES):
+                self.execute(sql % params)
+            self._backfill_values_for = (model._meta.db_table, field.column)
+            return None
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(select_sql)
+            pks = [row[0] for row in cursor.fetchall()]
+            if not pks:
+                return 0
+            try:
+                if created:
+                    cursor.execute(SQL_TRUNCATE_BACKFILL_VALUES % params)
+                else:
+                    # left by update of another column which failed
+                    cursor.execute(SQL_DROP_BACKFILL_VALUES % params)
+                    cursor.execute(SQL_CREATE_BACKFILL_VALUES % params)
+                    self._backfill_values_for = (model._meta.db_table, field.column)
+                cursor.copy_expert(SQL_COPY_BACKFILL_VALUES % params, default.copy_data(pks))
+                cursor.execute(SQL_UPDATE_BATCH_FROM_VALUES % params)
+            except Exception:
+                # table is gone if batch which created it is rolled back
+                self._backfill_values_for = None
+                raise
+            return cursor.rowcount
+
+    def drop_backfill_values(self):
+        """
+        Drop temporary table of per row update, the next
+        update may be of column of another type
+        """
+        if self.collect_sql:
+            self.execute(SQL_DROP_BACKFILL_VALUES % {"values_table": BACKFILL_VALUES_TABLE})
+        elif getattr(self, '_backfill_values_for', None) is not None:
+            with self.connection.cursor() as cursor:
+                cursor.execute(SQL_DROP_BACKFILL_VALUES % {"values_table": BACKFILL_VALUES_TABLE})
+        self._backfill_values_for = None
+
+    def get_pk_range(self, model):
+        """
+        Return (min, max) of primary key in table,
+        (None, None) if table is empty
+        """
+        sql = SQL_PK_RANGE % {
+            "table": model._meta.db_table,
+            "pk_column_name": self.get_pk_column_name(model),
+        }
+        cursor_result = self.get_query_result(sql)
+        if self.collect_sql:
+            # For sqlmigrate purpose render one representative batch
+            return 1, 1
+        return cursor_result or (None, None)
+
     def get_objects_in_batch_count(self, model_count):
         """
         Calculate batch size
@@ -281,27 +1498,112 @@ class ZeroDownTimeMixin(object):
         return self.parse_cursor_result(cursor_result=cursor_result)
 
     def count_objects_in_table(self, model):
-        count = self.execute_table_query(
-            sql=SQL_ESTIMATE_COUNT_IN_TABLE,
-            model=model,
-        )
-        if count in [0, -1]:
-            # Check, maybe statistic is outdated?
-            # Because previous count return 0 or -1 it will be fast query
-            count = self.execute_table_query(
-                sql=SQL_COUNT_IN_TABLE,
-                model=model,
-            )
-        return count
+        """
+        Estimate rows in table without reading all of it,
+        see estimate_objects_in_table
+        """
+        catalog = self.get_catalog()
+        if catalog is not None:
+            sizes = catalog.sizes(model._meta.db_table)
+        else:
+            sql = SQL_ESTIMATE_COUNT_BY_PAGES % {
+                "table": model._meta.db_table
+            }
+            sizes = self.get_query_result(sql)
+            if self.collect_sql:
+                return 1  # For sqlmigrate purpose
+        if sizes is None:
+            return 0
+        return self.estimate_objects_in_table(model, *sizes)
+
+    def estimate_objects_in_table(self, model, reltuples, relpages, curpages):
+        """
+        Same as planner does: tuple density from last analyze
+        scaled by current number of pages in table. If table
+        was never analyzed (or density says there is nothing while
+        table has pages) count rows in sample of at most
+        ZERO_DOWNTIME_MIGRATIONS_COUNT_SAMPLE_PAGES pages
+        """
+        if curpages == 0:
+            # nothing to read whatever statistics say (-1 for never analyzed since postgres 14)
+            return 0
+        if reltuples >= 0 and relpages > 0:
+            count = int(round(float(reltuples) / relpages * curpages))
+            if count > 0:
+                return count
+        return self.sample_objects_in_table(model, curpages)
+
+    def sample_objects_in_table(self, model, pages):
+        sample_pages = get_setting('COUNT_SAMPLE_PAGES', COUNT_SAMPLE_PAGES)
+        percent = min(100.0, 100.0 * sample_pages / max(pages, 1))
+        sql = SQL_SAMPLE_COUNT_IN_TABLE % {
+            "table": model._meta.db_table,
+            "percent": '{:g}'.format(percent),
+        }
+        count = self.parse_cursor_result(cursor_result=self.get_query_result(sql))
+        if percent >= 100:
+            return count
+        # Nothing in sample does not prove table is empty,
+        # let batches find out
+        return max(1, int(round(count * 100 / percent)))
 
     def need_to_update(self, model, field):
         sql = SQL_COUNT_IN_TABLE_WITH_NULL % {
             "table": model._meta.db_table,
-            "column": field.name,
+            "column": field.column,
+        }
+        cursor_result = self.get_query_result(sql)
+        return self.parse_cursor_result(cursor_result=cursor_result)
+
+    def count_need_to_update(self, model, field):
+        """
+        Exact need_to_update counted by ZERO_DOWNTIME_MIGRATIONS_COUNT_CHUNK_SIZE
+        primary keys at a time, waiting for throttles and
+        ZERO_DOWNTIME_MIGRATIONS_COUNT_CHUNK_PAUSE seconds between chunks.
+        Tables which can't be walked by primary key are counted at once
+        """
+        if not self._pk_walkable(model):
+            return self.need_to_update(model=model, field=field)
+        min_pk, max_pk = self.get_pk_range(model)
+        if max_pk is None:
+            return 0
+        chunk_size = get_setting('COUNT_CHUNK_SIZE', COUNT_CHUNK_SIZE)
+        pause = get_setting('COUNT_CHUNK_PAUSE', COUNT_CHUNK_PAUSE)
+        throttles = self.get_throttles()
+        count = 0
+        last_pk = min_pk - 1
+        while last_pk < max_pk:
+            next_pk = min(last_pk + chunk_size, max_pk)
+            count += self.need_to_update_by_pk_range(model, field, last_pk, next_pk) or 0
+            last_pk = next_pk
+            if last_pk < max_pk:
+                self.wait_for_throttles(throttles)
+                time.sleep(pause)
+        return count
+
+    def need_to_update_by_pk_range(self, model, field, start_pk, end_pk):
+        sql = SQL_COUNT_IN_TABLE_WITH_NULL_BY_PK_RANGE % {
+            "table": model._meta.db_table,
+            "column": field.column,
+            "pk_column_name": self.get_pk_column_name(model),
+            "start_pk": int(start_pk),
+            "end_pk": int(end_pk),
         }
         cursor_result = self.get_query_result(sql)
         return self.parse_cursor_result(cursor_result=cursor_result)
 
+    def estimate_need_to_update(self, model, field):
+        """
+        Planner statistics based guess of need_to_update,
+        None if column was not analyzed yet
+        """
+        sql = SQL_ESTIMATE_COUNT_IN_TABLE_WITH_NULL % {
+            "table": model._meta.db_table,
+            "column": field.column,
+        }
+        cursor_result = self.get_query_result(sql)
+        return self.parse_cursor_result(cursor_result=cursor_result, collect_sql_value=None)
+
     def drop_default(self, model, field):
         set_default_sql, params = self._alter_column_default_sql_local(field, drop=True)
         self.execute_alter_column(model, set_default_sql, params)
@@ -311,9 +1613,52 @@ class ZeroDownTimeMixin(object):
         self.execute_alter_column(model, set_default_sql, params)
 
     def set_not_null(self, model, field):
+        if get_setting('NOT_NULL_VIA_CHECK', False):
+            return self.set_not_null_via_check(model, field)
         set_not_null_sql = self.generate_set_not_null(field)
         self.execute_alter_column(model, set_not_null_sql)
 
+    def set_not_null_via_check(self, model, field, sweep=None):
+        """
+        SET NOT NULL scans the whole table holding ACCESS EXCLUSIVE lock,
+        so instead add NOT VALID check constraint (instant) and validate it
+        holding only SHARE UPDATE EXCLUSIVE lock. Since postgres 12
+        SET NOT NULL uses validated constraint and skips the scan, after
+        that helper constraint is dropped, on older versions it is kept.
+        `sweep` is called between adding and validating the constraint
+        """
+        table = model._meta.db_table
+        name = self._not_null_check_name(table, field.column)
+        check_sql = SQL_CHECK_CONSTRAINT_EXISTS % {"name": name}
+        if not self.parse_cursor_result(self.get_query_result(check_sql), collect_sql_value=None):
+            self.execute(SQL_ADD_NOT_NULL_CHECK % {
+                "table": self.quote_name(table),
+                "name": self.quote_name(name),
+                "column": self.quote_name(field.column),
+            })
+        if sweep is not None:
+            sweep()
+        self.execute(SQL_VALIDATE_CONSTRAINT % {
+            "table": self.quote_name(table),
+            "name": self.quote_name(name),
+        })
+        if self.connection.pg_version >= 120000:
+            self.execute_alter_column(model, self.generate_set_not_null(field))
+            self.execute(SQL_DROP_CONSTRAINT % {
+                "table": self.quote_name(table),
+                "name": self.quote_name(name),
+            })
+        else:
+            message = ('Column "{}" in table "{}" stays nullable, not null is enforced only by check constraint '
+                       '"{}" on postgres before 12'.format(field.column, table, name))
+            if self.collect_sql:
+                self.collected_sql.append('-- {}'.format(message))
+            else:
+                print('Warning: {}'.format(message))
+
+    def _not_null_check_name(self, table, column):
+        return truncate_name('{}_{}_notnull'.format(table, column), self.connection.ops.max_name_length())
+
     def execute_alter_column(self, model, changes_sql, params=()):
         sql = self.sql_alter_column % {
             "table": self.quote_name(model._meta.db_table),
@@ -368,28 +1713,367 @@ class ZeroDownTimeMixin(object):
             "index_name": index_name,
         }
 
+    def _index_name_from_sql(self, sql):
+        index_match = re.match(r'.* "(?P<index_name>.+)" ON .+', sql)
+        if index_match:
+            return index_match.group('index_name')
+
+    def _unique_index_parts(self, sql):
+        """
+        (table, columns, predicate) of CREATE UNIQUE INDEX
+        statement, None if it can't be parsed
+        """
+        match = re.match(r'CREATE UNIQUE INDEX (CONCURRENTLY )?(IF NOT EXISTS )?\S+ ON (ONLY )?(?P<table>\S+) '
+                         r'(USING \w+ ?)?\(', sql)
+        if not match:
+            return None
+        start = match.end() - 1
+        depth = 0
+        for position in range(start, len(sql)):
+            if sql[position] == '(':
+                depth += 1
+            elif sql[position] == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+        else:
+            return None
+        predicate = re.search(r'\sWHERE\s(?P<predicate>.+)$', sql[position + 1:])
+        return (match.group('table'), sql[start + 1:position],
+                predicate.group('predicate').rstrip(';') if predicate else None)
+
+    def check_unique_duplicates(self, sql):
+        """
+        Look for values which would make unique index build fail before
+        it starts: in a sample of table pages first (hash aggregate of
+        ZERO_DOWNTIME_MIGRATIONS_UNIQUE_PRECHECK_SAMPLE_PERCENT of them),
+        then in the whole table with one read only hash aggregate if
+        ZERO_DOWNTIME_MIGRATIONS_UNIQUE_PRECHECK is 'full' (or True)
+        """
+        mode = get_setting('UNIQUE_PRECHECK')
+        if not mode or self.collect_sql:
+            return
+        parts = self._unique_index_parts(sql)
+        if parts is None:
+            return
+        table, columns, predicate = parts
+        if self.is_partitioned_table(self._unquote(table)):
+            # every partition is checked before its own index is built
+            return
+        params = {
+            "table": table,
+            "columns": columns,
+            "predicate": ' AND ({})'.format(predicate) if predicate else '',
+            "percent": get_setting('UNIQUE_PRECHECK_SAMPLE_PERCENT', UNIQUE_PRECHECK_SAMPLE_PERCENT),
+            "limit": get_setting('UNIQUE_PRECHECK_LIMIT', UNIQUE_PRECHECK_LIMIT),
+        }
+        templates = [SQL_SAMPLE_DUPLICATES]
+        if mode in (True, UNIQUE_PRECHECK_FULL):
+            templates.append(SQL_FIND_DUPLICATES)
+        for template in templates:
+            try:
+                # failed check should not leave connection in failed transaction
+                with transaction.atomic(self.connection.alias):
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(template % params)
+                        duplicates = cursor.fetchall()
+            except django.db.DatabaseError as exc:
+                print('Could not check {} for duplicates of ({}): {!r}'.format(table, columns, exc))
+                return
+            if duplicates:
+                raise DuplicateValuesError(
+                    'Values of ({}) in {} are not unique, index was not built. '
+                    'Duplicates (values, count): {}. Sql was: {}'.format(
+                        columns, table, ', '.join(repr(tuple(row)) for row in duplicates), sql,
+                    )
+                )
+
+    def is_partitioned_table(self, table):
+        if self.connection.pg_version < 110000:
+            return False
+        sql = SQL_TABLE_IS_PARTITIONED % {"table": self.quote_name(table)}
+        return bool(self.parse_cursor_result(self.get_query_result(sql), collect_sql_value=None))
+
+    def get_partitions(self, table):
+        sql = SQL_PARTITIONS % {"table": self.quote_name(table)}
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _partition_index_name(self, index_name, partition):
+        return truncate_name('{}_{}'.format(partition, index_name), self.connection.ops.max_name_length())
+
+    def create_partitioned_index(self, sql):
+        """
+        Index can't be built concurrently on partitioned table, so it is
+        created ON ONLY the parent (invalid and empty, catalog only),
+        then index of every partition is built concurrently (and checked)
+        over ZERO_DOWNTIME_MIGRATIONS_PARTITION_INDEX_BUILDS connections
+        and attached to it. Parent index becomes valid when all partitions
+        are attached, sub-partitioned partitions are handled the same way.
+        Already built and attached partitions are skipped on restart
+        """
+        match = re.match(r'CREATE (?P<unique>UNIQUE )?INDEX (CONCURRENTLY )?(IF NOT EXISTS )?(?P<name>\S+) '
+                         r'ON (ONLY )?(?P<table>\S+) (?P<rest>.+)$', sql, re.DOTALL)
+        unique = match.group('unique') or ''
+        index_name = self._unquote(match.group('name'))
+        table = self._unquote(match.group('table'))
+        rest = match.group('rest')
+        super(ZeroDownTimeMixin, self).execute('CREATE {}INDEX IF NOT EXISTS {} ON ONLY {} {}'.format(
+            unique, self.quote_name(index_name), self.quote_name(table), rest,
+        ))
+
+        alias = self.connection.alias
+
+        def make_handler():
+            editor = self.__class__(connections[alias])
+
+            def handler(partition, stop):
+                partition_index_name = self._partition_index_name(index_name, partition)
+                editor.execute('CREATE {}INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}'.format(
+                    unique, self.quote_name(partition_index_name), self.quote_name(partition), rest,
+                ))
+                editor.execute(SQL_ATTACH_INDEX_PARTITION % {
+                    "index_name": self.quote_name(index_name),
+                    "partition_index_name": self.quote_name(partition_index_name),
+                })
+            return handler
+
+        partitions = self.get_partitions(table)
+        workers = get_setting('PARTITION_INDEX_BUILDS', 1)
+        if workers > 1:
+            run_in_parallel(partitions, workers, alias, make_handler, stop_on_error=False)
+        else:
+            handler = make_handler()
+            for partition in partitions:
+                handler(partition, None)
+
     def _check_valid_index(self, sql):
         """
         Return index_name if it's invalid
         """
-        index_match = re.match(r'.* "(?P<index_name>.+)" ON .+', sql)
-        if index_match:
-            index_name = index_match.group('index_name')
+        index_name = self._index_name_from_sql(sql)
+        catalog = self.get_catalog()
+        if index_name and catalog is not None:
+            snapshot = catalog.table(self._unquote(self._index_table_from_sql(sql)))
+            if snapshot is not None and snapshot.indexes.get(index_name) is False:
+                return index_name
+        elif index_name:
             check_index_sql = self._check_index_sql(index_name)
             cursor_result = self.get_query_result(check_index_sql)
             if self.parse_cursor_result(cursor_result=cursor_result):
                 return index_name
 
+    def index_build_monitor(self, sql):
+        """
+        Report progress of concurrent index build to
+        ZERO_DOWNTIME_MIGRATIONS_INDEX_PROGRESS_CALLBACK (callable or dotted
+        path, called with IndexBuildProgress) every
+        ZERO_DOWNTIME_MIGRATIONS_INDEX_PROGRESS_INTERVAL seconds
+        """
+        callback = get_setting('INDEX_PROGRESS_CALLBACK')
+        if callback is None or self.collect_sql or self.connection.pg_version < 120000:
+            return NullMonitor()
+        if not callable(callback):
+            callback = import_string(callback)
+        self.connection.ensure_connection()
+        return IndexBuildMonitor(
+            alias=self.connection.alias,
+            pid=self.connection.connection.get_backend_pid(),
+            index_name=self._index_name_from_sql(sql),
+            callback=callback,
+            interval=get_setting('INDEX_PROGRESS_INTERVAL', INDEX_PROGRESS_INTERVAL),
+        )
+
+    def blocked_queries_observer(self):
+        """
+        Look for queries blocked by this editor every
+        ZERO_DOWNTIME_MIGRATIONS_BLOCKED_QUERIES_INTERVAL seconds
+        while it is active, samples are passed to metrics sinks
+        """
+        interval = get_setting('BLOCKED_QUERIES_INTERVAL')
+        if interval is None or self.collect_sql:
+            return None
+        metrics = self.get_metrics()
+        self.connection.ensure_connection()
+        return BlockedQueriesObserver(
+            alias=self.connection.alias,
+            pid=self.connection.connection.get_backend_pid(),
+            interval=interval,
+            callback=metrics.emit if metrics.enabled else None,
+        )
+
     def _create_unique_failed(self, exc):
         return (DJANGO_VERISON >= Version('2.1')
                 and 'could not create unique index' in repr(exc)
                 )
 
+    def _lock_timeout_guarded(self, sql):
+        return (not self.collect_sql and
+                get_setting('LOCK_TIMEOUT') is not None and
+                re.match(LOCK_TAKING_SQL, sql, re.IGNORECASE) is not None)
+
+    def execute_with_lock_timeout(self, sql, params=()):
+        """
+        Run statement which takes heavy lock with short lock_timeout, so
+        it never waits long in the lock queue blocking all queries behind it.
+        If lock was not acquired in time statement is retried after jittered
+        exponential backoff until retries or total time budget run out.
+        Inside migration transaction which already holds table locks it
+        fails at once, since waiting would keep those locks
+        """
+        lock_timeout = get_setting('LOCK_TIMEOUT')
+        retries = get_setting('LOCK_TIMEOUT_RETRIES', LOCK_TIMEOUT_RETRIES)
+        backoff = get_setting('LOCK_TIMEOUT_BACKOFF', LOCK_TIMEOUT_BACKOFF)
+        max_backoff = get_setting('LOCK_TIMEOUT_MAX_BACKOFF', LOCK_TIMEOUT_MAX_BACKOFF)
+        budget = get_setting('LOCK_TIMEOUT_BUDGET', LOCK_TIMEOUT_BUDGET)
+        started = monotonic()
+        attempt = 0
+        while True:
+            attempt_started = monotonic()
+            try:
+                # savepoint if we are in migration transaction, so it survives the failure
+                with transaction.atomic(self.connection.alias):
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(SQL_SET_LOCK_TIMEOUT, [str(lock_timeout)])
+                    super(ZeroDownTimeMixin, self).execute(sql, params)
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(SQL_RESET_LOCK_TIMEOUT)
+                # time lost before the attempt which got the lock
+                return attempt_started - started
+            except django.db.utils.OperationalError as exc:
+                if getattr(exc.__cause__, 'pgcode', None) != LOCK_NOT_AVAILABLE:
+                    raise
+                attempt += 1
+                delay = exponential_backoff(attempt, backoff, max_backoff)
+                waited = monotonic() - started
+                if self.holds_table_locks():
+                    raise LockTimeoutError(
+                        'Could not acquire lock in {} while migration transaction holds other locks, '
+                        'sql was: {}'.format(lock_timeout, sql)
+                    )
+                if attempt > retries or waited + delay > budget:
+                    raise LockTimeoutError(
+                        'Could not acquire lock in {} attempts ({:.1f}s), sql was: {}'.format(attempt, waited, sql)
+                    )
+                print('Could not acquire lock in {} (attempt {} of {}), retrying in {:.1f}s'.format(
+                    lock_timeout, attempt, retries + 1, delay,
+                ))
+                metrics = self.get_metrics()
+                if metrics.enabled:
+                    metrics.emit(RetryEvent(sql, self._table_from_sql(sql), attempt, delay))
+                time.sleep(delay)
+
+    def holds_table_locks(self):
+        """
+        Check if open transaction holds locks on tables, which would block
+        other queries while we wait for retry
+        """
+        if not self.connection.in_atomic_block:
+            return False
+        with self.connection.cursor() as cursor:
+            cursor.execute(SQL_HELD_TABLE_LOCKS)
+            return cursor.fetchone() is not None
+
+    def _validate_constraint_sql(self, sql):
+        """
+        Return VALIDATE CONSTRAINT statement if sql adds NOT VALID foreign key
+        """
+        fk_match = re.match(r'ALTER TABLE (?P<table>\S+) ADD CONSTRAINT (?P<name>\S+) FOREIGN KEY .+ NOT VALID$', sql)
+        if fk_match:
+            return SQL_VALIDATE_CONSTRAINT % fk_match.groupdict()
+
+    def __enter__(self):
+        editor = super(ZeroDownTimeMixin, self).__enter__()
+        workers = get_setting('PARALLEL_INDEX_BUILDS', 0)
+        self._index_queue = [] if workers and workers > 1 and not self.collect_sql else None
+        self._blocked_queries = self.blocked_queries_observer()
+        if self._blocked_queries is not None:
+            self._blocked_queries.__enter__()
+        return editor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                # deferred sql may create indexes too, so it's run before the last flush
+                for sql in self.deferred_sql:
+                    self.execute(sql)
+                self.deferred_sql = []
+                self.flush_index_queue()
+        finally:
+            self._index_queue = None
+            if getattr(self, '_blocked_queries', None) is not None:
+                self._blocked_queries.__exit__(None, None, None)
+                print(self._blocked_queries.summary())
+                self._blocked_queries = None
+            self.get_metrics().flush()
+        return super(ZeroDownTimeMixin, self).__exit__(exc_type, exc_value, traceback)
+
+    def flush_index_queue(self):
+        """
+        Build queued indexes over ZERO_DOWNTIME_MIGRATIONS_PARALLEL_INDEX_BUILDS
+        connections, indexes on the same table one after another since
+        their builds would wait for each other anyway. Every index is still
+        checked and dropped if invalid, first error is raised when all
+        builds are finished
+        """
+        statements = getattr(self, '_index_queue', None)
+        if not statements:
+            return
+        self._index_queue = []
+        by_table = OrderedDict()
+        for sql, params in statements:
+            by_table.setdefault(self._index_table_from_sql(sql), []).append((sql, params))
+
+        alias = self.connection.alias
+
+        def make_handler():
+            editor = self.__class__(connections[alias])
+            # checked above before any build started
+            editor._unique_prechecked = True
+
+            def handler(table_statements, stop):
+                for sql, params in table_statements:
+                    editor.execute(sql, params)
+            return handler
+
+        # other connections should see tables created in this migration
+        atomic = self.connection.in_atomic_block
+        if atomic:
+            self.atomic.__exit__(None, None, None)
+        try:
+            for sql, params in statements:
+                if sql.startswith('CREATE UNIQUE INDEX'):
+                    self.check_unique_duplicates(sql)
+            run_in_parallel(list(by_table.values()), get_setting('PARALLEL_INDEX_BUILDS'), alias,
+                            make_handler, stop_on_error=False)
+        finally:
+            if atomic:
+                self.atomic = transaction.atomic(alias)
+                self.atomic.__enter__()
+
+    def _index_table_from_sql(self, sql):
+        table_match = re.search(r' ON (ONLY )?(?P<table>[^\s(]+)', sql)
+        if table_match:
+            return table_match.group('table')
+
     def execute(self, sql, params=()):
         exit_atomic = False
         # Account for non-string statement objects.
         sql = str(sql)
 
+        if getattr(self, '_index_queue', None) is not None:
+            if re.match(r'CREATE (UNIQUE )?INDEX', sql):
+                self._index_queue.append((sql, params))
+                return
+            # anything else may depend on queued indexes
+            self.flush_index_queue()
+
+        if sql.startswith('ALTER TABLE') and 'VALIDATE CONSTRAINT' in sql:
+            # Validation should not run in the same transaction with adding
+            # constraint, otherwise its lock is held during the whole scan
+            exit_atomic = True
+
         if re.search('(CREATE|DROP).+INDEX', sql):
             exit_atomic = True
             if 'CONCURRENTLY' not in sql:
@@ -397,16 +2081,42 @@ class ZeroDownTimeMixin(object):
         atomic = self.connection.in_atomic_block
         if exit_atomic and atomic:
             self.atomic.__exit__(None, None, None)
+        if sql.startswith('CREATE UNIQUE INDEX') and not getattr(self, '_unique_prechecked', False):
+            # outside of migration transaction, so locks it holds are not kept during the scan
+            self.check_unique_duplicates(sql)
+        metrics = self.get_metrics()
+        started = monotonic()
+        lock_wait = None
         try:
-            super(ZeroDownTimeMixin, self).execute(sql, params)
+            if self._lock_timeout_guarded(sql):
+                lock_wait = self.execute_with_lock_timeout(sql, params)
+            elif exit_atomic and sql.startswith('CREATE'):
+                with self.index_build_monitor(sql):
+                    super(ZeroDownTimeMixin, self).execute(sql, params)
+            else:
+                super(ZeroDownTimeMixin, self).execute(sql, params)
         except django.db.utils.IntegrityError as exc:
             # create unique index should be treated differently
             # because it raises error, instead of quiet exit
             if not self._create_unique_failed(exc):
                 raise
+        except django.db.utils.NotSupportedError:
+            # postgres can't build index concurrently on partitioned table
+            if not (exit_atomic and sql.startswith('CREATE') and
+                    self.is_partitioned_table(self._unquote(self._index_table_from_sql(sql)))):
+                raise
+            self.create_partitioned_index(sql)
+        finally:
+            self.invalidate_catalog(sql)
+        if metrics.enabled:
+            metrics.emit(StatementEvent(sql, self._table_from_sql(sql), monotonic() - started, lock_wait))
 
-        if exit_atomic and not self.collect_sql:
+        if exit_atomic and not self.collect_sql and 'INDEX' in sql:
+            started = monotonic()
             invalid_index_name = self._check_valid_index(sql)
+            if metrics.enabled and sql.startswith('CREATE'):
+                metrics.emit(IndexValidationEvent(self._index_name_from_sql(sql), self._table_from_sql(sql),
+                                                  invalid_index_name is None, monotonic() - started))
             if invalid_index_name:
                 # index was build, but invalid, we need to delete it
                 self.execute(self.sql_delete_index % {'name': invalid_index_name})
@@ -418,6 +2128,10 @@ class ZeroDownTimeMixin(object):
             self.atomic = transaction.atomic(self.connection.alias)
             self.atomic.__enter__()
 
+        validate_sql = self._validate_constraint_sql(sql)
+        if validate_sql:
+            self.execute(validate_sql)
+
 
 class DatabaseSchemaEditor(ZeroDownTimeMixin, BaseEditor):
     pass
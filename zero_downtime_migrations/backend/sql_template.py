@@ -3,12 +3,21 @@
 from __future__ import unicode_literals
 
 
-SQL_ESTIMATE_COUNT_IN_TABLE = "SELECT reltuples::BIGINT FROM pg_class WHERE relname = '%(table)s';"
+SQL_ESTIMATE_COUNT_BY_PAGES = ("SELECT reltuples::BIGINT, relpages, "
+                               "pg_relation_size(oid) / current_setting('block_size')::INT "
+                               "FROM pg_class WHERE relname = '%(table)s';")
 
-SQL_COUNT_IN_TABLE = "SELECT COUNT(*) FROM %(table)s;"
+SQL_SAMPLE_COUNT_IN_TABLE = "SELECT COUNT(*) FROM %(table)s TABLESAMPLE SYSTEM (%(percent)s);"
 
 SQL_COUNT_IN_TABLE_WITH_NULL = "SELECT COUNT(*) FROM %(table)s WHERE %(column)s is NULL;"
 
+SQL_COUNT_IN_TABLE_WITH_NULL_BY_PK_RANGE = ("SELECT COUNT(*) FROM %(table)s WHERE %(pk_column_name)s > %(start_pk)s "
+                                            "AND %(pk_column_name)s <= %(end_pk)s AND %(column)s is NULL;")
+
+SQL_ESTIMATE_COUNT_IN_TABLE_WITH_NULL = ("SELECT (pg_stats.null_frac * pg_class.reltuples)::BIGINT "
+                                         "FROM pg_stats JOIN pg_class ON pg_class.relname = pg_stats.tablename "
+                                         "WHERE pg_stats.tablename = '%(table)s' AND pg_stats.attname = '%(column)s';")
+
 SQL_UPDATE_BATCH = ("WITH cte AS ( "
                     "SELECT %(pk_column_name)s as pk "
                     "FROM %(table)s "
@@ -29,3 +38,199 @@ SQL_CREATE_UNIQUE_INDEX = "CREATE UNIQUE INDEX CONCURRENTLY %(name)s ON %(table)
 SQL_ADD_UNIQUE_CONSTRAINT_FROM_INDEX = "ALTER TABLE %(table)s ADD CONSTRAINT %(name)s UNIQUE USING INDEX %(index_name)s"
 SQL_CHECK_INDEX_STATUS = ("SELECT 1 FROM pg_class, pg_index WHERE pg_index.indisvalid = false "
                           "AND pg_index.indexrelid = pg_class.oid and pg_class.relname = '%(index_name)s'")
+
+SQL_PK_RANGE = "SELECT MIN(%(pk_column_name)s), MAX(%(pk_column_name)s) FROM %(table)s;"
+
+SQL_UPDATE_BATCH_BY_PK_RANGE = ("UPDATE %(table)s "
+                                "SET %(column)s = %(value)s "
+                                "WHERE %(pk_column_name)s > %(start_pk)s "
+                                "AND %(pk_column_name)s <= %(end_pk)s "
+                                "AND %(column)s is null"
+                                )
+
+# lag of the slowest replica, number of replicas and of those whose position is visible (needs pg_monitor)
+SQL_REPLICATION_LAG = ("SELECT COALESCE(MAX(pg_wal_lsn_diff(pg_current_wal_lsn(), %(lsn_column)s)), 0)::BIGINT, "
+                       "COUNT(*), COUNT(%(lsn_column)s) FROM pg_stat_replication;")
+
+# before postgres 10
+SQL_REPLICATION_LAG_XLOG = ("SELECT COALESCE(MAX(pg_xlog_location_diff(pg_current_xlog_location(), "
+                            "%(lsn_column)s)), 0)::BIGINT, COUNT(*), COUNT(%(lsn_column)s) FROM pg_stat_replication;")
+
+SQL_DEAD_TUPLES = "SELECT n_dead_tup, n_live_tup FROM pg_stat_user_tables WHERE relid = %s::regclass;"
+
+SQL_VACUUM_TABLE = "VACUUM %(table)s;"
+
+SQL_ANALYZE_TABLE = "ANALYZE %(table)s;"
+
+SQL_ANALYZE_COLUMN = "ANALYZE %(table)s (%(column)s);"
+
+SQL_PK_HISTOGRAM_BOUNDS = ("SELECT histogram_bounds::text::bigint[] FROM pg_stats "
+                           "WHERE tablename = '%(table)s' AND attname = '%(pk_column_name)s';")
+
+SQL_CREATE_JOURNAL = ("CREATE TABLE IF NOT EXISTS zero_downtime_migrations_journal ("
+                      "table_name varchar(255) NOT NULL, "
+                      "column_name varchar(255) NOT NULL, "
+                      "done_actions text[] NOT NULL DEFAULT '{}', "
+                      "last_pk bigint NULL, "
+                      "rows_updated bigint NOT NULL DEFAULT 0, "
+                      "batches bigint NOT NULL DEFAULT 0, "
+                      "updated_at timestamp with time zone NOT NULL DEFAULT now(), "
+                      "PRIMARY KEY (table_name, column_name));")
+SQL_GET_JOURNAL_ENTRY = ("SELECT done_actions, last_pk, rows_updated, batches "
+                         "FROM zero_downtime_migrations_journal WHERE table_name = %s AND column_name = %s;")
+SQL_JOURNAL_FINISH_ACTION = ("INSERT INTO zero_downtime_migrations_journal AS journal "
+                             "(table_name, column_name, done_actions) VALUES (%s, %s, ARRAY[%s]) "
+                             "ON CONFLICT (table_name, column_name) DO UPDATE "
+                             "SET done_actions = array_append(journal.done_actions, EXCLUDED.done_actions[1]), "
+                             "updated_at = now();")
+SQL_JOURNAL_RECORD_BATCH = ("INSERT INTO zero_downtime_migrations_journal AS journal "
+                            "(table_name, column_name, last_pk, rows_updated, batches) VALUES (%s, %s, %s, %s, 1) "
+                            "ON CONFLICT (table_name, column_name) DO UPDATE "
+                            "SET last_pk = COALESCE(EXCLUDED.last_pk, journal.last_pk), "
+                            "rows_updated = journal.rows_updated + EXCLUDED.rows_updated, "
+                            "batches = journal.batches + 1, updated_at = now();")
+# primary key ranges of parallel update are saved as "<column>:<start_pk>:<end_pk>" entries
+SQL_JOURNAL_START_RANGE = ("INSERT INTO zero_downtime_migrations_journal (table_name, column_name, last_pk) "
+                           "VALUES (%s, %s, %s) ON CONFLICT (table_name, column_name) DO NOTHING;")
+SQL_GET_JOURNAL_RANGES = ("SELECT column_name, last_pk, rows_updated FROM zero_downtime_migrations_journal "
+                          "WHERE table_name = %s AND left(column_name, char_length(%s) + 1) = %s || ':';")
+SQL_CLEAR_JOURNAL_ENTRY = ("DELETE FROM zero_downtime_migrations_journal WHERE table_name = %s "
+                           "AND (column_name = %s OR left(column_name, char_length(%s) + 1) = %s || ':');")
+
+SQL_SET_LOCK_TIMEOUT = "SELECT set_config('lock_timeout', %s, true);"
+SQL_RESET_LOCK_TIMEOUT = "SET LOCAL lock_timeout TO DEFAULT;"
+SQL_HELD_TABLE_LOCKS = ("SELECT 1 FROM pg_locks WHERE pid = pg_backend_pid() AND locktype = 'relation' "
+                        "AND granted AND mode != 'AccessShareLock' LIMIT 1;")
+
+SQL_CHECK_CONSTRAINT_EXISTS = "SELECT 1 FROM pg_constraint WHERE conname = '%(name)s';"
+SQL_ADD_NOT_NULL_CHECK = "ALTER TABLE %(table)s ADD CONSTRAINT %(name)s CHECK (%(column)s IS NOT NULL) NOT VALID"
+SQL_VALIDATE_CONSTRAINT = "ALTER TABLE %(table)s VALIDATE CONSTRAINT %(name)s"
+SQL_DROP_CONSTRAINT = "ALTER TABLE %(table)s DROP CONSTRAINT %(name)s"
+
+SQL_INDEX_BUILD_PROGRESS = ("SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total, "
+                            "lockers_done, lockers_total, current_locker_pid "
+                            "FROM pg_stat_progress_create_index WHERE pid = %s;")
+
+SQL_CATALOG_SNAPSHOT = ("SELECT c.relname, c.reltuples::BIGINT, c.relpages, "
+                        "pg_relation_size(c.oid) / current_setting('block_size')::INT, "
+                        "(SELECT json_agg(json_build_array(a.attname, "
+                        "CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END, "
+                        "format_type(a.atttypid, NULL), pg_get_expr(d.adbin, d.adrelid))) "
+                        "FROM pg_attribute a LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum "
+                        "WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped), "
+                        "(SELECT json_agg(json_build_array(i.relname, x.indisvalid)) "
+                        "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid WHERE x.indrelid = c.oid) "
+                        "FROM pg_class c WHERE c.relkind IN ('r', 'p') AND pg_table_is_visible(c.oid) "
+                        "AND c.relname = ANY(%s);")
+
+SQL_SELECT_BATCH_FOR_UPDATE = ("SELECT %(pk_column_name)s FROM %(table)s "
+                               "WHERE %(column)s is null LIMIT %(batch_size)s FOR UPDATE;")
+SQL_SELECT_BATCH_BY_PK_RANGE_FOR_UPDATE = ("SELECT %(pk_column_name)s FROM %(table)s "
+                                           "WHERE %(pk_column_name)s > %(start_pk)s "
+                                           "AND %(pk_column_name)s <= %(end_pk)s "
+                                           "AND %(column)s is null FOR UPDATE;")
+# created once for the whole update and truncated before every batch
+SQL_CREATE_BACKFILL_VALUES = ("CREATE TEMPORARY TABLE %(values_table)s AS "
+                              "SELECT %(pk_column_name)s AS pk, %(column)s AS value FROM %(table)s WITH NO DATA;")
+SQL_TRUNCATE_BACKFILL_VALUES = "TRUNCATE %(values_table)s;"
+SQL_COPY_BACKFILL_VALUES = "COPY %(values_table)s (pk, value) FROM STDIN;"
+SQL_DROP_BACKFILL_VALUES = "DROP TABLE IF EXISTS %(values_table)s;"
+SQL_UPDATE_BATCH_FROM_VALUES = ("UPDATE %(table)s table_ "
+                                "SET %(column)s = values_.value "
+                                "FROM %(values_table)s values_ "
+                                "WHERE table_.%(pk_column_name)s = values_.pk "
+                                "AND table_.%(column)s is null")
+
+SQL_UPDATE_EXPRESSION_BY_PK_RANGE = ("UPDATE %(table)s "
+                                     "SET %(set_sql)s "
+                                     "WHERE %(pk_column_name)s > %(start_pk)s "
+                                     "AND %(pk_column_name)s <= %(end_pk)s"
+                                     "%(where_sql)s"
+                                     )
+
+SQL_BLOCKED_BY_BACKEND = ("SELECT blocked.pid, EXTRACT(EPOCH FROM blocked.query_start), blocked.query, "
+                          "EXTRACT(EPOCH FROM now() - blocked.query_start), blocker.query "
+                          "FROM pg_stat_activity blocked JOIN pg_stat_activity blocker ON blocker.pid = %s "
+                          "WHERE %s = ANY(pg_blocking_pids(blocked.pid));")
+
+SQL_TABLE_SIZES = ("SELECT reltuples::BIGINT, pg_relation_size(oid), pg_indexes_size(oid) "
+                   "FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p', 'm');")
+
+SQL_ADD_SHADOW_COLUMN = "ALTER TABLE %(table)s ADD COLUMN %(shadow)s %(type)s NULL;"
+
+SQL_CREATE_SYNC_FUNCTION = ("CREATE OR REPLACE FUNCTION %(function)s() RETURNS trigger AS $$ "
+                            "BEGIN NEW.%(shadow)s := NEW.%(column)s::%(type)s; RETURN NEW; END; "
+                            "$$ LANGUAGE plpgsql;")
+
+SQL_CREATE_SYNC_TRIGGER = ("CREATE TRIGGER %(trigger)s BEFORE INSERT OR UPDATE ON %(table)s "
+                           "FOR EACH ROW EXECUTE PROCEDURE %(function)s();")
+
+# cast which changes no bytes, postgres keeps table as is if type is changed with it
+SQL_BINARY_COERCIBLE = ("SELECT 1 FROM pg_cast WHERE castsource = to_regtype('%(old_type)s') "
+                        "AND casttarget = to_regtype('%(new_type)s') AND castmethod = 'b';")
+
+# fails if some value in primary key range can not be cast to the new type
+SQL_CHECK_CAST_BY_PK_RANGE = ("SELECT 1 FROM %(table)s WHERE %(pk_column_name)s >= %(min_pk)s "
+                              "AND %(pk_column_name)s < %(max_pk)s "
+                              "AND %(column)s::%(type)s IS NULL AND %(column)s IS NOT NULL LIMIT 1;")
+
+# check constraints which depend on the column
+SQL_COLUMN_CHECK_CONSTRAINTS = ("SELECT pg_constraint.conname FROM pg_constraint JOIN pg_attribute "
+                                "ON pg_attribute.attrelid = pg_constraint.conrelid "
+                                "AND pg_attribute.attnum = ANY(pg_constraint.conkey) "
+                                "WHERE pg_constraint.conrelid = '%(table)s'::regclass "
+                                "AND pg_constraint.contype = 'c' AND pg_attribute.attname = '%(column)s';")
+
+SQL_TRIGGER_EXISTS = "SELECT 1 FROM pg_trigger WHERE tgrelid = '%(table)s'::regclass AND tgname = '%(trigger)s';"
+
+SQL_DROP_TRIGGER = "DROP TRIGGER IF EXISTS %(trigger)s ON %(table)s;"
+
+SQL_DROP_FUNCTION = "DROP FUNCTION IF EXISTS %(function)s();"
+
+# no rows if index does not exist, false if it was left invalid by failed concurrent build
+SQL_INDEX_VALIDITY = ("SELECT pg_index.indisvalid FROM pg_class JOIN pg_index ON pg_index.indexrelid = pg_class.oid "
+                      "WHERE pg_class.relname = '%(name)s';")
+
+# indexes which depend on the column (as key, in expression or predicate), except primary key
+SQL_COLUMN_INDEXES = ("SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid), "
+                      "pg_constraint.conname, pg_constraint.contype "
+                      "FROM pg_index JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid "
+                      "LEFT JOIN pg_constraint ON pg_constraint.conindid = pg_index.indexrelid "
+                      "AND pg_constraint.contype IN ('u', 'x') "
+                      "WHERE pg_index.indrelid = '%(table)s'::regclass AND NOT pg_index.indisprimary "
+                      "AND EXISTS (SELECT 1 FROM pg_depend JOIN pg_attribute "
+                      "ON pg_attribute.attrelid = pg_depend.refobjid AND pg_attribute.attnum = pg_depend.refobjsubid "
+                      "WHERE pg_depend.classid = 'pg_class'::regclass AND pg_depend.objid = pg_index.indexrelid "
+                      "AND pg_depend.refobjid = pg_index.indrelid AND pg_attribute.attname = '%(column)s') "
+                      "ORDER BY index_class.relname;")
+
+SQL_ADD_CHECK_NOT_VALID = "ALTER TABLE %(table)s ADD CONSTRAINT %(name)s CHECK (%(check)s) NOT VALID"
+
+SQL_LOCK_TABLE = "LOCK TABLE %(table)s IN ACCESS EXCLUSIVE MODE;"
+
+# blocks writes, but not reads
+SQL_LOCK_TABLE_FOR_WRITES = "LOCK TABLE %(table)s IN SHARE ROW EXCLUSIVE MODE;"
+
+SQL_DROP_COLUMN = "ALTER TABLE %(table)s DROP COLUMN %(column)s;"
+
+SQL_RENAME_COLUMN = "ALTER TABLE %(table)s RENAME COLUMN %(old_column)s TO %(new_column)s;"
+
+SQL_RENAME_INDEX = "ALTER INDEX %(old_name)s RENAME TO %(new_name)s;"
+
+SQL_RENAME_CONSTRAINT = "ALTER TABLE %(table)s RENAME CONSTRAINT %(old_name)s TO %(new_name)s;"
+
+SQL_SAMPLE_DUPLICATES = ("SELECT %(columns)s, COUNT(*) FROM %(table)s TABLESAMPLE SYSTEM (%(percent)s) "
+                         "WHERE ROW(%(columns)s) IS NOT NULL%(predicate)s "
+                         "GROUP BY %(columns)s HAVING COUNT(*) > 1 LIMIT %(limit)s;")
+
+SQL_FIND_DUPLICATES = ("SELECT %(columns)s, COUNT(*) FROM %(table)s "
+                       "WHERE ROW(%(columns)s) IS NOT NULL%(predicate)s "
+                       "GROUP BY %(columns)s HAVING COUNT(*) > 1 LIMIT %(limit)s;")
+
+SQL_TABLE_IS_PARTITIONED = "SELECT 1 FROM pg_class WHERE oid = to_regclass('%(table)s') AND relkind = 'p';"
+
+SQL_PARTITIONS = ("SELECT partition.relname FROM pg_inherits "
+                  "JOIN pg_class partition ON partition.oid = pg_inherits.inhrelid "
+                  "WHERE pg_inherits.inhparent = to_regclass('%(table)s') ORDER BY partition.relname;")
+
+SQL_ATTACH_INDEX_PARTITION = "ALTER INDEX %(index_name)s ATTACH PARTITION %(partition_index_name)s;"
@@ -0,0 +1,173 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import random
+import time
+import threading
+
+from django.db import connections
+
+from zero_downtime_migrations.backend.exceptions import ReplicationLagError
+from zero_downtime_migrations.backend.sql_template import (
+    SQL_REPLICATION_LAG,
+    SQL_REPLICATION_LAG_XLOG,
+    SQL_DEAD_TUPLES,
+    SQL_VACUUM_TABLE,
+)
+
+# pg_stat_replication columns were named *_location before postgres 10
+XLOG_LSN_COLUMNS = {
+    'replay_lsn': 'replay_location',
+    'flush_lsn': 'flush_location',
+    'write_lsn': 'write_location',
+    'sent_lsn': 'sent_location',
+}
+
+
+def replication_lag_bytes(connection, lsn_column='replay_lsn'):
+    """
+    Default lag probe: how many bytes of WAL the slowest streaming
+    replica is behind, by replay_lsn (or flush_lsn) in pg_stat_replication.
+    Positions of replicas are hidden from roles without pg_monitor, lag
+    can't be measured then and ReplicationLagError is raised
+    """
+    if connection.pg_version < 100000:
+        sql = SQL_REPLICATION_LAG_XLOG % {'lsn_column': XLOG_LSN_COLUMNS.get(lsn_column, lsn_column)}
+    else:
+        sql = SQL_REPLICATION_LAG % {'lsn_column': lsn_column}
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        lag, replicas, visible = cursor.fetchone()
+    if replicas and not visible:
+        raise ReplicationLagError(
+            'Positions of {} replicas in pg_stat_replication are not visible, grant pg_monitor role '
+            'to migration user or set ZERO_DOWNTIME_MIGRATIONS_REPLICATION_LAG_PROBE'.format(replicas)
+        )
+    if visible < replicas:
+        print('Positions of {} of {} replicas are unknown, lag is measured by the rest'.format(
+            replicas - visible, replicas,
+        ))
+    return lag
+
+
+def dead_tuples(connection, table):
+    """
+    (n_dead_tup, n_live_tup) of `table` from pg_stat_user_tables,
+    statistics are updated by the server with a small delay
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_DEAD_TUPLES, [connection.ops.quote_name(table)])
+        row = cursor.fetchone()
+    return tuple(row) if row is not None else (0, 0)
+
+
+def vacuum_table(alias, table):
+    """
+    VACUUM `table` from a side connection, so it runs outside of
+    transaction and without timeouts set on the migration connection
+    """
+    errors = []
+
+    def run():
+        # connections are thread local so this is a separate connection
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(SQL_VACUUM_TABLE % {'table': connection.ops.quote_name(table)})
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def exponential_backoff(attempt, base, maximum):
+    """
+    Delay before retry number `attempt` (starting from 1): doubles with
+    every attempt up to `maximum`, randomly cut by up to half so retries
+    from several clients do not line up
+    """
+    delay = min(maximum, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class Throttle(object):
+    """
+    Called between batches, may block until it is safe to continue
+    """
+    def wait(self):
+        pass
+
+
+class ReplicationLagThrottle(Throttle):
+    """
+    Pause while `probe()` returns lag over `max_lag`, checking
+    every `check_interval` seconds, and give up with ReplicationLagError
+    after `max_wait` seconds of waiting (never if it is None)
+    """
+    def __init__(self, probe, max_lag, check_interval=1.0, max_wait=None, sleep=time.sleep):
+        self.probe = probe
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.max_wait = max_wait
+        self.sleep = sleep
+
+    def wait(self):
+        waited = 0
+        lag = self.probe()
+        while lag > self.max_lag:
+            if self.max_wait is not None and waited >= self.max_wait:
+                raise ReplicationLagError(
+                    'Replication lag {} is still over {} after {} seconds'.format(lag, self.max_lag, waited)
+                )
+            print('Replication lag {} is over {}, waiting'.format(lag, self.max_lag))
+            self.sleep(self.check_interval)
+            waited += self.check_interval
+            lag = self.probe()
+        return waited
+
+
+class DeadTuplesThrottle(Throttle):
+    """
+    Pause while `probe()` returns (dead, live) tuples with dead to live
+    ratio over `max_ratio`, so table does not bloat faster than vacuum
+    cleans it. If `vacuum` is given it is called once before waiting,
+    otherwise autovacuum is waited for. Update continues anyway after
+    `max_wait` seconds of waiting (never if it is None)
+    """
+    def __init__(self, probe, max_ratio, vacuum=None, check_interval=5.0, max_wait=None, sleep=time.sleep):
+        self.probe = probe
+        self.max_ratio = max_ratio
+        self.vacuum = vacuum
+        self.check_interval = check_interval
+        self.max_wait = max_wait
+        self.sleep = sleep
+
+    def ratio(self):
+        dead, live = self.probe()
+        return dead / float(max(live, 1))
+
+    def wait(self):
+        waited = 0
+        ratio = self.ratio()
+        if ratio > self.max_ratio and self.vacuum is not None:
+            print('Dead tuples ratio {:.2f} is over {}, vacuuming'.format(ratio, self.max_ratio))
+            self.vacuum()
+            ratio = self.ratio()
+        while ratio > self.max_ratio:
+            if self.max_wait is not None and waited >= self.max_wait:
+                print('Dead tuples ratio {:.2f} is still over {} after {} seconds, continuing'.format(
+                    ratio, self.max_ratio, waited,
+                ))
+                break
+            print('Dead tuples ratio {:.2f} is over {}, waiting for vacuum'.format(ratio, self.max_ratio))
+            self.sleep(self.check_interval)
+            waited += self.check_interval
+            ratio = self.ratio()
+        return waited
@@ -0,0 +1,131 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+import json
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import AmbiguityError
+
+from zero_downtime_migrations.backend.cost import RISKS, CostModel, estimate
+
+MB = 1024 ** 2
+
+
+def _format_bytes(value):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(value) < 1024:
+            return '{:.1f} {}'.format(value, unit)
+        value /= 1024.0
+    return '{:.1f} TB'.format(value)
+
+
+class Command(BaseCommand):
+    help = ('Estimates cost of the named migration from its sqlmigrate plan and current table sizes: '
+            'locks, scans and rewrites, batches, duration, WAL volume and worst case write blocking lock window.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', help='App label of the application containing the migration.')
+        parser.add_argument('migration_name', help='Migration name to estimate.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database to build plan for and take table sizes from.')
+        parser.add_argument('--backwards', action='store_true', help='Estimate unapplying the migration.')
+        parser.add_argument('--format', choices=('text', 'json'), default='text')
+        parser.add_argument('--max-lock-window', type=float, default=1.0,
+                            help='Seconds writes may be blocked for before operation is high risk '
+                                 '(medium risk from tenth of it).')
+        parser.add_argument('--fail-on', choices=RISKS[1:],
+                            help='Exit with error if any operation has this or higher risk.')
+        parser.add_argument('--scan-rate', type=float, default=100, help='Sequential scan speed, MB/s.')
+        parser.add_argument('--write-rate', type=float, default=50, help='Table rewrite speed, MB/s.')
+        parser.add_argument('--index-rate', type=float, default=30, help='Index build speed, MB/s.')
+        parser.add_argument('--update-rate', type=float, default=10000, help='Batched update speed, rows/s.')
+        parser.add_argument('--batch-size', type=int, help='Rows in batch, chosen as schema editor does if not set.')
+        parser.add_argument('--lock-wait', type=float, default=0.0,
+                            help='Seconds statement may wait for its lock (lock_timeout).')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        executor = MigrationExecutor(connection)
+        app_label, migration_name = options['app_label'], options['migration_name']
+        try:
+            apps.get_app_config(app_label)
+        except LookupError as err:
+            raise CommandError(str(err))
+        if app_label not in executor.loader.migrated_apps:
+            raise CommandError("App '%s' does not have migrations" % app_label)
+        try:
+            migration = executor.loader.get_migration_by_prefix(app_label, migration_name)
+        except AmbiguityError:
+            raise CommandError("More than one migration matches '%s' in app '%s'. Please be more specific." % (
+                migration_name, app_label))
+        except KeyError:
+            raise CommandError("Cannot find a migration matching '%s' from app '%s'. Is it in INSTALLED_APPS?" % (
+                migration_name, app_label))
+
+        plan = [(executor.loader.graph.nodes[(app_label, migration.name)], options['backwards'])]
+        statements = executor.collect_sql(plan)
+        model = CostModel(
+            scan_bytes=options['scan_rate'] * MB,
+            write_bytes=options['write_rate'] * MB,
+            index_bytes=options['index_rate'] * MB,
+            update_rows=options['update_rate'],
+            batch_size=options['batch_size'],
+            lock_wait=options['lock_wait'],
+        )
+        operations = estimate(connection, statements, model, max_lock_window=options['max_lock_window'])
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps([self.operation_json(operation) for operation in operations], indent=2))
+        else:
+            for operation in operations:
+                self.write_operation(operation)
+
+        fail_on = options['fail_on']
+        if fail_on:
+            risky = [operation for operation in operations
+                     if RISKS.index(operation.risk) >= RISKS.index(fail_on)]
+            if risky:
+                raise CommandError('{} operation(s) of {}.{} have {} or higher risk: {}'.format(
+                    len(risky), app_label, migration.name, fail_on,
+                    ', '.join(operation.description for operation in risky),
+                ))
+
+    def operation_json(self, operation):
+        return {
+            'operation': operation.description,
+            'risk': operation.risk,
+            'batches': operation.batches,
+            'duration': operation.duration,
+            'wal_bytes': operation.wal_bytes,
+            'lock_window': operation.lock_window,
+            'statements': [{
+                'sql': cost.plan.sql,
+                'table': cost.plan.table,
+                'lock': cost.plan.lock,
+                'scan': cost.plan.scan,
+                'rewrite': cost.plan.rewrite,
+                'batched': cost.plan.batched,
+                'rows': cost.rows,
+                'batches': cost.batches,
+                'duration': cost.duration,
+                'wal_bytes': cost.wal_bytes,
+                'lock_window': cost.lock_window,
+            } for cost in operation.statements],
+        }
+
+    def write_operation(self, operation):
+        self.stdout.write('{} [{} risk]'.format(operation.description or 'Migration', operation.risk))
+        self.stdout.write('  batches: {}, duration: {:.1f}s, WAL: {}, writes blocked for up to {:.1f}s'.format(
+            operation.batches, operation.duration, _format_bytes(operation.wal_bytes), operation.lock_window,
+        ))
+        for cost in operation.statements:
+            action = ('rewrite' if cost.plan.rewrite else
+                      'batches' if cost.plan.batched else
+                      'scan' if cost.plan.scan else '-')
+            self.stdout.write('    {:<24} {:<8} {:>8.1f}s  {}'.format(
+                cost.plan.lock, action, cost.duration, cost.plan.sql,
+            ))
@@ -0,0 +1,78 @@
+# coding: utf-8
+
+from __future__ import unicode_literals
+
+from django.db.migrations.operations.base import Operation
+
+
+class BatchedUpdate(Operation):
+    """
+    Data migration running UPDATE ... SET `set_sql` [WHERE `where_sql`]
+    by primary key ranges with zero downtime schema editor, so the table
+    is never locked or rewritten at once. `set_sql` and `where_sql` are
+    raw sql, `params` are substituted for their %s placeholders.
+    `reverse_set_sql` (and `reverse_where_sql`) make it reversible
+    """
+    # sqlmigrate shows one representative batch
+    reduces_to_sql = True
+    atomic = False
+
+    def __init__(self, model_name, set_sql, where_sql=None, params=None,
+                 reverse_set_sql=None, reverse_where_sql=None, reverse_params=None,
+                 name=None, hints=None, elidable=False):
+        self.model_name = model_name
+        self.set_sql = set_sql
+        self.where_sql = where_sql
+        self.params = params
+        self.reverse_set_sql = reverse_set_sql
+        self.reverse_where_sql = reverse_where_sql
+        self.reverse_params = reverse_params
+        self.name = name
+        self.hints = hints or {}
+        self.elidable = elidable
+
+    def deconstruct(self):
+        kwargs = {
+            'model_name': self.model_name,
+            'set_sql': self.set_sql,
+        }
+        for key in ('where_sql', 'params', 'reverse_set_sql', 'reverse_where_sql', 'reverse_params', 'name'):
+            if getattr(self, key) is not None:
+                kwargs[key] = getattr(self, key)
+        if self.hints:
+            kwargs['hints'] = self.hints
+        if self.elidable:
+            kwargs['elidable'] = self.elidable
+        return (self.__class__.__name__, [], kwargs)
+
+    @property
+    def reversible(self):
+        return self.reverse_set_sql is not None
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        self._run(app_label, schema_editor, from_state, self.set_sql, self.where_sql, self.params, self.name)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if self.reverse_set_sql is None:
+            raise NotImplementedError('You cannot reverse this operation')
+        self._run(app_label, schema_editor, from_state, self.reverse_set_sql, self.reverse_where_sql,
+                  self.reverse_params, self.name and '{}_reverse'.format(self.name))
+
+    def _run(self, app_label, schema_editor, state, set_sql, where_sql, params, name):
+        model = state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if not hasattr(schema_editor, 'batched_update'):
+            # not zero downtime backend, run update at once
+            sql = 'UPDATE {} SET {}'.format(schema_editor.quote_name(model._meta.db_table), set_sql)
+            if where_sql:
+                sql += ' WHERE {}'.format(where_sql)
+            schema_editor.execute(sql, params)
+            return
+        schema_editor.batched_update(model, set_sql, where_sql=where_sql, params=params, name=name)
+
+    def describe(self):
+        return 'Batched update of {}: SET {}'.format(self.model_name, self.set_sql)